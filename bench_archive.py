@@ -0,0 +1,104 @@
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import triage_archive
+import triage_db
+import triage_journal
+
+# Benchmark: archiving idle sessions out of chat_memory. Builds a database the
+# way an existing deployment has it (auto_vacuum off) with --sessions sessions,
+# --old-share of them idle for longer than TRIAGE_ARCHIVE_AFTER_DAYS, then runs
+# archive_sessions and compact (which converts the file with one VACUUM). Reports
+# database size and get_memory latency before and after, the read-through
+# latency for archived sessions, and checks that every archived session reads
+# back exactly as it was.
+
+TEXT = "I have had a dull ache in my lower back for a few days, worse in the morning and after sitting for long. "
+
+
+def populate(db_name, sessions, old_share, rng):
+    conn = sqlite3.connect(db_name)
+    conn.execute("PRAGMA auto_vacuum=NONE")  # As files created before triage_db enabled incremental vacuum
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.close()
+    triage_db.init_db(db_name)
+
+    now, rows, history = time.time(), [], {}
+    for n in range(sessions):
+        idle_days = rng.uniform(31, 400) if rng.random() < old_share else rng.uniform(0, 5)
+        turns = [(f"{TEXT}({n}.{t})", f"Question {t} for session {n}?") for t in range(rng.randint(4, 10))]
+        history[(f"p{n}", f"s{n}")] = turns
+        started = now - idle_days * 86400
+        rows += [(f"p{n}", f"s{n}", u, a, None, started + t * 60) for t, (u, a) in enumerate(turns)]
+    rows.sort(key=lambda row: row[5])  # Sessions interleave in chat_memory as they do in production
+
+    def load(conn):
+        conn.executemany(triage_db.INSERT_TURN_SQL, rows)
+        conn.execute("""
+            INSERT INTO session_turns (patient_id, session_id, turns, updated_at)
+            SELECT patient_id, session_id, COUNT(*), MAX(created_at) FROM chat_memory GROUP BY patient_id, session_id
+        """)
+
+    triage_db.run_write(load, db_name)
+    triage_db.get_connection(db_name).execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return len(rows), history
+
+
+def median_us(fn, keys):
+    samples = []
+    for key in keys:
+        started = time.perf_counter()
+        fn(*key)
+        samples.append((time.perf_counter() - started) * 1e6)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure archiving idle sessions to cold storage.")
+    parser.add_argument("--sessions", type=int, default=50_000)
+    parser.add_argument("--old-share", type=float, default=0.9)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "archive.db")
+        triage_db.DB_NAME = db_name  # The read-through in triage_journal uses the default database
+        rows, history = populate(db_name, args.sessions, args.old_share, rng)
+        print(f"{rows} turns in {args.sessions} sessions, {args.old_share:.0%} idle for over {triage_archive.ARCHIVE_AFTER_DAYS:.0f} days\n")
+
+        conn = triage_db.get_connection(db_name)
+        recent = {key for key in conn.execute(
+            "SELECT patient_id, session_id FROM session_turns WHERE updated_at >= ?",
+            (time.time() - triage_archive.ARCHIVE_AFTER_DAYS * 86400,))}
+        hot_keys = rng.choices(sorted(recent), k=args.lookups)
+        old_keys = rng.choices(sorted(set(history) - recent), k=args.lookups)
+
+        triage_archive._print_report("before", triage_archive.storage_report(db_name))
+        print(f"get_memory p50: recent {median_us(triage_db.get_memory, hot_keys):.1f} us, "
+              f"idle {median_us(triage_db.get_memory, old_keys):.1f} us\n")
+
+        started = time.perf_counter()
+        sessions, turns = triage_archive.archive_sessions(db_name=db_name)
+        archived_in = time.perf_counter() - started
+        started = time.perf_counter()
+        released = triage_archive.compact(db_name)
+        print(f"archived {sessions} sessions ({turns} turns) in {archived_in:.2f} s; "
+              f"compacted in {time.perf_counter() - started:.2f} s, {released} pages released\n")
+
+        triage_archive._print_report("after", triage_archive.storage_report(db_name))
+        print(f"get_memory p50: recent {median_us(triage_journal.get_memory, hot_keys):.1f} us, "
+              f"archived (read-through) {median_us(triage_journal.get_memory, old_keys):.1f} us")
+
+        mismatches = sum(triage_journal.get_memory(*key) != history[key] for key in history)
+        print(f"sessions whose history differs after archiving: {mismatches} of {len(history)}")
+        triage_db.close_connections()
+
+
+if __name__ == "__main__":
+    main()
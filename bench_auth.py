@@ -0,0 +1,96 @@
+import argparse
+import hashlib
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from triage_auth import Authenticator, add_client, load_credentials
+from triage_router import percentile
+
+# Auth overhead per request: the verify_credentials the servers used before
+# (four SHA-256 digests, two of them of the constant expected values, compared
+# with ==), against triage_auth for the environment client, credentials-file
+# clients with a warm LRU and bearer tokens. The cold rows are the PBKDF2 check a
+# client pays once per TRIAGE_AUTH_CACHE_TTL; a wrong password always pays it.
+# Finally the whole dependency through a FastAPI app, to compare with request cost.
+
+USERNAME, PASSWORD = "triage-bot", "correct horse battery staple"
+
+
+def previous_verify(username, password):
+    correct_username = hashlib.sha256(username.encode()).hexdigest() == hashlib.sha256(USERNAME.encode()).hexdigest()
+    correct_password = hashlib.sha256(password.encode()).hexdigest() == hashlib.sha256(PASSWORD.encode()).hexdigest()
+    return correct_username and correct_password
+
+
+def measure(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def report(label, samples):
+    print(f"{label:<40} p50 {statistics.median(samples) * 1e6:9.1f} us   p99 {percentile(samples, 99) * 1e6:9.1f} us")
+
+
+def http_overhead(authenticator, secret, repeat):
+    from fastapi import Depends, FastAPI
+    from fastapi.testclient import TestClient
+
+    import triage_auth
+
+    triage_auth._authenticator = authenticator
+    app = FastAPI()
+
+    @app.get("/open")
+    def open_endpoint():
+        return {}
+
+    @app.get("/closed")
+    def closed_endpoint(username: str = Depends(triage_auth.verify_credentials)):
+        return {}
+
+    client = TestClient(app)
+    client.get("/closed", auth=("clinic", secret))  # Warm the LRU
+    report("HTTP request, no auth", measure(lambda: client.get("/open"), repeat))
+    report("HTTP request, Basic auth (file, cached)", measure(lambda: client.get("/closed", auth=("clinic", secret)), repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure authentication overhead per request.")
+    parser.add_argument("--repeat", type=int, default=20000)
+    parser.add_argument("--cold", type=int, default=20, help="PBKDF2 verifications measured")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "credentials.json")
+        secret = add_client(path, "clinic")
+        token = add_client(path, "telegram-bot", token=True)
+        for n in range(50):  # More clients do not change the cost: they are looked up by name
+            add_client(path, f"client-{n}")
+        with open(path, encoding="utf-8") as f:
+            print(f"credentials file: {len(json.load(f)['clients'])} clients\n")
+        clients = load_credentials(path)
+
+    authenticator = Authenticator(USERNAME, PASSWORD, clients)
+    report("previous verify_credentials", measure(lambda: previous_verify(USERNAME, PASSWORD), args.repeat))
+    report("environment client", measure(lambda: authenticator.verify_basic(USERNAME, PASSWORD), args.repeat))
+    authenticator.verify_basic("clinic", secret)
+    authenticator.verify_token(token)
+    report("file client, cached", measure(lambda: authenticator.verify_basic("clinic", secret), args.repeat))
+    report("bearer token, cached", measure(lambda: authenticator.verify_token(token), args.repeat))
+    report("wrong username", measure(lambda: authenticator.verify_basic("nobody", secret), args.repeat))
+    cold = Authenticator(clients=clients, cache_size=1)
+    report("file client, cold (PBKDF2)", measure(lambda: (cold._verified.clear(), cold.verify_basic("clinic", secret)), args.cold))
+    report("wrong password (PBKDF2, never cached)", measure(lambda: authenticator.verify_basic("clinic", "guess"), args.cold))
+    print()
+    http_overhead(authenticator, secret, min(args.repeat, 2000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import argparse
+import asyncio
+import statistics
+import time
+
+from stub_llm_server import start_stub_server
+from triage_backends import VLLMBackend
+from triage_batching import BatchingBackend
+from triage_router import percentile
+
+# Micro-batching check against a stub vLLM server that runs one generation at a
+# time (--serialize) and charges a little extra per prompt in a batch. Reports
+# throughput and p50/p99 latency for each max batch size and window.
+
+
+async def run(backend, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(n):
+        async with semaphore:
+            started = time.perf_counter()
+            await backend.agenerate(f"Patient {n}: I have back pain", max_tokens=50)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(n) for n in range(requests)))
+    return latencies, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure throughput and latency of the micro-batching scheduler.")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--delay", type=float, default=0.1, help="stub seconds per generation")
+    parser.add_argument("--batch-cost", type=float, default=0.005, help="stub seconds per extra prompt in a batch")
+    parser.add_argument("--sizes", default="1,4,8,16,32")
+    parser.add_argument("--windows", default="5,20,50", help="batch windows in ms")
+    args = parser.parse_args()
+
+    server, url = start_stub_server(delay=args.delay, batch_cost=args.batch_cost, serialize=True)
+    print(f"{'max batch':>9} {'window':>7} {'turns/s':>8} {'p50 ms':>7} {'p99 ms':>7} {'mean batch':>10}")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        for window in [float(w) for w in args.windows.split(",")]:
+            backend = BatchingBackend(VLLMBackend(url=f"{url}/v1/completions", retries=0), max_batch_size=size,
+                                      window_ms=window)
+            latencies, elapsed = asyncio.run(run(backend, args.requests, args.concurrency))
+            stats = backend.stats()
+            backend.close()
+            print(f"{size:>9} {window:>5.0f}ms {args.requests / elapsed:>8.1f} {statistics.median(latencies) * 1000:>7.0f} "
+                  f"{percentile(latencies, 99) * 1000:>7.0f} {stats['mean_batch_size']:>10.1f}")
+            if size == 1:
+                break  # The window makes no difference without batching
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
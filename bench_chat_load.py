@@ -0,0 +1,59 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+# Load test: N concurrent patient sessions against /chat (sync, threadpool bound)
+# and /chat/async, with a stub Ollama that takes --delay seconds per generation.
+# Runs the FastAPI app in-process through httpx's ASGI transport.
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["TRIAGE_DB_NAME"] = os.path.join(_tmp.name, "load.db")
+os.environ.setdefault("TRIAGE_CHATBOT_USERNAME", "load")
+os.environ.setdefault("TRIAGE_CHATBOT_PASSWORD", "test")
+
+import httpx  # noqa: E402
+
+import triageAI  # noqa: E402
+from stub_llm_server import start_stub_server  # noqa: E402
+from triage_backends import OllamaBackend, aclose_backends, set_backend  # noqa: E402
+
+
+async def run_sessions(client, path, sessions):
+    auth = (os.environ["TRIAGE_CHATBOT_USERNAME"], os.environ["TRIAGE_CHATBOT_PASSWORD"])
+
+    async def one(n):
+        payload = {"patient_id": f"p{n}", "session_id": f"s{n}", "user_input": "my lower back hurts"}
+        response = await client.post(path, json=payload, auth=auth)
+        return response.status_code
+
+    start = time.perf_counter()
+    statuses = await asyncio.gather(*(one(n) for n in range(sessions)))
+    elapsed = time.perf_counter() - start
+    return elapsed, sum(1 for s in statuses if s == 200)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Compare concurrency scaling of /chat and /chat/async.")
+    parser.add_argument("--delay", type=float, default=1.0, help="stub generation time in seconds")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50, 100, 200])
+    args = parser.parse_args()
+
+    server, url = start_stub_server(args.delay)
+    set_backend("ollama", OllamaBackend(url=f"{url}/api/generate"))
+    triageAI.init_db()
+
+    transport = httpx.ASGITransport(app=triageAI.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://triage", timeout=None) as client:
+        for sessions in args.concurrency:
+            for path in ("/chat", "/chat/async"):
+                elapsed, ok = await run_sessions(client, path, sessions)
+                print(f"{path:<12} sessions={sessions:<4} wall={elapsed:6.2f}s  ok={ok:<4} "
+                      f"throughput={ok / elapsed:7.1f} turns/s")
+    await aclose_backends()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
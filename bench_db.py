@@ -0,0 +1,86 @@
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import triage_db
+
+# Benchmark: chat turns per second (one get_memory + one save_memory per turn)
+# with a fresh connection per call versus the pooled triage_db layer.
+
+
+def legacy_save_memory(db_name, patient_id, session_id, user_input, ai_response):
+    conn = sqlite3.connect(db_name)
+    try:
+        conn.execute(triage_db.INSERT_MEMORY_SQL, (patient_id, session_id, user_input, ai_response))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def legacy_get_memory(db_name, patient_id, session_id):
+    conn = sqlite3.connect(db_name)
+    try:
+        return conn.execute(triage_db.SELECT_MEMORY_SQL, (patient_id, session_id)).fetchall()
+    finally:
+        conn.close()
+
+
+def legacy_turn(db_name, patient_id, session_id, n):
+    legacy_get_memory(db_name, patient_id, session_id)
+    legacy_save_memory(db_name, patient_id, session_id, f"answer {n}", f"question {n}")
+
+
+def pooled_turn(db_name, patient_id, session_id, n):
+    triage_db.get_memory(patient_id, session_id, db_name=db_name)
+    triage_db.save_memory(patient_id, session_id, f"answer {n}", f"question {n}", db_name=db_name)
+
+
+def run(turn, db_name, threads, turns_per_thread):
+    errors = []
+
+    def worker(t):
+        for n in range(turns_per_thread):
+            try:
+                turn(db_name, f"patient-{t}", f"session-{t}", n)
+            except sqlite3.Error as e:
+                errors.append(e)
+
+    workers = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    return threads * turns_per_thread / elapsed, len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-call SQLite connections with the pooled triage_db layer.")
+    parser.add_argument("--turns", type=int, default=500, help="turns per thread")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for threads in args.threads:
+            legacy_db = os.path.join(tmp, f"legacy-{threads}.db")
+            pooled_db = os.path.join(tmp, f"pooled-{threads}.db")
+
+            # The legacy path runs on the default rollback journal, like the original servers.
+            conn = sqlite3.connect(legacy_db)
+            conn.execute("CREATE TABLE chat_memory (id INTEGER PRIMARY KEY AUTOINCREMENT, patient_id TEXT, session_id TEXT, user_input TEXT, ai_response TEXT)")
+            conn.close()
+            triage_db.init_db(pooled_db)
+
+            legacy_tps, legacy_errors = run(legacy_turn, legacy_db, threads, args.turns)
+            pooled_tps, pooled_errors = run(pooled_turn, pooled_db, threads, args.turns)
+            print(f"threads={threads:<3} legacy: {legacy_tps:8.0f} turns/s ({legacy_errors} errors)   "
+                  f"pooled: {pooled_tps:8.0f} turns/s ({pooled_errors} errors)   x{pooled_tps / legacy_tps:.1f}")
+        triage_db.close_connections()
+
+
+if __name__ == "__main__":
+    main()
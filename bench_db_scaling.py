@@ -0,0 +1,73 @@
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import triage_db
+
+# Benchmark: get_memory lookup time as chat_memory grows, with and without the
+# (patient_id, session_id, id) index added by schema migration 2.
+# The default sizes run in about a minute; pass --sizes ... 10000000 for the full 10M-row run.
+
+TURNS_PER_SESSION = 8
+BATCH = 50_000
+
+
+def populate(db_name, rows):
+    conn = sqlite3.connect(db_name)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("CREATE TABLE chat_memory (id INTEGER PRIMARY KEY AUTOINCREMENT, patient_id TEXT, session_id TEXT, user_input TEXT, ai_response TEXT)")
+    conn.execute("PRAGMA user_version=1")  # Schema as it was before the lookup index
+    sessions = max(1, rows // TURNS_PER_SESSION)
+    for start in range(0, rows, BATCH):
+        batch = [
+            (f"p{n % sessions}", f"s{n % sessions}", f"answer {n}", f"question {n}")
+            for n in range(start, min(rows, start + BATCH))
+        ]
+        conn.executemany(triage_db.INSERT_MEMORY_SQL, batch)
+        conn.commit()
+    conn.close()
+    return sessions
+
+
+def time_lookups(db_name, sessions, lookups):
+    rng = random.Random(42)
+    samples = []
+    for _ in range(lookups):
+        n = rng.randrange(sessions)
+        start = time.perf_counter()
+        triage_db.get_memory(f"p{n}", f"s{n}", db_name=db_name)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure get_memory latency against chat_memory size.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--skip-unindexed-above", type=int, default=1_000_000,
+                        help="full scans get slow; skip the unindexed run for larger tables")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.sizes:
+            db_name = os.path.join(tmp, f"scale-{rows}.db")
+            sessions = populate(db_name, rows)
+
+            unindexed = "skipped"
+            if rows <= args.skip_unindexed_above:
+                unindexed = f"{time_lookups(db_name, sessions, min(args.lookups, 50)):.3f} ms"
+
+            triage_db.init_db(db_name)  # Applies the index migration
+            indexed = time_lookups(db_name, sessions, args.lookups)
+            print(f"rows={rows:<10} schema v{triage_db.get_schema_version(db_name)}  "
+                  f"median lookup without index: {unindexed:<12} with index: {indexed:.3f} ms")
+            triage_db.close_connections()
+
+
+if __name__ == "__main__":
+    main()
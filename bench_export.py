@@ -0,0 +1,114 @@
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import triage_analytics
+import triage_db
+import triage_export
+
+# Benchmark: exporting chat_memory and reading dashboard counters. Stores
+# --sessions sessions over --days days through insert_turn (so the counters are
+# maintained as in production), then:
+#   - exports the last 7 days and the whole table as NDJSON, with rows/s and
+#     the peak Python memory of the export (measured in a second, traced run)
+#   - times one page deep in the table with keyset pagination and with OFFSET
+#   - times analytics_summary against computing the same numbers from chat_memory,
+#     and checks that the two agree
+
+RAW_DAYS_SQL = """
+    SELECT day, SUM(sessions), SUM(turns) FROM (
+        SELECT date(MIN(created_at), 'unixepoch') AS day, 1 AS sessions, 0 AS turns FROM chat_memory GROUP BY patient_id, session_id
+        UNION ALL
+        SELECT date(created_at, 'unixepoch'), 0, 1 FROM chat_memory
+    ) GROUP BY day ORDER BY day
+"""
+RAW_LENGTHS_SQL = "SELECT turns, COUNT(*) FROM (SELECT COUNT(*) AS turns FROM chat_memory GROUP BY patient_id, session_id) GROUP BY turns"
+OFFSET_PAGE_SQL = "SELECT id, patient_id, session_id, user_input, ai_response, created_at FROM chat_memory ORDER BY id LIMIT ? OFFSET ?"
+
+
+def populate(db_name, sessions, days, rng):
+    now = time.time()
+    rows = []
+    for n in range(sessions):
+        started = now - rng.uniform(0, days * 86400)
+        for t in range(rng.randint(1, 8)):
+            rows.append((started + t * 90, f"p{n}", f"s{n}", f"symptom description {t} for session {n}", f"follow-up question {t}?"))
+    rows.sort()
+
+    def load(conn):
+        for created_at, patient_id, session_id, user_input, ai_response in rows:
+            triage_db.insert_turn(conn, patient_id, session_id, user_input, ai_response, created_at=created_at)
+
+    started = time.perf_counter()
+    triage_db.run_write(load, db_name)
+    return len(rows), time.perf_counter() - started
+
+
+def timed_export(since, db_name, trace=False):
+    """(rows, characters, seconds, peak traced bytes). Tracing slows the export, so it is timed without."""
+    if trace:
+        tracemalloc.start()
+    started, rows, written = time.perf_counter(), 0, 0
+    for chunk in triage_export.export_chunks("ndjson", triage_export.iter_pages(since, db_name=db_name)):
+        rows += chunk.count("\n")
+        written += len(chunk)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] if trace else 0
+    tracemalloc.stop()
+    return rows, written, elapsed, peak
+
+
+def median_ms(fn, runs=20):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time bulk exports and dashboard counters.")
+    parser.add_argument("--sessions", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=60)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "export.db")
+        triage_db.DB_NAME = db_name  # triage_analytics reads the default database
+        triage_db.init_db(db_name)
+        rows, load_s = populate(db_name, args.sessions, args.days, rng)
+        print(f"{rows} turns in {args.sessions} sessions over {args.days} days, stored with counters in {load_s:.1f} s "
+              f"({load_s / rows * 1e6:.1f} us per turn)\n")
+
+        week_start = time.time() - 7 * 86400
+        for label, since in (("last 7 days", week_start), ("whole table", None)):
+            exported, written, elapsed, _ = timed_export(since, db_name)
+            peak = timed_export(since, db_name, trace=True)[3]
+            print(f"export {label:<12} {exported:8d} rows, {written / 1e6:6.1f} MB in {elapsed:5.2f} s "
+                  f"({exported / elapsed:8.0f} rows/s), peak memory {peak / 1e6:.1f} MB")
+
+        conn = triage_db.get_connection(db_name)
+        last_id = conn.execute("SELECT MAX(id) FROM chat_memory").fetchone()[0] - triage_export.EXPORT_PAGE_SIZE
+        keyset = median_ms(lambda: conn.execute(triage_export.PAGE_BY_ID_SQL, (last_id, triage_export.EXPORT_PAGE_SIZE)).fetchall())
+        offset = median_ms(lambda: conn.execute(OFFSET_PAGE_SQL, (triage_export.EXPORT_PAGE_SIZE, last_id)).fetchall(), runs=5)
+        print(f"\nlast page of {triage_export.EXPORT_PAGE_SIZE}: keyset {keyset:.2f} ms, OFFSET {offset:.2f} ms")
+
+        summary = median_ms(lambda: triage_analytics.analytics_summary(args.days))
+        raw = median_ms(lambda: (conn.execute(RAW_DAYS_SQL).fetchall(), conn.execute(RAW_LENGTHS_SQL).fetchall()), runs=3)
+        print(f"dashboard: counters {summary:.2f} ms, computed from chat_memory {raw:.0f} ms")
+
+        counted = [(d["day"], d["sessions"], d["turns"]) for d in triage_analytics.daily_counts(args.days + 1)]
+        recomputed = conn.execute(RAW_DAYS_SQL).fetchall()
+        lengths = triage_analytics.session_length_histogram() == dict(conn.execute(RAW_LENGTHS_SQL).fetchall())
+        print(f"counters match chat_memory: days {counted == recomputed}, turns per session {lengths}")
+        triage_db.close_connections()
+
+
+if __name__ == "__main__":
+    main()
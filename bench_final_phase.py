@@ -0,0 +1,99 @@
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+# Final-turn wall time with the stub Ollama taking --delay seconds per generation.
+#   sequential: what triageAI-deepseek.py did: read the history, generate the
+#               advice, read the history again, generate the summary report
+#   pipelined:  the final turn through triageAI's /chat, which starts the report
+#               alongside the advice; then GET /sessions/{id}/summary until ready
+# Reports time until the patient has the advice and until the report is ready.
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["TRIAGE_DB_NAME"] = os.path.join(_tmp.name, "final.db")
+os.environ.setdefault("TRIAGE_CHATBOT_USERNAME", "bench")
+os.environ.setdefault("TRIAGE_CHATBOT_PASSWORD", "test")
+
+import httpx  # noqa: E402
+
+import triageAI  # noqa: E402
+from stub_llm_server import start_stub_server  # noqa: E402
+from triage_backends import OllamaBackend, aclose_backends, set_backend  # noqa: E402
+from triage_context_cache import format_conversation, save_turn  # noqa: E402
+from triage_journal import get_memory  # noqa: E402
+from triage_summary_report import build_report_prompt  # noqa: E402
+
+AUTH = (os.environ["TRIAGE_CHATBOT_USERNAME"], os.environ["TRIAGE_CHATBOT_PASSWORD"])
+TURNS = [("I have a sharp pain in my lower back", "When did it start?"),
+         ("Three days ago after lifting a box", "Does the pain spread down your legs?"),
+         ("A little into my left thigh", "Any numbness or weakness?"),
+         ("No numbness", "Have you taken anything for it?")]
+
+
+def seed(patient_id, session_id):
+    for user_input, ai_response in TURNS[:triageAI.QUESTION_COUNTS - 1]:
+        save_turn(patient_id, session_id, user_input, ai_response)
+
+
+def sequential(backend, patient_id, session_id):
+    started = time.perf_counter()
+    conversation = format_conversation(get_memory(patient_id, session_id))
+    backend.generate(f"{conversation}\nGive final advice.", max_tokens=200)
+    advice_at = time.perf_counter() - started
+    conversation = format_conversation(get_memory(patient_id, session_id))
+    backend.generate(build_report_prompt(conversation), max_tokens=300)
+    return advice_at, time.perf_counter() - started
+
+
+async def pipelined(client, patient_id, session_id):
+    started = time.perf_counter()
+    payload = {"patient_id": patient_id, "session_id": session_id, "user_input": "Only ibuprofen, it helps a bit"}
+    response = await client.post("/chat/async", json=payload, auth=AUTH)
+    response.raise_for_status()
+    advice_at = time.perf_counter() - started
+    while True:
+        response = await client.get(f"/sessions/{session_id}/summary", params={"patient_id": patient_id}, auth=AUTH)
+        if response.status_code == 200:
+            return advice_at, time.perf_counter() - started
+        response.raise_for_status()
+        await asyncio.sleep(0.01)
+
+
+def report(label, samples):
+    advice, summary = zip(*samples)
+    print(f"{label:<11} advice p50 {statistics.median(advice):6.2f} s   summary ready p50 {statistics.median(summary):6.2f} s")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Time the final triage turn: advice and summary report.")
+    parser.add_argument("--delay", type=float, default=1.0, help="stub seconds per generation")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    server, url = start_stub_server(args.delay)
+    backend = OllamaBackend(url=f"{url}/api/generate")
+    set_backend("ollama", backend)
+    triageAI.init_db()
+    print(f"stub delay {args.delay}s per generation, {args.runs} final turns each\n")
+
+    samples = []
+    for n in range(args.runs):
+        seed("bench", f"seq-{n}")
+        samples.append(sequential(backend, "bench", f"seq-{n}"))
+    report("sequential", samples)
+
+    samples = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=triageAI.app), base_url="http://triage", timeout=None) as client:
+        for n in range(args.runs):
+            seed("bench", f"pipe-{n}")
+            samples.append(await pipelined(client, "bench", f"pipe-{n}"))
+    report("pipelined", samples)
+    await aclose_backends()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
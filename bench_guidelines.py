@@ -0,0 +1,73 @@
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from triage_guidelines import GuidelineIndex, default_documents, ingest
+from triage_router import percentile
+
+# Guideline retrieval benchmark: a full ingest into a scratch index, an incremental
+# re-run with nothing changed, adding one more document, then cold open time and
+# top-k query latency for typical final-advice queries.
+
+QUERIES = [
+    "lower back pain for three weeks after lifting, ibuprofen helps a little",
+    "chronic knee pain osteoarthritis taking oxycodone every day",
+    "headache migraine not helped by acetaminophen",
+    "acute pain after dental extraction how many days of opioids",
+    "I want to stop taking my opioid medication, how do I taper",
+    "back pain and I also take benzodiazepines for anxiety",
+    "sickle cell disease pain crisis",
+    "kidney stone pain severe",
+    "neck pain after car accident, muscle spasms",
+    "fibromyalgia widespread pain fatigue poor sleep",
+]
+
+EXTRA_DOCUMENT = (
+    "Low back pain guidance. Most acute low back pain improves within weeks. Encourage staying active, "
+    "heat, and nonsteroidal anti-inflammatory drugs. Imaging is not needed without red flags such as "
+    "saddle anesthesia, bladder dysfunction, fever or major trauma."
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark guideline ingestion and retrieval.")
+    parser.add_argument("documents", nargs="*", help="documents to ingest (default: the PDFs in the repo)")
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=100, help="passes over the query set")
+    args = parser.parse_args()
+    documents = args.documents or default_documents()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index_dir = os.path.join(tmp, "index")
+        for label, paths in (("full ingest", documents), ("re-run, unchanged", documents)):
+            started = time.perf_counter()
+            added, skipped, _ = ingest(paths, index_dir)
+            print(f"{label:<22} {time.perf_counter() - started:8.2f} s  ({len(added)} indexed, {len(skipped)} skipped)")
+        extra = os.path.join(tmp, "low_back_pain.txt")
+        with open(extra, "w", encoding="utf-8") as f:
+            f.write(EXTRA_DOCUMENT)
+        started = time.perf_counter()
+        added, skipped, _ = ingest([*documents, extra], index_dir)
+        print(f"{'add one document':<22} {time.perf_counter() - started:8.2f} s  ({len(added)} indexed, {len(skipped)} skipped)")
+
+        started = time.perf_counter()
+        index = GuidelineIndex(index_dir)
+        print(f"\nopen index: {(time.perf_counter() - started) * 1000:.1f} ms, {index.total_passages} passages")
+
+        samples = []
+        for _ in range(args.repeat):
+            for query in QUERIES:
+                started = time.perf_counter()
+                index.search(query, args.k)
+                samples.append(time.perf_counter() - started)
+        print(f"top-{args.k} search: p50 {statistics.median(samples) * 1000:.2f} ms, p99 {percentile(samples, 99) * 1000:.2f} ms")
+
+        for query in QUERIES[:3]:
+            top = index.search(query, 1)[0]
+            print(f"\n{query}\n  -> {top.source}, p. {top.page} ({top.score:.1f}): {top.text[:140]}...")
+
+
+if __name__ == "__main__":
+    main()
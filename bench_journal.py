@@ -0,0 +1,155 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import triage_db
+import triage_journal
+from triage_journal import WriteBehindJournal
+from triage_router import percentile
+
+# Benchmark: storing a chat turn with save_memory (one transaction per turn,
+# which /chat waited for) against appending it to the write-behind journal,
+# with --threads writers on separate sessions. Reports per-turn latency, turns
+# per second and how many turns each journal transaction carried, checks that
+# get_memory sees a turn straight after it was appended, checks that a turn the
+# database rejects is set aside in the dead-letter file without holding up the
+# turns around it and can be replayed once fixed, checks that turns are held
+# back rather than set aside while the database rejects every one, and crashes a child process with turns still in its journal
+# to check that the next start commits every one of them exactly once, also
+# when the log is replayed twice.
+
+OUTAGE_TRIGGER_SQL = "CREATE TRIGGER outage BEFORE INSERT ON chat_memory BEGIN SELECT RAISE(ABORT, 'outage'); END"
+
+CRASH_SCRIPT = """
+import os, sys
+sys.path.insert(0, {root!r})
+from triage_journal import WriteBehindJournal
+journal = WriteBehindJournal({db!r}, {directory!r}, flush_interval_ms=60_000)  # Nothing is flushed before the crash
+for n in range({turns}):
+    journal.append("crash", "s0", f"answer {{n}}", f"question {{n}}")
+os._exit(1)
+"""
+
+
+def run_writers(store, threads, turns):
+    samples = [[] for _ in range(threads)]
+
+    def writer(n):
+        for turn in range(turns):
+            started = time.perf_counter()
+            store(f"p{n}", f"s{n}", f"answer {turn}", f"question {turn}")
+            samples[n].append((time.perf_counter() - started) * 1e6)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=writer, args=(n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return [s for per_thread in samples for s in per_thread], time.perf_counter() - started
+
+
+def report(label, samples, elapsed):
+    print(f"{label:<9} p50 {statistics.median(samples):8.1f} us   p99 {percentile(samples, 99):8.1f} us   "
+          f"{len(samples) / elapsed:8.0f} turns/s")
+
+
+def count_rows(db_name, patient_id):
+    return triage_db.get_connection(db_name).execute("SELECT COUNT(*) FROM chat_memory WHERE patient_id=?", (patient_id,)).fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare synchronous turn writes with the write-behind journal.")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=500, help="turns per thread")
+    parser.add_argument("--crash-turns", type=int, default=1000)
+    parser.add_argument("--fsync", action="store_true", help="fsync the journal before each commit")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "journal.db")
+        directory = f"{db_name}-turnlog"
+        triage_db.DB_NAME = db_name  # The journal and its get_memory use the default database
+        triage_db.init_db(db_name)
+        print(f"{args.threads} threads x {args.turns} turns\n")
+
+        samples, elapsed = run_writers(lambda *turn: triage_db.save_memory(*turn, db_name=db_name), args.threads, args.turns)
+        report("sync", samples, elapsed)
+
+        triage_db.run_write(lambda conn: conn.execute("DELETE FROM chat_memory"), db_name)
+        journal = triage_journal.get_journal()
+        journal.fsync = args.fsync
+        samples, elapsed = run_writers(journal.append, args.threads, args.turns)
+        report("journal", samples, elapsed)
+        while journal.stats()["pending"]:
+            time.sleep(0.005)
+        stats = journal.stats()
+        rows = triage_db.get_connection(db_name).execute("SELECT COUNT(*) FROM chat_memory").fetchone()[0]
+        print(f"          {stats['flushes']} transactions, {stats['avg_batch']:.0f} turns each on average "
+              f"(max {stats['max_batch']}), {stats['avg_flush_ms']:.2f} ms per commit; {rows} rows committed")
+
+        # Read-your-writes: each turn is read back before the flusher has had time to commit it
+        missed = 0
+        for turn in range(200):
+            journal.append("ryw", "s0", f"answer {turn}", f"question {turn}")
+            missed += len(triage_journal.get_memory("ryw", "s0")) != turn + 1
+            missed += triage_journal.get_turn_count("ryw", "s0") != turn + 1
+        print(f"\nread-your-writes: {missed} of 400 reads missed a turn")
+
+        # A turn that cannot be inserted (a value SQLite cannot bind) among good ones
+        for turn in range(50):
+            journal.append("poison", f"s{turn % 5}", f"answer {turn}", {"not": "text"} if turn == 25 else f"question {turn}")
+        while journal.stats()["pending"]:
+            time.sleep(0.005)
+        with open(journal.dead_letter_path, encoding="utf-8") as f:
+            dead = sum(1 for _ in f)
+        print(f"poisoned batch: {count_rows(db_name, 'poison')} of 49 good turns committed, "
+              f"{journal.stats()['dead_lettered']} turn dead-lettered ({dead} in the file)")
+        with open(journal.dead_letter_path, encoding="utf-8") as f:
+            fixed = [{**json.loads(line), "ai_response": "question 25"} for line in f]
+        with open(journal.dead_letter_path, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(record) + "\n" for record in fixed)
+        inserted, kept = triage_journal.replay_dead_letters(db_name, directory)
+        print(f"dead letters replayed after the fix: {inserted} inserted, {kept} still failing, "
+              f"{count_rows(db_name, 'poison')} of 50 turns committed")
+
+        # An outage: every insert fails for a while; nothing may be dead-lettered
+        triage_db.get_connection(db_name).execute(OUTAGE_TRIGGER_SQL)
+        for turn in range(20):
+            journal.append("outage", f"s{turn % 5}", f"answer {turn}", f"question {turn}")
+        time.sleep(1.0)
+        held = journal.stats()["pending"]
+        triage_db.get_connection(db_name).execute("DROP TRIGGER outage")
+        while journal.stats()["pending"]:
+            time.sleep(0.005)
+        print(f"outage: {held} of 20 turns held back, {journal.stats()['dead_lettered']} dead-lettered in all, "
+              f"{count_rows(db_name, 'outage')} of 20 committed after it")
+        triage_journal.close_journal()
+
+        # Crash with everything still in the journal, then recover, then replay the same log again
+        script = CRASH_SCRIPT.format(root=os.path.dirname(os.path.abspath(__file__)), db=db_name,
+                                     directory=directory, turns=args.crash_turns)
+        subprocess.run([sys.executable, "-c", script])
+        logs = [name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name))]
+        saved = os.path.join(tmp, "saved-log")
+        shutil.copytree(os.path.join(directory, logs[0]), saved)
+        recovered = WriteBehindJournal(db_name, directory)
+        recovered.close()
+        first = count_rows(db_name, "crash")
+        shutil.copytree(saved, os.path.join(directory, logs[0]))
+        replayed = WriteBehindJournal(db_name, directory)
+        replayed.close()
+        print(f"crash with {args.crash_turns} turns journaled: {recovered.stats()['recovered_turns']} recovered, "
+              f"{first} rows; replayed again: {replayed.stats()['recovered_turns']} inserted, {count_rows(db_name, 'crash')} rows")
+        triage_db.close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import os
+import tempfile
+
+# Benchmark: prompt tokens and prefill time per turn for 5- and 10-question
+# sessions, resending the full conversation versus reusing Ollama's context array.
+# Uses the stub server (which charges --prefill seconds per prompt token) unless
+# --ollama points at a real Ollama, in which case its prompt_eval_duration is reported.
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ.setdefault("TRIAGE_DB_NAME", os.path.join(_tmp.name, "prefill.db"))
+os.environ.setdefault("TRIAGE_CHATBOT_USERNAME", "bench")
+os.environ.setdefault("TRIAGE_CHATBOT_PASSWORD", "bench")
+
+import triageAI  # noqa: E402
+from stub_llm_server import start_stub_server  # noqa: E402
+from triage_backends import OllamaBackend, set_backend  # noqa: E402
+from triage_ollama_context import context_stats  # noqa: E402
+
+ANSWERS = [
+    "I have pain in my lower back",
+    "It started three days ago after lifting a box",
+    "It is about a 6 out of 10",
+    "It gets worse when I bend forward",
+    "No numbness or tingling in my legs",
+    "I took ibuprofen and it helped a little",
+    "I have had back pain once before, years ago",
+    "No fever and no problems with bladder or bowels",
+    "I work at a desk most of the day",
+    "Sleeping is hard because I cannot get comfortable",
+]
+
+
+def run_session(questions, reuse, session):
+    triageAI.REUSE_OLLAMA_CONTEXT = reuse
+    triageAI.QUESTION_COUNTS = questions
+    rows = []
+    for turn in range(1, questions + 1):
+        triageAI.determine_next_question("bench", session, ANSWERS[turn - 1], turn)
+        stats = context_stats()
+        rows.append((stats["last_prompt_tokens"], stats["last_prompt_eval_ms"]))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure per-turn prefill with and without Ollama context reuse.")
+    parser.add_argument("--ollama", help="real Ollama /api/generate URL instead of the stub")
+    parser.add_argument("--prefill", type=float, default=0.0005, help="stub seconds per prompt token")
+    args = parser.parse_args()
+
+    if args.ollama:
+        set_backend("ollama", OllamaBackend(url=args.ollama))
+    else:
+        server, url = start_stub_server(delay=0.0, prefill_per_token=args.prefill)
+        set_backend("ollama", OllamaBackend(url=f"{url}/api/generate"))
+    triageAI.init_db()
+
+    for questions in (5, 10):
+        full = run_session(questions, reuse=False, session=f"full-{questions}")
+        reused = run_session(questions, reuse=True, session=f"reuse-{questions}")
+        print(f"\n{questions}-question session      full conversation        reused context")
+        for turn, ((full_tokens, full_ms), (reuse_tokens, reuse_ms)) in enumerate(zip(full, reused), start=1):
+            print(f"  turn {turn:<2}              {full_tokens:5d} tok {full_ms:8.1f} ms    {reuse_tokens:5d} tok {reuse_ms:8.1f} ms")
+        print(f"  total prefill                     {sum(ms for _, ms in full):8.1f} ms             {sum(ms for _, ms in reused):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import json
+import time
+
+from triage_red_flags import RED_FLAG_RULES, RedFlagMatcher, normalize_text
+
+# Red-flag pre-screen benchmark. Checks the matcher against the labelled corpus in
+# red_flag_corpus.jsonl (every mismatch is printed), then measures throughput of the
+# compiled matcher against a naive scan that tests every phrase with `in`.
+
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def naive_match(rules, text):
+    text = normalize_text(text)
+    for rule in rules["rules"]:
+        for phrase in rule.get("phrases", []):
+            if phrase in text:
+                return rule["id"]
+    return None
+
+
+def throughput(fn, texts, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for text in texts:
+            fn(text)
+    elapsed = time.perf_counter() - started
+    calls = iterations * len(texts)
+    return calls / elapsed, elapsed / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time the red-flag matcher.")
+    parser.add_argument("--rules", default=RED_FLAG_RULES)
+    parser.add_argument("--corpus", default="red_flag_corpus.jsonl")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    with open(args.rules, encoding="utf-8") as f:
+        rules = json.load(f)
+    started = time.perf_counter()
+    matcher = RedFlagMatcher(rules)
+    print(f"rules version {matcher.version}: compiled {len(matcher.rules)} rules in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    corpus = load_corpus(args.corpus)
+    errors = 0
+    for case in corpus:
+        found = matcher.match(case["text"])
+        got = found.rule_id if found else None
+        if got != case["expected"]:
+            errors += 1
+            print(f"  MISMATCH expected={case['expected']} got={got}: {case['text']}")
+    flagged = sum(1 for case in corpus if case["expected"])
+    print(f"corpus: {len(corpus)} messages ({flagged} red flags), {errors} mismatches\n")
+
+    texts = [case["text"] for case in corpus]
+    for label, fn in (("compiled regex", matcher.match), ("naive phrase scan", lambda text: naive_match(rules, text))):
+        per_second, micros = throughput(fn, texts, args.iterations)
+        print(f"{label:<18} {per_second:>10,.0f} messages/s  {micros:6.2f} us/message")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import argparse
+import asyncio
+import statistics
+import time
+
+from stub_llm_server import start_stub_server
+from triage_backends import LLMBackendError, OllamaBackend, OpenAIBackend
+from triage_router import LatencyRouter, percentile
+
+# Router check against local stub servers: a fast but jittery and flaky "ollama",
+# a slower steady "openai" and a "grok" that is down. Reports end-to-end p50/p99
+# and per-backend stats with and without hedging.
+
+
+class DownBackend(OpenAIBackend):
+    name = "grok"
+
+
+def make_router(hedge):
+    fast, fast_url = start_stub_server(delay=0.05, jitter=0.4, error_rate=0.1)
+    slow, slow_url = start_stub_server(delay=0.15, jitter=0.02)
+    backends = [
+        OllamaBackend(url=f"{fast_url}/api/generate", retries=0),
+        OpenAIBackend(url=f"{slow_url}/v1/chat/completions", api_key="stub", retries=0),
+        DownBackend(url="http://127.0.0.1:9/v1/chat/completions", api_key="stub", retries=0, timeout=1),
+    ]
+    return LatencyRouter(backends, hedge=hedge, hedge_percentile=75), (fast, slow)
+
+
+async def run(router, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async def one():
+        nonlocal failures
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await router.agenerate("I have back pain", max_tokens=50)
+                latencies.append(time.perf_counter() - started)
+            except LLMBackendError:
+                failures += 1
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    await router.aclose()
+    return latencies, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exercise the latency router against stub backends.")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    for hedge in (False, True):
+        router, servers = make_router(hedge)
+        latencies, failures = asyncio.run(run(router, args.requests, args.concurrency))
+        print(f"\nhedging={'on' if hedge else 'off'}: p50={statistics.median(latencies) * 1000:.0f} ms  "
+              f"p99={percentile(latencies, 99) * 1000:.0f} ms  failed={failures}/{args.requests}")
+        for name, stats in router.stats().items():
+            p50 = f"{stats['p50_ms']:.0f}" if stats["p50_ms"] is not None else "-"
+            print(f"  {name:<8} healthy={stats['healthy']!s:<5} calls={stats['calls']:<4} errors={stats['errors']:<4} "
+                  f"hedges={stats['hedges']:<4} p50={p50} ms")
+        for server in servers:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import argparse
+import random
+import sqlite3
+import statistics
+import time
+
+import numpy as np
+
+from triage_router import percentile
+from triage_semantic_cache import EMBEDDING_DIM, SemanticCache, conversation_window, embed, make_index
+
+# Semantic cache benchmark.
+#  1. Lookup latency of the flat and HNSW indexes at several index sizes.
+#  2. Hit rate at several similarity thresholds when replaying a corpus of sessions:
+#     a synthetic one by default (wrong hits = question reused from a different
+#     complaint), or the chat_memory table of an existing database with --db.
+
+COMPLAINTS = {
+    "back pain": ["I have back pain", "my back hurts", "back pain", "I've got lower back pain",
+                  "pain in my lower back", "my back is really sore", "backpain since yesterday"],
+    "headache": ["I have a headache", "headache", "my head hurts", "I've had a headache all day",
+                 "bad headache", "pain in my head", "head ache that won't go away"],
+    "knee pain": ["knee pain", "my knee hurts", "I have pain in my knee", "sore knee",
+                  "my left knee hurts when I walk", "knee is swollen and painful"],
+    "sore throat": ["sore throat", "my throat hurts", "I have a sore throat", "it hurts to swallow",
+                    "scratchy throat since Monday"],
+    "stomach ache": ["stomach ache", "my stomach hurts", "I have stomach pain", "pain in my belly",
+                     "tummy ache after eating"],
+    "ankle injury": ["I twisted my ankle", "ankle pain", "my ankle is swollen", "sprained ankle",
+                     "hurt my ankle playing football"],
+}
+ANSWERS = [
+    ["since yesterday", "for about two days", "a week now", "it started this morning", "three days"],
+    ["yes", "no", "a little", "not really", "sometimes"],
+    ["it gets worse when I move", "resting helps", "nothing helps", "painkillers help a bit", "worse at night"],
+]
+
+
+def synthetic_sessions(count, seed=7):
+    """Sessions as (complaint, [(user_input, ai_response), ...])."""
+    rng = random.Random(seed)
+    sessions = []
+    for _ in range(count):
+        complaint = rng.choice(list(COMPLAINTS))
+        inputs = [rng.choice(COMPLAINTS[complaint])] + [rng.choice(options) for options in ANSWERS]
+        turns = [(text, f"About your {complaint}: follow-up question {n + 1}?") for n, text in enumerate(inputs)]
+        sessions.append((complaint, turns))
+    return sessions
+
+
+def db_sessions(path):
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    sessions = {}
+    for session_id, user_input, ai_response in connection.execute(
+            "SELECT session_id, user_input, ai_response FROM chat_memory ORDER BY id"):
+        sessions.setdefault(session_id, []).append((user_input, ai_response))
+    connection.close()
+    return [(None, turns) for turns in sessions.values()]
+
+
+def replay(sessions, threshold, index):
+    """Replays every session turn by turn: look up, and on a miss store the recorded answer."""
+    cache = SemanticCache(threshold=threshold, capacity=max(1000, len(sessions) * 5), index=index)
+    wrong = 0
+    for complaint, turns in sessions:
+        history = []
+        for question_count, (user_input, ai_response) in enumerate(turns, start=1):
+            window = conversation_window(history, user_input)
+            partition = ("bench", "bench", question_count)
+            cached = cache.lookup(partition, window)
+            if cached is None:
+                cache.store(partition, window, ai_response)
+            elif complaint and complaint not in cached:
+                wrong += 1
+            history.append((user_input, ai_response))
+    return cache.stats(), wrong
+
+
+def lookup_latency(kind, size, queries=500):
+    """p50/p99 of embed + nearest-neighbour search over `size` random entries."""
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((size, EMBEDDING_DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index = make_index(size, kind)
+    for vector in vectors:
+        index.add(vector)
+    samples = []
+    for n in range(queries):
+        started = time.perf_counter()
+        index.search(embed(f"Patient: query {n} about my back pain"))
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000, percentile(samples, 99) * 1000, type(index).__name__
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark semantic cache lookup latency and hit rate.")
+    parser.add_argument("--sessions", type=int, default=2000, help="synthetic sessions to replay")
+    parser.add_argument("--db", help="replay the chat_memory table of this SQLite database instead")
+    parser.add_argument("--sizes", default="1000,10000,50000", help="index sizes for the latency test")
+    parser.add_argument("--thresholds", default="0.8,0.85,0.9,0.95")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    for _ in range(1000):
+        embed("Patient: I have back pain\nAI: How long have you had it?\nPatient: since yesterday")
+    print(f"embedding: {(time.perf_counter() - started):.3f} ms per window\n")
+
+    print(f"{'index':<6} {'entries':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for index in ("flat", "hnsw"):
+        for size in [int(s) for s in args.sizes.split(",")]:
+            p50, p99, used = lookup_latency(index, size)
+            if index == "hnsw" and used != "HNSWIndex":
+                break
+            print(f"{index:<6} {size:>8} {p50:>8.3f} {p99:>8.3f}")
+
+    sessions = db_sessions(args.db) if args.db else synthetic_sessions(args.sessions)
+    turns = sum(len(t) for _, t in sessions)
+    print(f"\nreplaying {len(sessions)} sessions, {turns} turns")
+    print(f"{'threshold':>9} {'hit rate':>9} {'wrong hits':>10} {'bypassed':>9}")
+    for threshold in [float(t) for t in args.thresholds.split(",")]:
+        stats, wrong = replay(sessions, threshold, "flat")
+        wrong_text = f"{wrong}" if not args.db else "-"
+        print(f"{threshold:>9.2f} {stats['hit_rate']:>9.1%} {wrong_text:>10} {stats['bypassed']:>9}")
+
+
+if __name__ == "__main__":
+    main()
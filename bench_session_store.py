@@ -0,0 +1,91 @@
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from triage_session_store import SESSION_CACHE_TTL, WRITE_BATCH_SIZE, SQLiteSessionBackend, SessionStore
+
+# Several bot processes sharing one SQLite session store. Every process runs
+# --threads handler threads that /start each of --chats chats --turns times and
+# read the chat back after each start (all processes write to all chats at once,
+# the worst case), then try to claim every one of --updates update ids, as
+# replicas receiving redelivered webhooks would. Each update must have been
+# claimed exactly once. Then two stores in this process stand in for two
+# replicas: one caches every chat, the other /starts them all again, and the
+# first must return the new sessions straight away (stale reads must be 0).
+#   unbatched: one transaction per write
+#   batched:   writes queued meanwhile share a transaction
+# Reports writes per second, writes per transaction, duplicate/missing claims and
+# stale reads.
+
+
+def worker(db_name, mode, chats, turns, updates, threads, go, results):
+    store = SessionStore(SQLiteSessionBackend(db_name), max_batch=1 if mode == "unbatched" else WRITE_BATCH_SIZE)
+    claimed = []
+
+    def run(thread):
+        mine = [chat for chat in range(chats) if chat % threads == thread]
+        for turn in range(turns):
+            for chat in mine:
+                store.start(chat, {"chat_id": chat, "session_id": f"session-{chat}-{os.getpid()}-{turn}"})
+                store.get(chat)
+        claimed.extend(u for u in range(thread, updates, threads) if store.claim(u))
+
+    go.wait()
+    workers = [threading.Thread(target=run, args=(n,)) for n in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    results.put((claimed, store.writer.stats()))
+
+
+def run_mode(mode, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "sessions.db")
+        go, results = multiprocessing.Event(), multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=worker, args=(db_name, mode, args.chats, args.turns, args.updates,
+                                                                  args.threads, go, results))
+                     for _ in range(args.processes)]
+        for p in processes:
+            p.start()
+        started = time.perf_counter()
+        go.set()
+        outcomes = [results.get() for _ in processes]
+        elapsed = time.perf_counter() - started
+        for p in processes:
+            p.join()
+
+        cached, other = (SessionStore(SQLiteSessionBackend(db_name), cache_ttl=SESSION_CACHE_TTL) for _ in range(2))
+        for chat in range(args.chats):
+            cached.get(chat)
+            other.start(chat, {"chat_id": chat, "session_id": f"restarted-{chat}"})
+        stale = sum(cached.get(chat)["session_id"] != f"restarted-{chat}" for chat in range(args.chats))
+        claims = [update for claimed, _ in outcomes for update in claimed]
+        duplicate, missing = len(claims) - len(set(claims)), args.updates - len(set(claims))
+        writes = sum(stats["writes"] for _, stats in outcomes)
+        batches = sum(stats["batches"] for _, stats in outcomes)
+        print(f"{mode:<10} {elapsed:6.2f} s   writes/s {writes / elapsed:8.0f}   writes/transaction {writes / batches:5.1f}   "
+              f"duplicate claims {duplicate}   missing claims {missing}   stale reads {stale}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time the shared session store across bot processes.")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8, help="handler threads per process")
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=5, help="/starts per chat per process")
+    parser.add_argument("--updates", type=int, default=1000, help="update ids every process tries to claim")
+    parser.add_argument("--modes", nargs="+", default=["unbatched", "batched"])
+    args = parser.parse_args()
+
+    print(f"{args.processes} processes x {args.threads} threads, {args.chats} chats x {args.turns} turns per process, "
+          f"{args.updates} updates\n")
+    for mode in args.modes:
+        run_mode(mode, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+# Startup benchmark: time to import each app through triage_server.load_app in a
+# fresh interpreter (what a cold container pays before uvicorn binds its port),
+# minus the bare interpreter start, then a `python -X importtime` breakdown of one
+# run by top-level package. Startup times are noisy on shared machines; the
+# minimum is the steadier number. Dummy API keys are set so the hosted backends load.
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+LAZY_PACKAGES = ["numpy", "hnswlib", "pypdf", "httpx", "uvicorn"]  # Should not be imported at startup
+
+
+def run(code, importtime=False):
+    """(wall seconds, stderr) of one fresh interpreter running code."""
+    env = dict(os.environ, OPENAI_API_KEY="bench", GROK_API_KEY="bench", DEEPSEEK_API_KEY="bench")
+    command = [sys.executable, *(["-X", "importtime"] if importtime else []), "-c", code]
+    started = time.perf_counter()
+    result = subprocess.run(command, cwd=DIRECTORY, env=env, capture_output=True, text=True, check=True)
+    return time.perf_counter() - started, result.stderr
+
+
+def importtime_by_package(stderr):
+    """Self time in ms per top-level package from `-X importtime` output."""
+    totals = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        totals[name.split(".")[0]] += int(self_us) / 1000
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app import time per backend.")
+    parser.add_argument("backends", nargs="*", default=["ollama", "openai", "grok"])
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--top", type=int, default=8, help="packages listed in the breakdown")
+    args = parser.parse_args()
+
+    interpreter = min(run("pass")[0] for _ in range(args.runs))
+    print(f"bare interpreter: {interpreter * 1000:.0f} ms (subtracted below)\n")
+    for backend in args.backends:
+        code = f"import triage_server; triage_server.load_app({backend!r})"
+        walls = [(run(code)[0] - interpreter) * 1000 for _ in range(args.runs)]
+        totals = importtime_by_package(run(code, importtime=True)[1])
+        print(f"{backend}: app import min {min(walls):.0f} ms, median {statistics.median(walls):.0f} ms ({args.runs} runs)")
+        for name, ms in sorted(totals.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"  {name:<28} {ms:7.1f} ms")
+        own = sum(ms for name, ms in totals.items() if name.startswith("triage"))
+        loaded = [name for name in LAZY_PACKAGES if name in totals]
+        print(f"  {'(triage modules)':<28} {own:7.1f} ms")
+        print(f"  deferred packages imported at startup: {', '.join(loaded) or 'none'}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+# Summary report queue under a backlog. --jobs reports are queued at once
+# (--emergency of them for red-flag sessions) against a stub Ollama that
+# generates one at a time (--delay seconds each) and fails --error-rate of its
+# calls, with backend retries off so failures go through the queue's retry.
+# Two extra jobs are left "running" with an expired lease, as a crashed worker
+# would leave them: one is retried, the other was on its last attempt and must
+# fail. Reports time until each report is readable, by priority, how many jobs
+# were retried, completed or lost, how many are queued again when every final
+# turn is replayed unchanged (should be none), and the read-path latency of
+# get_report.
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["TRIAGE_DB_NAME"] = os.path.join(_tmp.name, "reports.db")
+os.environ.setdefault("TRIAGE_REPORT_RETRY_BACKOFF", "0.2")
+
+import triage_summary_report as reports  # noqa: E402
+from stub_llm_server import start_stub_server  # noqa: E402
+from triage_backends import OllamaBackend  # noqa: E402
+from triage_db import get_connection, init_db, run_write  # noqa: E402
+from triage_router import percentile  # noqa: E402
+
+CONVERSATION = "Patient: my lower back hurts\nAI: When did it start?\nPatient: three days ago"
+
+
+def crashed_job(backend, session_id, attempts):
+    """A job a dead worker claimed and never finished."""
+    now = time.time()
+    run_write(lambda conn: conn.execute(
+        "INSERT INTO summary_jobs (patient_id, session_id, backend, conversation, priority, status, attempts, not_before, "
+        "lease_until, created_at) VALUES ('bench', ?, ?, ?, 0, 'running', ?, ?, ?, ?)",
+        (session_id, backend.name, CONVERSATION, attempts, now, now - 1, now)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drain a backlog of summary report jobs.")
+    parser.add_argument("--jobs", type=int, default=60)
+    parser.add_argument("--emergency", type=int, default=10)
+    parser.add_argument("--delay", type=float, default=0.1, help="stub seconds per generation, one at a time")
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    server, url = start_stub_server(args.delay, error_rate=args.error_rate, serialize=True)
+    backend = OllamaBackend(url=f"{url}/api/generate", retries=0)
+    init_db()
+    crashed_job(backend, "crashed", 1)
+    crashed_job(backend, "crashed-last-attempt", reports.REPORT_ATTEMPTS)
+
+    sessions = [f"s{n}" for n in range(args.jobs)]
+    emergency = set(random.Random(42).sample(sessions, args.emergency))
+    queued_at = {}
+    for session_id in sessions:
+        queued_at[session_id] = time.time()
+        priority = reports.EMERGENCY_PRIORITY if session_id in emergency else reports.ROUTINE_PRIORITY
+        reports.enqueue_report(backend, "bench", session_id, CONVERSATION, priority)
+    print(f"{args.jobs} jobs ({args.emergency} emergency) + 2 crashed, {reports.REPORT_WORKERS} workers, "
+          f"stub {args.delay}s per generation, error rate {args.error_rate}")
+    print(f"queue depth after enqueue: {reports.report_stats()['queued_by_priority']}\n")
+
+    ready_after, deadline = {}, time.time() + args.timeout
+    while len(ready_after) < args.jobs and time.time() < deadline:
+        for session_id, created_at in get_connection().execute(
+                "SELECT session_id, created_at FROM summary_reports WHERE patient_id='bench'"):
+            if session_id in queued_at and session_id not in ready_after:
+                ready_after[session_id] = created_at - queued_at[session_id]
+        time.sleep(0.02)
+
+    for label, group in (("emergency", emergency), ("routine", set(sessions) - emergency)):
+        waits = [ready_after[s] for s in group if s in ready_after]
+        print(f"{label:<10} ready p50 {statistics.median(waits):6.2f} s   p95 {percentile(waits, 95):6.2f} s   ({len(waits)}/{len(group)})")
+
+    stats = reports.report_stats()
+    crashed = reports.get_report("bench", "crashed")[0]
+    crashed_last = reports.get_report("bench", "crashed-last-attempt")[0]
+    failed = stats["failed_jobs"] - (crashed_last == "failed")
+    print(f"\ncompleted {stats['completed']}   retried {stats['retried']}   failed {failed}   "
+          f"lost {args.jobs - len(ready_after) - failed}   crashed jobs: {crashed}, on last attempt {crashed_last}")
+
+    for session_id in sessions:
+        reports.enqueue_report(backend, "bench", session_id, CONVERSATION)
+    stats = reports.report_stats()
+    print(f"final turns replayed unchanged: {stats['unchanged']} skipped, {stats['queued']} queued again")
+
+    samples = []
+    for session_id in sessions:
+        started = time.perf_counter()
+        reports.get_report("bench", session_id)
+        samples.append((time.perf_counter() - started) * 1e6)
+    print(f"get_report p50 {statistics.median(samples):.0f} us")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import statistics
+import time
+
+import requests
+
+from stub_llm_server import start_stub_server
+from triage_router import percentile
+from triage_session_store import MemorySessionBackend, SessionStore
+from triage_telegram_bot_async import TriageBot
+
+# Telegram bot load test against the stub /chat server. --chats patients each send
+# /start and then --messages messages, all arriving at once, interleaved across
+# chats as in a getUpdates batch. Replies are recorded instead of sent to Telegram.
+#   sync:  one update at a time with a new connection per /chat call, like
+#          triage_telegram_bot.py's Updater and requests.post
+#   async: triage_telegram_bot_async.TriageBot
+# Reports wall time, reply latency (update received -> reply ready), TCP
+# connections opened, peak /chat requests in flight and per-chat order violations.
+
+
+def updates_for(chats, messages):
+    stream = [(chat, "/start") for chat in range(chats)]
+    for n in range(messages):
+        stream += [(chat, f"message {n} from chat {chat}") for chat in range(chats)]
+    return stream
+
+
+class RecordingBot(TriageBot):
+    def __init__(self, *args, **kwargs):
+        super().__init__("bench", *args, session_store=SessionStore(MemorySessionBackend()), **kwargs)
+        self.replies = []  # (chat_id, text, seconds after the burst started)
+        self.started = None
+
+    async def reply(self, chat_id, text):
+        self.replies.append((chat_id, text, time.perf_counter() - self.started))
+
+
+async def run_async(url, stream, max_inflight):
+    bot = RecordingBot(chat_api_url=f"{url}/chat", max_inflight=max_inflight)
+    bot.started = time.perf_counter()
+    for chat, text in stream:
+        bot.dispatcher.dispatch(chat, {"chat": {"id": chat}, "text": text})
+    await bot.dispatcher.join()
+    elapsed = time.perf_counter() - bot.started
+    await bot.aclose()
+    return elapsed, bot.replies
+
+
+def run_sync(url, stream):
+    sessions, replies = {}, []
+    started = time.perf_counter()
+    for chat, text in stream:
+        if text == "/start":
+            sessions[chat] = {"session_id": f"sync-{chat}"}
+            replies.append((chat, "greeting", time.perf_counter() - started))
+            continue
+        payload = {"patient_id": str(chat), "session_id": sessions[chat]["session_id"], "user_input": text}
+        response = requests.post(f"{url}/chat", json=payload, timeout=120)
+        replies.append((chat, response.json()["response"], time.perf_counter() - started))
+    return time.perf_counter() - started, replies
+
+
+def order_violations(replies):
+    """Replies to a chat that came back out of the order its messages were sent in."""
+    last, violations = {}, 0
+    for chat, text, _ in replies:
+        if text.startswith("Reply to: message "):
+            n = int(text.split()[3])
+            if n < last.get(chat, -1):
+                violations += 1
+            last[chat] = n
+    return violations
+
+
+def report(label, stub, elapsed, replies):
+    latencies = [seconds for _, text, seconds in replies if text.startswith("Reply to:")]
+    print(f"{label:<22} wall {elapsed:7.2f} s   replies/s {len(replies) / elapsed:7.1f}   "
+          f"p50 {statistics.median(latencies):6.2f} s   p95 {percentile(latencies, 95):6.2f} s   "
+          f"connections {stub.connections:4}   peak in flight {stub.max_chat_inflight:4}   "
+          f"order violations {order_violations(replies)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the Telegram bots against a stub /chat API.")
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=3, help="messages per chat after /start")
+    parser.add_argument("--delay", type=float, default=0.2, help="stub seconds per /chat call")
+    parser.add_argument("--jitter", type=float, default=0.1, help="up to this many extra random seconds per call")
+    parser.add_argument("--max-inflight", type=int, nargs="+", default=[8, 32])
+    parser.add_argument("--skip-sync", action="store_true", help="the sync run takes chats * messages * delay")
+    args = parser.parse_args()
+
+    stream = updates_for(args.chats, args.messages)
+    print(f"{args.chats} chats x {args.messages} messages, stub delay {args.delay}s + up to {args.jitter}s\n")
+    if not args.skip_sync:
+        stub, url = start_stub_server(args.delay, jitter=args.jitter)
+        report("sync", stub, *run_sync(url, stream))
+        stub.shutdown()
+    for max_inflight in args.max_inflight:
+        stub, url = start_stub_server(args.delay, jitter=args.jitter)
+        report(f"async, {max_inflight} in flight", stub, *asyncio.run(run_async(url, stream, max_inflight)))
+        stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from stub_llm_server import start_stub_server
+from triage_router import percentile
+from triage_session_store import MemorySessionBackend, SessionStore
+from triage_telegram_bot_async import TriageBot
+from triage_telegram_webhook import WEBHOOK_PATH, add_webhook
+
+# Replay harness for the Telegram bot. Feeds a recorded stream of Telegram
+# updates (JSON lines, as returned by getUpdates; --updates) or a synthetic one
+# to the bot in both receiving modes, against the stub server standing in for
+# /chat and the Telegram API:
+#   polling: the updates are queued on the stub's getUpdates
+#   webhook: the updates are POSTed to the webhook receiver with up to
+#            --connections deliveries in flight, as Telegram does
+# Updates are replayed as a burst, or at --rate updates per second. Reports
+# throughput, latency from update to reply, webhook acknowledgement time and
+# per-chat order violations.
+
+
+def synthetic_updates(chats, messages):
+    updates, update_id = [], 1000
+    for n in range(-1, messages):
+        for chat in range(chats):
+            text = "/start" if n < 0 else f"message {n} from chat {chat}"
+            user = {"id": chat, "first_name": f"Patient {chat}"}
+            message = {"message_id": update_id, "chat": {"id": chat, "type": "private"}, "from": user,
+                       "date": int(time.time()), "text": text}
+            updates.append({"update_id": update_id, "message": message})
+            update_id += 1
+    return updates
+
+
+def load_updates(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def paced(updates, rate):
+    """Yield updates at rate per second (all at once when rate is 0) with the time each was released."""
+    started = time.perf_counter()
+    for n, update in enumerate(updates):
+        if rate:
+            await asyncio.sleep(max(0.0, started + n / rate - time.perf_counter()))
+        yield update, time.perf_counter()
+
+
+async def wait_for_replies(stub, expected, timeout):
+    deadline = time.perf_counter() + timeout
+    while len(stub.sent_messages) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+
+
+async def replay_polling(stub, url, updates, rate, timeout):
+    bot = TriageBot("bench", chat_api_url=f"{url}/chat", telegram_api_url=url,
+                    session_store=SessionStore(MemorySessionBackend()))
+    poller = asyncio.create_task(bot.poll())
+    released = {}
+    async for update, at in paced(updates, rate):
+        released[update["update_id"]] = at
+        await asyncio.to_thread(stub.push_updates, [update])
+    await wait_for_replies(stub, sum(1 for update in updates if expects_reply(update)), timeout)
+    poller.cancel()
+    await bot.dispatcher.join()
+    await bot.aclose()
+    return released, []
+
+
+async def replay_webhook(stub, url, updates, rate, connections, timeout):
+    bot = TriageBot("bench", chat_api_url=f"{url}/chat", telegram_api_url=url,
+                    session_store=SessionStore(MemorySessionBackend()))
+    app = FastAPI()
+    add_webhook(app, bot, register=False)
+    released, acks = {}, []
+    slots = asyncio.Semaphore(connections)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://receiver") as client:
+        async def deliver(update):
+            async with slots:
+                started = time.perf_counter()
+                response = await client.post(WEBHOOK_PATH, json=update)
+                response.raise_for_status()
+                acks.append(time.perf_counter() - started)
+
+        deliveries = []
+        async for update, at in paced(updates, rate):
+            released[update["update_id"]] = at
+            deliveries.append(asyncio.create_task(deliver(update)))
+        await asyncio.gather(*deliveries)
+        await wait_for_replies(stub, sum(1 for update in updates if expects_reply(update)), timeout)
+    await bot.dispatcher.join()
+    await bot.aclose()
+    return released, acks
+
+
+def expects_reply(update):
+    text = update["message"]["text"].strip()
+    return not text.startswith("/") or text.split(maxsplit=1)[0].split("@")[0] == "/start"
+
+
+def report(label, stub, updates, released, acks):
+    index = {}  # (chat, text) -> (position in the stream, release time)
+    for position, update in enumerate(updates):
+        message = update["message"]
+        index[(message["chat"]["id"], message["text"].strip())] = (position, released[update["update_id"]])
+    latencies, last, violations = [], {}, 0
+    for chat, text, at in stub.sent_messages:
+        key = (chat, text[len("Reply to: "):] if text.startswith("Reply to: ") else "/start")
+        if key not in index:
+            continue
+        position, released_at = index[key]
+        latencies.append(at - released_at)
+        violations += position < last.get(chat, -1)
+        last[chat] = position
+    expected = sum(1 for update in updates if expects_reply(update))
+    elapsed = max(at for _, _, at in stub.sent_messages) - min(released.values())
+    line = (f"{label:<9} replies {len(stub.sent_messages):5}/{expected:<5} {len(stub.sent_messages) / elapsed:7.1f}/s   "
+            f"latency p50 {statistics.median(latencies):6.2f} s  p95 {percentile(latencies, 95):6.2f} s   "
+            f"order violations {violations}")
+    if acks:
+        line += f"   ack p50 {statistics.median(acks) * 1000:.1f} ms  p99 {percentile(acks, 99) * 1000:.1f} ms"
+    print(line)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Replay Telegram updates through the polling and webhook bots.")
+    parser.add_argument("--updates", help="recorded updates, one JSON object per line (default: synthetic)")
+    parser.add_argument("--save", help="write the replayed updates to this file")
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=3)
+    parser.add_argument("--rate", type=float, default=0, help="updates per second (0: one burst)")
+    parser.add_argument("--delay", type=float, default=0.1, help="stub seconds per /chat call")
+    parser.add_argument("--connections", type=int, default=40, help="concurrent webhook deliveries")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    updates = load_updates(args.updates) if args.updates else synthetic_updates(args.chats, args.messages)
+    updates = [u for u in updates if "text" in u.get("message", {})]
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(update) + "\n" for update in updates)
+    print(f"{len(updates)} updates, rate {args.rate or 'burst'}, stub delay {args.delay}s\n")
+
+    for mode in ("polling", "webhook"):
+        stub, url = start_stub_server(args.delay)
+        if mode == "polling":
+            released, acks = await replay_polling(stub, url, updates, args.rate, args.timeout)
+        else:
+            released, acks = await replay_webhook(stub, url, updates, args.rate, args.connections, args.timeout)
+        report(mode, stub, updates, released, acks)
+        stub.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
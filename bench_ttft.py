@@ -0,0 +1,69 @@
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+# Benchmark: time until the patient sees the first words of the reply,
+# /chat/async (whole answer at once) versus /chat/stream (SSE tokens).
+# Starts the Ollama app under uvicorn against the stub server unless --url is given.
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ.setdefault("TRIAGE_DB_NAME", os.path.join(_tmp.name, "ttft.db"))
+os.environ.setdefault("TRIAGE_CHATBOT_USERNAME", "bench")
+os.environ.setdefault("TRIAGE_CHATBOT_PASSWORD", "bench")
+
+import httpx  # noqa: E402
+
+
+def start_local_app(delay, port):
+    import uvicorn
+
+    import triageAI
+    from stub_llm_server import start_stub_server
+    from triage_backends import OllamaBackend, set_backend
+
+    stub, stub_url = start_stub_server(delay)
+    set_backend("ollama", OllamaBackend(url=f"{stub_url}/api/generate"))
+    triageAI.init_db()
+    server = uvicorn.Server(uvicorn.Config(triageAI.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+async def first_byte_ms(client, url, path, n):
+    payload = {"patient_id": "bench", "session_id": f"ttft-{path}-{n}", "user_input": "I have knee pain"}
+    auth = (os.environ["TRIAGE_CHATBOT_USERNAME"], os.environ["TRIAGE_CHATBOT_PASSWORD"])
+    start = time.perf_counter()
+    first = None
+    async with client.stream("POST", url + path, json=payload, auth=auth) as response:
+        async for line in response.aiter_lines():
+            if first is None and (line.startswith("data:") or line.startswith("{")):
+                first = (time.perf_counter() - start) * 1000
+    total = (time.perf_counter() - start) * 1000
+    return first or total, total
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Measure time to first token for /chat/async and /chat/stream.")
+    parser.add_argument("--url", help="existing server to benchmark instead of a local stub-backed app")
+    parser.add_argument("--delay", type=float, default=2.0, help="stub generation time in seconds")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--requests", type=int, default=10)
+    args = parser.parse_args()
+
+    url = args.url or start_local_app(args.delay, args.port)
+    async with httpx.AsyncClient(timeout=None) as client:
+        for path in ("/chat/async", "/chat/stream"):
+            samples = [await first_byte_ms(client, url, path, n) for n in range(args.requests)]
+            ttft = statistics.median(s[0] for s in samples)
+            total = statistics.median(s[1] for s in samples)
+            print(f"{path:<13} median time to first token: {ttft:8.1f} ms   median total: {total:8.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
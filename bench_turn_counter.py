@@ -0,0 +1,84 @@
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import triage_context_cache
+import triage_db
+
+# Benchmark: deciding a turn's prompt phase on the server. Compares counting the
+# session's rows in chat_memory (len(get_memory)) with the session_turns counter
+# (one primary-key lookup) and with get_question_count, which adds the turns
+# still in the journal, and what the extra counter upsert adds to save_memory. The database starts at
+# the schema before session_turns, so the run also times the backfill migration
+# and checks that every backfilled count matches chat_memory.
+
+BATCH = 50_000
+
+
+def populate(db_name, sessions, max_turns, rng):
+    conn = sqlite3.connect(db_name)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("CREATE TABLE chat_memory (id INTEGER PRIMARY KEY AUTOINCREMENT, patient_id TEXT, session_id TEXT, user_input TEXT, ai_response TEXT)")
+    conn.execute("CREATE INDEX idx_chat_memory_lookup ON chat_memory (patient_id, session_id, id)")
+    conn.execute("PRAGMA user_version=2")  # Schema as it was before the later tables
+    rows = [(f"p{n}", f"s{n}", f"answer {turn}", f"question {turn}")
+            for n in range(sessions) for turn in range(rng.randint(1, max_turns))]
+    rng.shuffle(rows)  # Sessions interleave in chat_memory as they do in production
+    for start in range(0, len(rows), BATCH):
+        conn.executemany(triage_db.INSERT_MEMORY_SQL, rows[start:start + BATCH])
+        conn.commit()
+    conn.close()
+    return len(rows)
+
+
+def median_us(fn, keys):
+    samples = []
+    for patient_id, session_id in keys:
+        start = time.perf_counter()
+        fn(patient_id, session_id)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time turn counting from history against the session_turns counter.")
+    parser.add_argument("--sessions", type=int, default=50_000)
+    parser.add_argument("--max-turns", type=int, default=8)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "turns.db")
+        rows = populate(db_name, args.sessions, args.max_turns, rng)
+        started = time.perf_counter()
+        triage_db.init_db(db_name)
+        print(f"{rows} chat_memory rows in {args.sessions} sessions; migration with backfill {time.perf_counter() - started:.2f} s\n")
+
+        conn = triage_db.get_connection(db_name)
+        mismatches = conn.execute("""
+            SELECT COUNT(*) FROM session_turns t
+            WHERE t.turns != (SELECT COUNT(*) FROM chat_memory m WHERE m.patient_id=t.patient_id AND m.session_id=t.session_id)
+        """).fetchone()[0]
+        print(f"backfilled counters that disagree with chat_memory: {mismatches}")
+
+        keys = [(f"p{n}", f"s{n}") for n in (rng.randrange(args.sessions) for _ in range(args.lookups))]
+        triage_db.DB_NAME = db_name  # get_question_count reads the default database
+        print(f"len(get_memory)      {median_us(lambda p, s: len(triage_db.get_memory(p, s, db_name)), keys):8.1f} us")
+        print(f"get_turn_count       {median_us(lambda p, s: triage_db.get_turn_count(p, s, db_name), keys):8.1f} us")
+        print(f"get_question_count   {median_us(triage_context_cache.get_question_count, keys):8.1f} us  (with the journal)")
+
+        insert_only = median_us(lambda p, s: triage_db.run_write(
+            lambda c: c.execute(triage_db.INSERT_MEMORY_SQL, (p, s, "answer", "question")), db_name), keys)
+        with_counter = median_us(lambda p, s: triage_db.save_memory(p, s, "answer", "question", db_name), keys)
+        print(f"\nsave: insert only {insert_only:.1f} us, insert + counter {with_counter:.1f} us")
+        triage_db.close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+# Benchmark: per-turn latency over one long session, with the whole conversation
+# in every prompt versus the token-budgeted window. The stub charges prefill time
+# per prompt token, like a real model, so a growing prompt shows up as a growing
+# turn latency. Ollama context reuse is off to isolate the prompt size.
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ.setdefault("TRIAGE_DB_NAME", os.path.join(_tmp.name, "window.db"))
+os.environ["TRIAGE_REUSE_OLLAMA_CONTEXT"] = "0"
+os.environ["TRIAGE_FIRST_TURN_CACHE"] = "0"
+
+import triageAI  # noqa: E402
+import triage_window  # noqa: E402
+from stub_llm_server import start_stub_server  # noqa: E402
+from triage_backends import OllamaBackend  # noqa: E402
+from triage_ollama_context import context_stats  # noqa: E402
+
+ANSWERS = [
+    "It started about three days ago after I carried some heavy boxes up the stairs at work",
+    "The pain is mostly on the left side of my lower back and sometimes goes into my hip",
+    "I would say it is around six out of ten most of the day and worse in the mornings",
+    "Ibuprofen helps a little for a few hours but then the pain comes back again",
+    "I had a similar episode two years ago that went away after a couple of weeks",
+]
+
+
+def run_session(backend, session_id, turns):
+    latencies, prompt_tokens = [], []
+    for n in range(turns):
+        user_input = f"{ANSWERS[n % len(ANSWERS)]} (turn {n + 1})"
+        started = time.perf_counter()
+        triageAI.determine_next_question("bench", session_id, user_input, 1 if n == 0 else 2, backend)
+        latencies.append((time.perf_counter() - started) * 1000)
+        prompt_tokens.append(context_stats()["last_prompt_tokens"])
+    return latencies, prompt_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-turn latency of a long session with and without the context window.")
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--budget", type=int, default=600, help="token budget for the windowed run")
+    parser.add_argument("--prefill", type=float, default=0.002, help="stub seconds per prompt token")
+    parser.add_argument("--delay", type=float, default=0.05, help="stub seconds per generation")
+    args = parser.parse_args()
+
+    triageAI.init_db()
+    stub, url = start_stub_server(delay=args.delay, prefill_per_token=args.prefill)
+    backend = OllamaBackend(url=f"{url}/api/generate")
+
+    results = {}
+    for label, budget in (("full history", 0), (f"window {args.budget}", args.budget)):
+        triage_window.CONTEXT_TOKEN_BUDGET = budget
+        results[label] = run_session(backend, f"window-{budget}", args.turns)
+
+    labels = list(results)
+    print(f"{'turn':>4} " + " ".join(f"{label + ' ms':>18} {'prompt words':>12}" for label in labels))
+    for n in range(0, args.turns, 5):
+        row = " ".join(f"{results[label][0][n]:>18.0f} {results[label][1][n]:>12}" for label in labels)
+        print(f"{n + 1:>4} {row}")
+    for label in labels:
+        latencies = results[label][0]
+        print(f"{label:<14} median turns 1-10: {statistics.median(latencies[:10]):6.0f} ms   "
+              f"turns {args.turns - 9}-{args.turns}: {statistics.median(latencies[-10:]):6.0f} ms")
+    print(f"summaries written: {triage_window.window_stats()['summaries']}")
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
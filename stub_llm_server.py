@@ -0,0 +1,240 @@
+import argparse
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+# Local stand-in for the LLM APIs, used by the benchmarks and load tests.
+# Every response is delayed by --delay seconds to mimic generation time, plus
+# --prefill seconds per prompt token on /api/generate to mimic prompt evaluation.
+# --jitter adds up to that many random extra seconds and --error-rate makes a share
+# of requests fail with HTTP 503, for exercising retries, failover and hedging.
+# /v1/completions takes a list of prompts like vLLM; each extra prompt adds
+# --batch-cost seconds, and --serialize lets only one generation run at a time
+# (one GPU), which is what makes batching pay off.
+# /chat stands in for the triage API itself (for the Telegram bot load tests): it
+# answers {"response": "Reply to: <user_input>"} after --delay seconds and records
+# the order requests arrived in and the peak number in flight.
+# /bot<token>/<method> is a minimal Telegram Bot API: getUpdates long-polls the
+# updates queued with server.push_updates(), sendMessage is recorded in
+# server.sent_messages, setWebhook/deleteWebhook just succeed.
+
+STUB_RESPONSE = "How long have you had this pain, and does anything make it better or worse?"
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real servers
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1  # New TCP connections; keep-alive clients reuse theirs
+
+    def chat(self, payload):
+        with self.server.lock:
+            self.server.chat_inflight += 1
+            self.server.max_chat_inflight = max(self.server.max_chat_inflight, self.server.chat_inflight)
+            self.server.chat_log.append((payload.get("session_id"), payload.get("user_input")))
+        try:
+            time.sleep(self.generation_time())
+        finally:
+            with self.server.lock:
+                self.server.chat_inflight -= 1
+        self.send_json(200, {"response": f"Reply to: {payload.get('user_input')}"})
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def start_chunked(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def write_chunk(self, text):
+        data = text.encode()
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def generation_time(self):
+        return self.server.delay + random.uniform(0, self.server.jitter)
+
+    def stream_tokens(self):
+        """Yield the stub response word by word, spreading the delay across the tokens."""
+        tokens = [word + " " for word in STUB_RESPONSE.split(" ")]
+        delay = self.generation_time()
+        for token in tokens:
+            time.sleep(delay / len(tokens))
+            yield token
+
+    def prefill(self, payload):
+        """Mimic Ollama's prompt evaluation: cost grows with the prompt, a passed-in context is free."""
+        prompt_tokens = len(payload.get("prompt", "").split())
+        time.sleep(prompt_tokens * self.server.prefill_per_token)
+        context = list(payload.get("context") or [])
+        context += range(len(context), len(context) + prompt_tokens + len(STUB_RESPONSE.split()))
+        return {
+            "context": context,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prompt_tokens * self.server.prefill_per_token * 1e9),
+        }
+
+    def telegram(self, method, params):
+        server = self.server
+        if method == "getUpdates":
+            offset = int(params.get("offset", 0))
+            deadline = time.monotonic() + float(params.get("timeout", 0))
+            with server.updates_ready:
+                while server.updates and server.updates[0]["update_id"] < offset:
+                    server.updates.popleft()  # Confirmed by the offset
+                while not server.updates and time.monotonic() < deadline:
+                    server.updates_ready.wait(deadline - time.monotonic())
+                result = list(server.updates)[:100]
+        elif method == "sendMessage":
+            with server.lock:
+                server.sent_messages.append((params.get("chat_id"), params.get("text"), time.perf_counter()))
+                result = {"message_id": len(server.sent_messages)}
+        else:
+            result = True
+        self.send_json(200, {"ok": True, "result": result})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path.startswith("/bot"):
+            self.telegram(url.path.rsplit("/", 1)[1], dict(parse_qsl(url.query)))
+        else:
+            self.send_json(404, {"error": f"unknown path {self.path}"})
+
+    def generate(self, seconds):
+        """Sleep for a generation; with --serialize, generations queue up behind each other."""
+        if self.server.gpu_lock is None:
+            time.sleep(seconds)
+            return
+        with self.server.gpu_lock:
+            time.sleep(seconds)
+
+    def do_POST(self):
+        payload = self.read_json()
+        stream = payload.get("stream", False)
+        self.server.requests += 1
+
+        if random.random() < self.server.error_rate:
+            time.sleep(self.generation_time() / 2)
+            self.send_json(503, {"error": "stub failure"})
+            return
+
+        if self.path.startswith("/bot"):
+            self.telegram(urlsplit(self.path).path.rsplit("/", 1)[1], payload)
+        elif self.path == "/chat":
+            self.chat(payload)
+        elif self.path == "/api/generate":
+            prefill = self.prefill(payload)
+            if stream:
+                self.start_chunked("application/x-ndjson")
+                for token in self.stream_tokens():
+                    self.write_chunk(json.dumps({"response": token, "done": False}) + "\n")
+                self.write_chunk(json.dumps({"response": "", "done": True, **prefill}) + "\n")
+                self.end_chunked()
+            else:
+                self.generate(self.generation_time())
+                self.send_json(200, {"model": payload.get("model"), "response": STUB_RESPONSE, "done": True, **prefill})
+        elif self.path == "/v1/chat/completions":
+            if stream:
+                self.start_chunked("text/event-stream")
+                for token in self.stream_tokens():
+                    chunk = {"choices": [{"index": 0, "delta": {"content": token}}]}
+                    self.write_chunk(f"data: {json.dumps(chunk)}\n\n")
+                self.write_chunk("data: [DONE]\n\n")
+                self.end_chunked()
+            else:
+                self.generate(self.generation_time())
+                message = {"role": "assistant", "content": STUB_RESPONSE}
+                self.send_json(200, {"model": payload.get("model"), "choices": [{"index": 0, "message": message}]})
+        elif self.path == "/v1/completions" and not stream:
+            prompts = payload.get("prompt", "")
+            prompts = prompts if isinstance(prompts, list) else [prompts]
+            self.generate(self.generation_time() + (len(prompts) - 1) * self.server.batch_cost)
+            self.server.batches.append(len(prompts))
+            choices = [{"index": i, "text": STUB_RESPONSE, "finish_reason": "stop"} for i in range(len(prompts))]
+            self.send_json(200, {"model": payload.get("model"), "choices": choices})
+        else:
+            self.send_json(404, {"error": f"unknown path {self.path}"})
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # Load tests open hundreds of connections at once
+
+    def handle_error(self, request, client_address):
+        # Cancelled hedges and timed-out clients hang up mid-response; that is expected here.
+        pass
+
+    def push_updates(self, updates):
+        """Queue Telegram updates for getUpdates."""
+        with self.updates_ready:
+            self.updates.extend(updates)
+            self.updates_ready.notify_all()
+
+
+def start_stub_server(delay=0.5, host="127.0.0.1", port=0, prefill_per_token=0.0, jitter=0.0, error_rate=0.0,
+                      batch_cost=0.0, serialize=False):
+    """Start a stub server in a background thread. Returns (server, base_url)."""
+    server = StubLLMServer((host, port), StubLLMHandler)
+    server.delay = delay
+    server.prefill_per_token = prefill_per_token
+    server.jitter = jitter
+    server.error_rate = error_rate
+    server.batch_cost = batch_cost
+    server.gpu_lock = threading.Lock() if serialize else None
+    server.requests = 0
+    server.batches = []  # Prompts per /v1/completions request
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.chat_log = []  # (session_id, user_input) per /chat request, in arrival order
+    server.chat_inflight = 0
+    server.max_chat_inflight = 0
+    server.updates = deque()  # Telegram updates not yet confirmed through getUpdates' offset
+    server.updates_ready = threading.Condition()
+    server.sent_messages = []  # (chat_id, text, perf_counter) per sendMessage
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local stub LLM server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--delay", type=float, default=0.5, help="seconds per generation")
+    parser.add_argument("--prefill", type=float, default=0.0, help="seconds per prompt token")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra random seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with HTTP 503")
+    parser.add_argument("--batch-cost", type=float, default=0.0, help="extra seconds per additional prompt in a batch")
+    parser.add_argument("--serialize", action="store_true", help="run one generation at a time, like a single GPU")
+    args = parser.parse_args()
+
+    server, url = start_stub_server(args.delay, args.host, args.port, args.prefill, args.jitter, args.error_rate,
+                                    args.batch_cost, args.serialize)
+    print(f"Stub LLM server listening on {url} (delay {args.delay}s)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
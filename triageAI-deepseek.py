@@ -1,74 +1,33 @@
-import re
-import sqlite3
-import requests
 import os
+from concurrent.futures import ThreadPoolExecutor
+from triage_backends import DeepSeekBackend, clean_ai_response
+from triage_context_cache import save_turn
+from triage_db import LEGACY_SESSION_ID, init_db
+from triage_journal import get_memory
+from triage_red_flags import screen_red_flags
 
 # DeepSeek API setup
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 DEEPSEEK_URL = "https://api.deepseek.com/chat/completions"
 MODEL = "deepseek-chat"
+llm = DeepSeekBackend(url=DEEPSEEK_URL, model=MODEL, api_key=DEEPSEEK_API_KEY)  # Pooled session with retries
 QUESTION_COUNTS = 10
-DB_NAME = "patient_memory.db"
 
-# Initialize database
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS chat_memory (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id TEXT,
-            user_input TEXT,
-            ai_response TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-# Save memory to the database
-def save_memory(patient_id, user_input, ai_response):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO chat_memory (patient_id, user_input, ai_response) VALUES (?, ?, ?)", 
-                   (patient_id, user_input, ai_response))
-    conn.commit()
-    conn.close()
-
-# Retrieve past conversation history
-def get_memory(patient_id):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_input, ai_response FROM chat_memory WHERE patient_id=? ORDER BY id ASC", 
-                   (patient_id,))
-    history = cursor.fetchall()
-    conn.close()
-    return history
-
-# Remove <think>...</think> sections from AI response
-def clean_ai_response(response):
-    return re.sub(r"<think>.*?</think>", "", response, flags=re.DOTALL).strip()
+# This CLI has no sessions: each patient's history is one continuing session in the shared database
+SESSION_ID = LEGACY_SESSION_ID
 
 # Generate AI response using DeepSeek API
 def get_ai_response(prompt, max_tokens=150):
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {DEEPSEEK_API_KEY}"
-    }
-    payload = {
-        "model": MODEL,
-        "messages": [
-            {"role": "system", "content": "You are a helpful medical AI assistant."},
-            {"role": "user", "content": prompt}
-        ],
-        "stream": False
-    }
-    response = requests.post(DEEPSEEK_URL, json=payload, headers=headers)
-    response_data = response.json()
-    return response_data["choices"][0]["message"]["content"].strip()
+    return llm.generate(prompt, max_tokens=max_tokens).text
 
 # Determine next follow-up question
 def determine_next_question(patient_id, user_input, question_count):
-    history = get_memory(patient_id)
+    emergency = screen_red_flags(user_input, patient_id)
+    if emergency:
+        save_turn(patient_id, SESSION_ID, user_input, emergency)
+        return emergency
+
+    history = get_memory(patient_id, SESSION_ID)
     
     if question_count == 0:
         prompt = (
@@ -77,7 +36,7 @@ def determine_next_question(patient_id, user_input, question_count):
             f"Based on this, ask ONLY ONE relevant follow-up question."
         )
     else:
-        conversation = "\n".join([f"You: {u}\nAI: {a}" for u, a in history])
+        conversation = format_history(history)
         prompt = (
             f"{conversation}\nYou: {user_input}\nAI: "
             f"Ask ONLY ONE relevant follow-up question to better assess the patient's condition."
@@ -85,13 +44,14 @@ def determine_next_question(patient_id, user_input, question_count):
     
     ai_response = get_ai_response(prompt, max_tokens=100)
     cleaned_response = clean_ai_response(ai_response)
-    save_memory(patient_id, user_input, cleaned_response)
+    save_turn(patient_id, SESSION_ID, user_input, cleaned_response)
     return cleaned_response
 
+def format_history(history):
+    return "\n".join([f"You: {u}\nAI: {a}" for u, a in history])
+
 # Provide advice and suggest a doctor appointment
-def provide_advice_and_appointment(patient_id):
-    history = get_memory(patient_id)
-    conversation = "\n".join([f"You: {u}\nAI: {a}" for u, a in history])
+def provide_advice_and_appointment(conversation):
     prompt = (
         "Based on the following conversation, provide a summary and advice to the patient. "
         "If symptoms indicate a serious condition, suggest setting up a doctor's appointment.\n"
@@ -100,15 +60,21 @@ def provide_advice_and_appointment(patient_id):
     return get_ai_response(prompt, max_tokens=200)
 
 # Generate summary report
-def generate_summary_report(patient_id):
-    history = get_memory(patient_id)
-    conversation = "\n".join([f"You: {u}\nAI: {a}" for u, a in history])
+def generate_summary_report(conversation):
     prompt = f"Create a detailed summary of the patient's responses and symptoms from the following conversation:\n{conversation}"
     return get_ai_response(prompt, max_tokens=300)
 
+# Final phase: history is read once and the summary report is generated while the advice is,
+# instead of two full generations back to back
+def final_phase(patient_id, executor):
+    """Returns the advice, and a future for the summary report."""
+    conversation = format_history(get_memory(patient_id, SESSION_ID))
+    summary = executor.submit(generate_summary_report, conversation)
+    return provide_advice_and_appointment(conversation), summary
+
 # Main chatbot loop
 def chatbot():
-    init_db()
+    init_db()  # Migrates databases this CLI created with its own chat_memory table (no session_id)
     patient_id = input("Enter patient ID (or name): ").strip()
     print("\nAI: Hello, I am your AI health assistant. What symptoms are you experiencing today?")
     user_input = input("You: ").strip()
@@ -116,10 +82,10 @@ def chatbot():
     question_count = 0
     while user_input.lower() not in ["exit", "quit"]:
         if question_count >= QUESTION_COUNTS:
-            ai_advice = provide_advice_and_appointment(patient_id)
-            print(f"AI: Here's some advice based on your symptoms: \n{ai_advice}")
-            ai_summary = generate_summary_report(patient_id)
-            print(f"AI: Here’s a summary report of your symptoms and responses: \n{ai_summary}")
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                ai_advice, ai_summary = final_phase(patient_id, executor)
+                print(f"AI: Here's some advice based on your symptoms: \n{ai_advice}")
+                print(f"AI: Here’s a summary report of your symptoms and responses: \n{ai_summary.result()}")
             break
         
         ai_reply = determine_next_question(patient_id, user_input, question_count)
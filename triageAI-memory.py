@@ -1,58 +1,18 @@
-import re
-import sqlite3
-import requests
+from triage_backends import LLMBackendError, OllamaBackend, clean_ai_response
+from triage_context_cache import get_conversation, save_turn
+from triage_db import LEGACY_SESSION_ID, init_db
+from triage_window import windowed_conversation
 
 # Ollama API URL
 OLLAMA_URL = "http://127.0.0.1:11434/api/generate"
+llm = OllamaBackend(url=OLLAMA_URL, model="deepseek-r1:8b")  # Change to your preferred model
 
-# Database setup
-DB_NAME = "patient_memory.db"
-
-# Initialize database
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS chat_memory (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id TEXT,
-            user_input TEXT,
-            ai_response TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-# Function to save memory to the database
-def save_memory(patient_id, user_input, ai_response):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO chat_memory (patient_id, user_input, ai_response) VALUES (?, ?, ?)", 
-                   (patient_id, user_input, ai_response))
-    conn.commit()
-    conn.close()
-
-# Function to retrieve past conversation history
-def get_memory(patient_id):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_input, ai_response FROM chat_memory WHERE patient_id=? ORDER BY id ASC", 
-                   (patient_id,))
-    history = cursor.fetchall()
-    conn.close()
-    return history
-
-# Function to remove <think>...</think> sections from AI response
-def clean_ai_response(response):
-    # Remove anything between <think>...</think> tags
-    cleaned_response = re.sub(r"<think>.*?</think>", "", response, flags=re.DOTALL).strip()
-    return cleaned_response
+# This CLI has no sessions: each patient's history is one continuing session in the shared database
+SESSION_ID = LEGACY_SESSION_ID
 
 # Function to determine the next follow-up question
 def determine_next_question(patient_id, user_input):
-    history = get_memory(patient_id)
-    
-    if not history:
+    if not get_conversation(patient_id, SESSION_ID):
         # First interaction: Set up initial prompt
         prompt = (
             f"You are an AI assistant to ask triage questions from a patient who is suffering from pain. "
@@ -60,36 +20,29 @@ def determine_next_question(patient_id, user_input):
             f"Based on this, ask ONLY ONE relevant follow-up question to better understand the patient's condition."
         )
     else:
-        # Fetch conversation history and generate only ONE follow-up question at a time
-        conversation = "\n".join([f"You: {u}\nAI: {a}" for u, a in history])
+        # Recent turns verbatim plus a summary of older ones, so long histories stay within the token budget
+        conversation = windowed_conversation(llm, patient_id, SESSION_ID)
         prompt = (
-            f"{conversation}\nYou: {user_input}\n"
+            f"{conversation}\nPatient: {user_input}\n"
             f"AI: Based on this response, ask ONLY ONE relevant follow-up question related to the patient's condition."
         )
 
-    # API request to Ollama
-    payload = {
-        "model": "deepseek-r1:8b",  # Change to your preferred model
-        "prompt": prompt,
-        "num_predict": 150,  # Limit to a short response to ensure one question at a time
-        "temperature": 0.7,
-        "stream": False
-    }
-
-    response = requests.post(OLLAMA_URL, json=payload)
-    ai_response = response.json().get("response", "").strip()
+    try:
+        ai_response = llm.generate(prompt, max_tokens=150).text  # Limit to a short response to ensure one question at a time
+    except LLMBackendError as e:
+        return f"Sorry, the AI model is unavailable ({e})."
 
     # Clean the response to remove any <think>...</think> sections
     cleaned_ai_response = clean_ai_response(ai_response)
 
     # Save memory with the cleaned response
-    save_memory(patient_id, user_input, cleaned_ai_response)
+    save_turn(patient_id, SESSION_ID, user_input, cleaned_ai_response)
 
     return cleaned_ai_response
 
 # Main chatbot loop
 def chatbot():
-    init_db()  # Ensure DB is initialized
+    init_db()  # Ensure DB is initialized (migrates databases created before session_id existed)
     patient_id = input("Enter patient ID (or name): ").strip()  # Unique ID for each patient
     
     print("\nAI: Hello, I am your AI health assistant. What symptoms are you experiencing today?")
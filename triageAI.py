@@ -1,152 +1,313 @@
-import re
-import sqlite3
-import requests
+import asyncio
+import time
+from typing import Optional
 from fastapi import FastAPI, HTTPException, Depends
-import uvicorn
-from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 import hashlib
 import os
+from triage_analytics import record_emergency
+from triage_archive import archive_stats
+from triage_auth import auth_stats, verify_credentials
+from triage_backends import LLMBackendError, aclose_backends, backend_stats, clean_ai_response, get_backend
+from triage_context_cache import cache_stats, get_conversation, get_question_count, get_session_conversation, save_turn
+from triage_db import init_db
+from triage_guidelines import format_passages, passages_for_conversation
+from triage_journal import journal_stats
+from triage_first_turn_cache import first_turn_cache_stats, get_first_question, store_first_question
+from triage_red_flags import screen_red_flags
+from triage_semantic_cache import get_similar_question, is_emergency, semantic_cache_stats, store_similar_question
+from triage_ollama_context import context_stats, drop_context, get_context, record_prefill, save_context
+from triage_streaming import ThinkStripper, record_failed_stream, record_stream, sse_event, stream_stats
+from triage_routes import router
+from triage_summary_report import EMERGENCY_PRIORITY, enqueue_report, report_stats
+from triage_window import CONTEXT_TOKEN_BUDGET, window_stats, windowed_conversation
 
-OLLAMA_URL = "http://127.0.0.1:11434/api/generate"
+REUSE_OLLAMA_CONTEXT = os.getenv("TRIAGE_REUSE_OLLAMA_CONTEXT", "1") == "1"  # Send back Ollama's context array between turns
+TELEGRAM_WEBHOOK = os.getenv("TRIAGE_TELEGRAM_WEBHOOK", "0") == "1"  # Serve the Telegram bot's webhook from this app
 app = FastAPI()
+app.include_router(router)  # Summary reports, export, analytics and the background workers (triage_routes.py)
 
-DB_NAME = "patient_memory.db"
-MODEL = "llama3.1:8b"
 QUESTION_COUNTS = 5
 
-# Define Username & Password (store securely in env variables or a database in production)
-VALID_USERNAME = os.getenv("TRIAGE_CHATBOT_USERNAME") 
-VALID_PASSWORD = os.getenv("TRIAGE_CHATBOT_PASSWORD")
-
-# Use HTTP Basic Authentication
-security = HTTPBasic()
-
-def verify_credentials(credentials: HTTPBasicCredentials = Depends(security)):
-    """Verify the provided username and password using Basic Auth."""
-    correct_username = hashlib.sha256(credentials.username.encode()).hexdigest() == hashlib.sha256(VALID_USERNAME.encode()).hexdigest()
-    correct_password = hashlib.sha256(credentials.password.encode()).hexdigest() == hashlib.sha256(VALID_PASSWORD.encode()).hexdigest()
-
-    if not (correct_username and correct_password):
-        raise HTTPException(status_code=401, detail="Invalid credentials")
-
-    return credentials.username  # Authenticated user
-
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS chat_memory (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id TEXT,
-            session_id TEXT,
-            user_input TEXT,
-            ai_response TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-def save_memory(patient_id, session_id, user_input, ai_response):
-    try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO chat_memory (patient_id, session_id, user_input, ai_response) VALUES (?, ?, ?, ?)", 
-                       (patient_id, session_id, user_input, ai_response))
-        conn.commit()
-    except sqlite3.Error as e:
-        print(f"Database error: {e}")
-    finally:
-        conn.close()
-
-def get_memory(patient_id, session_id):
-    try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute("SELECT user_input, ai_response FROM chat_memory WHERE patient_id=? AND session_id=? ORDER BY id ASC", 
-                       (patient_id, session_id))
-        history = cursor.fetchall()
-        return history
-    except sqlite3.Error as e:
-        print(f"Database Error: {e}")
-        return []
-    finally:
-        conn.close()
-
-def clean_ai_response(response):
-    return re.sub(r"<think>.*?</think>", "", response, flags=re.DOTALL).strip()
-
-def determine_next_question(patient_id, session_id, user_input, question_count):
-    """Determines the next relevant follow-up question for the patient based on chat history."""
-    history = get_memory(patient_id, session_id)
-    conversation = "\n".join([f"Patient: {u}\nAI: {a}" for u, a in history])
+FIRST_TURN_PROMPT = (
+    "You are an AI assistant conducting a **triage assessment** for a patient. "
+    "The patient said: '{user_input}'. "
+    "Ask only **one relevant** follow-up question in a **friendly and professional tone** to better understand their condition. "
+    "Keep the conversation natural, as if a doctor is speaking to the patient."
+)
+FOLLOW_UP_PROMPT = (
+    "Based on the symptoms so far, ask the **next relevant follow-up question** in a **conversational tone**. "
+    "Do not say 'Here is my next follow-up question', just **ask naturally** as a doctor would. "
+    "If symptoms indicate a **medical emergency** (such as severe chest pain, difficulty breathing, stroke symptoms), "
+    "IMMEDIATELY stop asking questions and tell the patient: 'This may be an emergency. Please call emergency services (911) or go to the nearest hospital immediately.'"
+)
+FINAL_ADVICE_PROMPT = (
+    "You have now gathered enough information. Based on all the patient's responses, provide a **clear final medical recommendation**. "
+    "Be **direct and professional**. Advise whether they should rest, visit urgent care, or consult a specialist. "
+    "If symptoms are life-threatening, remind them to **seek emergency care immediately.**"
+)
+
+def build_prompt(conversation, user_input, question_count, passages=None, markdown=True):
+    """Builds the prompt for the current phase of the triage. With markdown=False the instructions
+    carry no **bold** markup (backend.markdown_prompts; the OpenAI and Grok apps always sent them plain)."""
+    def style(instructions):
+        return instructions if markdown else instructions.replace("**", "")
 
     if question_count == 1:
-        prompt = (
-            f"You are an AI assistant conducting a **triage assessment** for a patient. "
-            f"The patient said: '{user_input}'. "
-            f"Ask only **one relevant** follow-up question in a **friendly and professional tone** to better understand their condition. "
-            f"Keep the conversation natural, as if a doctor is speaking to the patient."
-        )
+        return style(FIRST_TURN_PROMPT).format(user_input=user_input)
     elif question_count < QUESTION_COUNTS:
-        prompt = (
-            f"{conversation}\nPatient: {user_input}\n"
-            f"Based on the symptoms so far, ask the **next relevant follow-up question** in a **conversational tone**. "
-            f"Do not say 'Here is my next follow-up question', just **ask naturally** as a doctor would. "
-            f"If symptoms indicate a **medical emergency** (such as severe chest pain, difficulty breathing, stroke symptoms), "
-            f"IMMEDIATELY stop asking questions and tell the patient: 'This may be an emergency. Please call emergency services (911) or go to the nearest hospital immediately.'"
-        )
+        return f"{conversation}\nPatient: {user_input}\n{style(FOLLOW_UP_PROMPT)}"
     else:  # After 10 questions, AI must give final advice
-        prompt = (
-            f"{conversation}\nPatient: {user_input}\n"
-            f"You have now gathered enough information. Based on all the patient's responses, provide a **clear final medical recommendation**. "
-            f"Be **direct and professional**. Advise whether they should rest, visit urgent care, or consult a specialist. "
-            f"If symptoms are life-threatening, remind them to **seek emergency care immediately.**"
-        )
-
-    payload = {
-        "model": MODEL,
-        "prompt": prompt,
-        "num_predict": 150,  # Adjusted to allow longer advice
-        "temperature": 0.7,
-        "stream": False,
-    }
+        guidance = (
+            f"Relevant passages from clinical guidelines:\n{format_passages(passages)}\n"
+            f"Where a passage applies to this patient, base your recommendation on it and cite it by number. "
+        ) if passages else ""
+        return f"{conversation}\nPatient: {user_input}\n{guidance}{style(FINAL_ADVICE_PROMPT)}"
+
+# Part of the first-turn cache key: editing the first-turn prompt retires the questions cached for it
+FIRST_TURN_PROMPT_VERSION = hashlib.sha256(build_prompt("", "{user_input}", 1).encode()).hexdigest()[:12]
+
+def cacheable_turns(patient_id, session_id, user_input, question_count):
+    """The session's turns the response caches key on, or None when the turn must reach the model:
+    final advice, and any message that mentions emergency symptoms."""
+    if question_count >= QUESTION_COUNTS or is_emergency(user_input):
+        return None
+    return [] if question_count == 1 else get_session_conversation(patient_id, session_id).turns
+
+def cached_question(backend, patient_id, session_id, user_input, question_count):
+    """A cached follow-up question (exact first-turn match, then semantic match), or None."""
+    history = cacheable_turns(patient_id, session_id, user_input, question_count)
+    if history is None:
+        return None
+    if question_count == 1:
+        cached = get_first_question(backend, user_input, FIRST_TURN_PROMPT_VERSION)
+        if cached:
+            return cached
+    return get_similar_question(backend, history, user_input, question_count)
+
+def remember_question(backend, patient_id, session_id, user_input, question_count, question):
+    """Stores a fresh answer in the response caches. Must run before the turn is saved."""
+    history = cacheable_turns(patient_id, session_id, user_input, question_count)
+    if history is None or is_emergency(question):
+        return
+    if question_count == 1:
+        store_first_question(backend, user_input, FIRST_TURN_PROMPT_VERSION, question)
+    store_similar_question(backend, history, user_input, question_count, question)
+
+def prepare_prompt(backend, patient_id, session_id, user_input, question_count):
+    """Returns (prompt, context). With a stored Ollama context the earlier turns are already
+    encoded in it, so the prompt only carries the new patient message. A context that has
+    outgrown the token budget is dropped and the prompt is rebuilt from the windowed conversation."""
+    context = None
+    if REUSE_OLLAMA_CONTEXT and backend.supports_context and question_count > 1:
+        context = get_context(patient_id, session_id, backend.model)
+        if context and CONTEXT_TOKEN_BUDGET and len(context) > CONTEXT_TOKEN_BUDGET:
+            context = None
+    conversation = "" if context else windowed_conversation(backend, patient_id, session_id)
+    passages = None
+    if question_count >= QUESTION_COUNTS:  # Final advice is grounded in the guideline index
+        passages = passages_for_conversation(get_conversation(patient_id, session_id), user_input)
+    prompt = build_prompt(conversation, user_input, question_count, passages, markdown=backend.markdown_prompts)
+    return prompt.lstrip("\n"), context
+
+def queue_report(backend, patient_id, session_id, user_input, question_count, red_flag=None):
+    """A triage ends on a red flag or a final-phase turn; both queue the clinician summary report.
+    Final turns queue it before the advice is generated, so the two are written at the same time."""
+    if red_flag:
+        record_emergency(patient_id, session_id)
+        conversation = f"{get_conversation(patient_id, session_id)}\nPatient: {user_input}\nAI: {red_flag}"
+        enqueue_report(backend, patient_id, session_id, conversation, EMERGENCY_PRIORITY)
+    elif question_count >= QUESTION_COUNTS:
+        enqueue_report(backend, patient_id, session_id, f"{get_conversation(patient_id, session_id)}\nPatient: {user_input}")
+
+def finish_ollama_turn(backend, patient_id, session_id, result, context):
+    """Keeps the context Ollama returned for the next turn and records prefill timings."""
+    if not backend.supports_context:
+        return
+    if REUSE_OLLAMA_CONTEXT:
+        save_context(patient_id, session_id, backend.model, result.get("context"))
+    record_prefill(result, reused_context=bool(context))
+
+def determine_next_question(patient_id, session_id, user_input, question_count, backend=None):
+    """Determines the next relevant follow-up question for the patient based on chat history.
+    Red-flag messages get the emergency message without a model call."""
+    backend = backend or get_backend()
+    red_flag = screen_red_flags(user_input, session_id)
+    cached = red_flag or cached_question(backend, patient_id, session_id, user_input, question_count)
+    if cached:
+        if red_flag:
+            queue_report(backend, patient_id, session_id, user_input, question_count, red_flag)
+        drop_context(patient_id, session_id)  # The model did not see this turn
+        save_turn(patient_id, session_id, user_input, cached)
+        return cached
+    prompt, context = prepare_prompt(backend, patient_id, session_id, user_input, question_count)
+    queue_report(backend, patient_id, session_id, user_input, question_count)
+
+    try:
+        result = backend.generate(prompt, max_tokens=backend.reply_max_tokens, context=context)
+    except LLMBackendError as e:
+        raise HTTPException(status_code=500, detail=f"Error calling AI model: {e}")
+
+    finish_ollama_turn(backend, patient_id, session_id, result.raw, context)
+
+    cleaned_response = clean_ai_response(result.text)
+    remember_question(backend, patient_id, session_id, user_input, question_count, cleaned_response)
+    save_turn(patient_id, session_id, user_input, cleaned_response)
+    return cleaned_response
+
+@app.on_event("shutdown")
+async def close_backends():
+    await aclose_backends()
+
+async def determine_next_question_async(patient_id, session_id, user_input, question_count, backend=None):
+    """Async variant of determine_next_question: awaits the model and runs SQLite calls off the event loop."""
+    backend = backend or get_backend()
+    red_flag = screen_red_flags(user_input, session_id)
+    cached = red_flag or await asyncio.to_thread(cached_question, backend, patient_id, session_id, user_input, question_count)
+    if cached:
+        if red_flag:
+            await asyncio.to_thread(queue_report, backend, patient_id, session_id, user_input, question_count, red_flag)
+        await asyncio.to_thread(drop_context, patient_id, session_id)  # The model did not see this turn
+        await asyncio.to_thread(save_turn, patient_id, session_id, user_input, cached)
+        return cached
+    prompt, context = await asyncio.to_thread(prepare_prompt, backend, patient_id, session_id, user_input, question_count)
+    await asyncio.to_thread(queue_report, backend, patient_id, session_id, user_input, question_count)
 
     try:
-        response = requests.post(OLLAMA_URL, json=payload)
-        response.raise_for_status()
-        ai_response = response.json().get("response", "").strip()
-    except requests.RequestException as e:
+        result = await backend.agenerate(prompt, max_tokens=backend.reply_max_tokens, context=context)
+    except LLMBackendError as e:
         raise HTTPException(status_code=500, detail=f"Error calling AI model: {e}")
 
-    cleaned_response = clean_ai_response(ai_response)
-    save_memory(patient_id, session_id, user_input, cleaned_response)
+    await asyncio.to_thread(finish_ollama_turn, backend, patient_id, session_id, result.raw, context)
+
+    cleaned_response = clean_ai_response(result.text)
+    await asyncio.to_thread(remember_question, backend, patient_id, session_id, user_input, question_count, cleaned_response)
+    await asyncio.to_thread(save_turn, patient_id, session_id, user_input, cleaned_response)
     return cleaned_response
 
+async def stream_next_question(patient_id, session_id, user_input, question_count, backend=None):
+    """Streams the next question as SSE events while the model generates it, then saves the final text."""
+    backend = backend or get_backend()
+    started = time.perf_counter()
+    red_flag = screen_red_flags(user_input, session_id)
+    cached = red_flag or await asyncio.to_thread(cached_question, backend, patient_id, session_id, user_input, question_count)
+    if cached:
+        ttft_ms = (time.perf_counter() - started) * 1000
+        yield sse_event({"token": cached})
+        if red_flag:
+            await asyncio.to_thread(queue_report, backend, patient_id, session_id, user_input, question_count, red_flag)
+        await asyncio.to_thread(drop_context, patient_id, session_id)  # The model did not see this turn
+        await asyncio.to_thread(save_turn, patient_id, session_id, user_input, cached)
+        record_stream(ttft_ms, ttft_ms, answered_without_model=True)
+        yield sse_event({"response": cached, "ttft_ms": ttft_ms, "total_ms": ttft_ms, "cached": not red_flag, "red_flag": bool(red_flag)}, event="done")
+        return
+    prompt, context = await asyncio.to_thread(prepare_prompt, backend, patient_id, session_id, user_input, question_count)
+    await asyncio.to_thread(queue_report, backend, patient_id, session_id, user_input, question_count)
+    stripper = ThinkStripper()
+    ttft_ms = None
+
+    try:
+        async for raw_token, done, chunk in backend.astream(prompt, max_tokens=backend.reply_max_tokens, context=context):
+            token = stripper.feed(raw_token)
+            if token:
+                if ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - started) * 1000
+                yield sse_event({"token": token})
+            if done:
+                # Ollama's final chunk carries the context array and the prefill timings
+                await asyncio.to_thread(finish_ollama_turn, backend, patient_id, session_id, chunk, context)
+    except LLMBackendError as e:
+        record_failed_stream()
+        yield sse_event({"detail": f"Error calling AI model: {e}"}, event="error")
+        return
+
+    token = stripper.finish()
+    if token:
+        yield sse_event({"token": token})
+    total_ms = (time.perf_counter() - started) * 1000
+    record_stream(ttft_ms or total_ms, total_ms)
+
+    await asyncio.to_thread(remember_question, backend, patient_id, session_id, user_input, question_count, stripper.text)
+    await asyncio.to_thread(save_turn, patient_id, session_id, user_input, stripper.text)
+    yield sse_event({"response": stripper.text, "ttft_ms": ttft_ms, "total_ms": total_ms}, event="done")
 
 class ChatRequest(BaseModel):
     patient_id: str = Field(..., min_length=1, description="Patient ID must not be empty")
     session_id: str = Field(..., min_length=1, description="Session ID must not be empty")
     user_input: str = Field(..., min_length=1, description="User input must not be empty")
-    question_count: int = Field(..., ge=0, description="Question count must be a non-negative integer")
+    question_count: Optional[int] = Field(None, ge=0, description="Ignored: the server counts the session's turns itself")
+    backend: Optional[str] = Field(None, description="LLM backend for this turn (ollama, openai, grok, deepseek); defaults to TRIAGE_LLM_BACKEND")
 
-@app.post("/chat")
-def chat(request: ChatRequest, username: str = Depends(verify_credentials)):
-    # Validate request parameters
+def validate_chat_request(request: ChatRequest):
     if not request.patient_id.strip():
         raise HTTPException(status_code=400, detail="Patient ID cannot be empty.")
     if not request.session_id.strip():
         raise HTTPException(status_code=400, detail="Session ID cannot be empty.")
     if not request.user_input.strip():
         raise HTTPException(status_code=400, detail="User input cannot be empty.")
-    if request.question_count < 0:
-        raise HTTPException(status_code=400, detail="Question count must be non-negative.")
 
-    # Proceed with AI processing
-    ai_response = determine_next_question(request.patient_id, request.session_id, request.user_input.strip(), request.question_count)
+def resolve_backend(request: ChatRequest):
+    try:
+        return get_backend(request.backend)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/chat")
+def chat(request: ChatRequest, username: str = Depends(verify_credentials)):
+    validate_chat_request(request)
+    backend = resolve_backend(request)
+
+    # Proceed with AI processing; the phase comes from the session's saved turns, not the client
+    question_count = get_question_count(request.patient_id, request.session_id)
+    ai_response = determine_next_question(request.patient_id, request.session_id, request.user_input.strip(), question_count, backend)
+    return {"response": ai_response}
+
+@app.post("/chat/async")
+async def chat_async(request: ChatRequest, username: str = Depends(verify_credentials)):
+    """Same contract as /chat, but waiting on the model does not hold a threadpool worker."""
+    validate_chat_request(request)
+    backend = resolve_backend(request)
+
+    question_count = await asyncio.to_thread(get_question_count, request.patient_id, request.session_id)
+    ai_response = await determine_next_question_async(request.patient_id, request.session_id, request.user_input.strip(), question_count, backend)
     return {"response": ai_response}
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, username: str = Depends(verify_credentials)):
+    """Streams the follow-up question as Server-Sent Events: token events, then a final done event."""
+    validate_chat_request(request)
+    backend = resolve_backend(request)
+
+    question_count = await asyncio.to_thread(get_question_count, request.patient_id, request.session_id)
+    events = stream_next_question(request.patient_id, request.session_id, request.user_input.strip(), question_count, backend)
+    return StreamingResponse(events, media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/metrics")
+def metrics(username: str = Depends(verify_credentials)):
+    """In-process counters for the server's caches."""
+    return {
+        "context_cache": cache_stats(),
+        "journal": journal_stats(),
+        "archive": archive_stats(),
+        "first_turn_cache": first_turn_cache_stats(),
+        "semantic_cache": semantic_cache_stats(),
+        "ollama_context": context_stats(),
+        "context_window": window_stats(),
+        "streaming": stream_stats(),
+        "backends": backend_stats(),
+        "auth": auth_stats(),
+        "summary_reports": report_stats(),
+    }
+
+if TELEGRAM_WEBHOOK:
+    from triage_telegram_webhook import mount_webhook
+
+    mount_webhook(app)
+
 
 if __name__ == "__main__":
+    import uvicorn
+
     init_db()
     uvicorn.run(app, host="0.0.0.0", port=8000)
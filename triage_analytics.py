@@ -0,0 +1,78 @@
+import sqlite3
+import time
+
+from triage_db import get_connection, run_write
+
+# Dashboard counters over the triage history. Nothing here reads chat_memory:
+#
+#   daily_stats      per UTC day: sessions started, turns stored, sessions that hit a red flag
+#   session_lengths  turns-per-session histogram: how many sessions have exactly N turns
+#
+# insert_turn (triage_db) updates the first two in the same transaction as the
+# turn itself, so a turn replayed from the journal is never counted twice, and
+# record_emergency counts each session's first red flag. GET /analytics serves
+# them with two small reads, whatever the size of chat_memory. Turns stored
+# before chat_memory had created_at have no day: they are in session_lengths only.
+
+FLAG_SESSION_SQL = "INSERT OR IGNORE INTO flagged_sessions (patient_id, session_id, flagged_at) VALUES (?, ?, ?)"
+COUNT_EMERGENCY_SQL = """
+    INSERT INTO daily_stats (day, sessions, turns, emergencies) VALUES (?, 0, 0, 1)
+    ON CONFLICT (day) DO UPDATE SET emergencies=emergencies + 1
+"""
+SELECT_DAYS_SQL = "SELECT day, sessions, turns, emergencies FROM daily_stats WHERE day >= ? ORDER BY day"
+SELECT_LENGTHS_SQL = "SELECT turns, sessions FROM session_lengths WHERE sessions > 0 ORDER BY turns"
+
+
+def day_of(timestamp):
+    return time.strftime("%Y-%m-%d", time.gmtime(timestamp))
+
+
+def record_emergency(patient_id, session_id):
+    """Count a red flag for the day; a session is counted once however many of its turns hit one."""
+    now = time.time()
+
+    def flag(conn):
+        if conn.execute(FLAG_SESSION_SQL, (patient_id, session_id, now)).rowcount:
+            conn.execute(COUNT_EMERGENCY_SQL, (day_of(now),))
+
+    try:
+        run_write(flag)
+        return True
+    except sqlite3.Error as e:
+        print(f"Database Error (record_emergency): {e}")
+        return False
+
+
+def daily_counts(days=30):
+    """The last `days` UTC days that have activity, oldest first, with derived rates."""
+    since = day_of(time.time() - (days - 1) * 86400)
+    rows = get_connection().execute(SELECT_DAYS_SQL, (since,)).fetchall()
+    return [{"day": day, "sessions": sessions, "turns": turns, "emergencies": emergencies,
+             "turns_per_session": turns / sessions if sessions else 0.0,
+             "emergency_rate": emergencies / sessions if sessions else 0.0}
+            for day, sessions, turns, emergencies in rows]
+
+
+def session_length_histogram():
+    """{turns: sessions with that many turns} over every session stored."""
+    return dict(get_connection().execute(SELECT_LENGTHS_SQL).fetchall())
+
+
+def analytics_summary(days=30):
+    """What GET /analytics returns: per-day counters, their totals and the turns-per-session histogram."""
+    per_day = daily_counts(days)
+    sessions = sum(d["sessions"] for d in per_day)
+    turns = sum(d["turns"] for d in per_day)
+    emergencies = sum(d["emergencies"] for d in per_day)
+    histogram = session_length_histogram()
+    all_sessions = sum(histogram.values())
+    return {
+        "days": per_day,
+        "totals": {"sessions": sessions, "turns": turns, "emergencies": emergencies,
+                   "turns_per_session": turns / sessions if sessions else 0.0,
+                   "emergency_rate": emergencies / sessions if sessions else 0.0},
+        "turns_per_session": {
+            "histogram": histogram,
+            "mean": sum(n * count for n, count in histogram.items()) / all_sessions if all_sessions else 0.0,
+        },
+    }
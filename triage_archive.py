@@ -0,0 +1,285 @@
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+import triage_db
+from triage_db import get_connection, run_write
+
+# Retention for chat_memory. Sessions with no turn for TRIAGE_ARCHIVE_AFTER_DAYS
+# move out of SQLite into compressed, date-partitioned cold storage:
+#
+#   <TRIAGE_ARCHIVE_DIR>/date=YYYY-MM-DD/chat_memory.jsonl.zst   (.jsonl.gz without zstandard)
+#
+# partitioned by the day of the session's last turn. Each session is one JSON
+# line compressed as its own zstd frame / gzip member, appended to the file, so
+# a file is still an ordinary stream (zstdcat/zcat) while one session can be read
+# back by seeking to it. archived_sessions records each session's file, offset
+# and length, which makes the read-through one primary-key lookup plus one small
+# read: get_memory (triage_journal) puts the archived turns in front of the hot
+# ones, so an archived session that gets a new turn still sees its whole history.
+# Archiving it again rewrites it as one entry; the old one is left as garbage.
+# Entries are appended while the batch's transaction holds the write lock and
+# the files are cut back to their old length if it does not commit, so a failed
+# or retried batch leaves no entries behind.
+#
+# Deleted rows are handed back to the filesystem by compact(): databases in
+# auto_vacuum=INCREMENTAL mode (new ones, see triage_db) release free pages a
+# step at a time; an older file is converted with one full VACUUM once enough of
+# it is free. Both run on a schedule in the servers and from the command line:
+#
+#   python triage_archive.py archive [--days N]   move idle sessions, compact, report sizes
+#   python triage_archive.py compact [--full]
+#   python triage_archive.py report
+#
+# TRIAGE_ARCHIVE_AFTER_DAYS=0 turns the scheduled archiving off.
+
+ARCHIVE_AFTER_DAYS = float(os.getenv("TRIAGE_ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_DIR = os.getenv("TRIAGE_ARCHIVE_DIR")  # Default: <database>-archive next to the database
+ARCHIVE_INTERVAL = float(os.getenv("TRIAGE_ARCHIVE_INTERVAL", "3600"))  # Seconds between scheduled runs
+ARCHIVE_BATCH = 200  # Sessions moved per transaction
+COMPRESSION_LEVEL = 9
+VACUUM_STEP_PAGES = 1000  # Pages released per incremental_vacuum transaction
+FULL_VACUUM_FREE_RATIO = 0.25  # Convert a non-incremental file once this share of its pages is free
+AUTO_VACUUM_INCREMENTAL = 2
+
+IDLE_SESSIONS_SQL = """
+    SELECT patient_id, session_id, updated_at FROM session_turns
+    WHERE turns > archived_turns AND updated_at < ? ORDER BY updated_at LIMIT ?
+"""
+SELECT_HOT_TURNS_SQL = "SELECT id, user_input, ai_response, created_at FROM chat_memory WHERE patient_id=? AND session_id=? ORDER BY id ASC"
+SELECT_ARCHIVED_SQL = "SELECT path, offset, length FROM archived_sessions WHERE patient_id=? AND session_id=?"
+UPSERT_ARCHIVED_SQL = """
+    INSERT INTO archived_sessions (patient_id, session_id, path, offset, length, turns, last_turn_at, archived_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (patient_id, session_id) DO UPDATE SET path=excluded.path, offset=excluded.offset,
+        length=excluded.length, turns=excluded.turns, last_turn_at=excluded.last_turn_at, archived_at=excluded.archived_at
+"""
+DELETE_HOT_TURNS_SQL = "DELETE FROM chat_memory WHERE patient_id=? AND session_id=? AND id <= ?"
+MARK_ARCHIVED_SQL = "UPDATE session_turns SET archived_turns=turns WHERE patient_id=? AND session_id=?"
+
+_lock = threading.Lock()
+_stats = {"runs": 0, "archived_sessions": 0, "archived_turns": 0, "freed_pages": 0, "last_run_ms": 0.0, "reads": 0}
+_scheduler = None
+
+
+def archive_directory(db_name=None):
+    return ARCHIVE_DIR or f"{db_name or triage_db.DB_NAME}-archive"
+
+
+def _compressor():
+    """(file extension, compress function): zstd when zstandard is installed, gzip otherwise."""
+    try:
+        import zstandard
+    except ImportError:
+        return ".jsonl.gz", lambda data: gzip.compress(data, COMPRESSION_LEVEL)
+    return ".jsonl.zst", zstandard.ZstdCompressor(level=COMPRESSION_LEVEL).compress
+
+
+def _decompress(path, data):
+    if path.endswith(".zst"):
+        import zstandard  # Reading a .zst partition needs zstandard, whatever this process writes
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def _read_entry(directory, path, offset, length):
+    with open(os.path.join(directory, path), "rb") as f:
+        f.seek(offset)
+        return json.loads(_decompress(path, f.read(length)))
+
+
+def archived_turns(patient_id, session_id, db_name=None):
+    """The session's turns in cold storage as (user_input, ai_response), oldest first. [] if it has none."""
+    try:
+        row = get_connection(db_name).execute(SELECT_ARCHIVED_SQL, (patient_id, session_id)).fetchone()
+    except sqlite3.Error as e:
+        print(f"Database Error (archived_turns): {e}")
+        return []
+    if row is None:
+        return []
+    try:
+        entry = _read_entry(archive_directory(db_name), *row)
+    except (OSError, ValueError, ImportError) as e:
+        print(f"Archive Error (archived_turns {row[0]}): {e}")
+        return []
+    with _lock:
+        _stats["reads"] += 1
+    return [(u, a) for u, a, _ in entry["turns"]]
+
+
+def _archive_batch(conn, cutoff, directory, extension, compress):
+    conn.execute("BEGIN IMMEDIATE")  # Holds off other archivers and turn writes while the batch moves
+    sessions = conn.execute(IDLE_SESSIONS_SQL, (cutoff, ARCHIVE_BATCH)).fetchall()
+    files, starts, moved_turns = {}, {}, 0
+    try:
+        for patient_id, session_id, last_turn_at in sessions:
+            rows = conn.execute(SELECT_HOT_TURNS_SQL, (patient_id, session_id)).fetchall()
+            conn.execute(MARK_ARCHIVED_SQL, (patient_id, session_id))
+            if not rows:
+                continue
+            turns = [[u, a, created_at] for _, u, a, created_at in rows]
+            previous = conn.execute(SELECT_ARCHIVED_SQL, (patient_id, session_id)).fetchone()
+            if previous:  # Archived before and resumed since: one entry with the whole session
+                turns = _read_entry(directory, *previous)["turns"] + turns
+            entry = {"patient_id": patient_id, "session_id": session_id, "last_turn_at": last_turn_at, "turns": turns}
+
+            day = datetime.fromtimestamp(last_turn_at, timezone.utc).strftime("%Y-%m-%d")
+            path = os.path.join(f"date={day}", f"chat_memory{extension}")
+            f = files.get(path)
+            if f is None:
+                os.makedirs(os.path.join(directory, f"date={day}"), exist_ok=True)
+                f = files[path] = open(os.path.join(directory, path), "ab")
+                starts[path] = f.seek(0, os.SEEK_END)
+            data = compress(json.dumps(entry).encode("utf-8"))
+            offset = f.seek(0, os.SEEK_END)
+            f.write(data)
+
+            conn.execute(UPSERT_ARCHIVED_SQL, (patient_id, session_id, path, offset, len(data), len(turns), last_turn_at, time.time()))
+            conn.execute(DELETE_HOT_TURNS_SQL, (patient_id, session_id, rows[-1][0]))
+            moved_turns += len(rows)
+        for f in files.values():  # On disk before the rows they replace are deleted
+            f.flush()
+            os.fsync(f.fileno())
+        conn.commit()  # Here rather than in run_write, so a failed commit still truncates below
+    except BaseException:
+        for path, f in files.items():  # Still holding the write lock: no other archiver has appended since
+            f.truncate(starts[path])
+            f.flush()
+            os.fsync(f.fileno())
+        raise
+    finally:
+        for f in files.values():
+            f.close()
+    return len(sessions), moved_turns
+
+
+def archive_sessions(older_than_days=ARCHIVE_AFTER_DAYS, db_name=None):
+    """Move sessions idle for older_than_days into cold storage. Returns (sessions, turns) moved."""
+    started = time.perf_counter()
+    cutoff = time.time() - older_than_days * 86400
+    directory = archive_directory(db_name)
+    extension, compress = _compressor()
+    sessions = turns = 0
+    while True:
+        moved_sessions, moved_turns = run_write(lambda conn: _archive_batch(conn, cutoff, directory, extension, compress), db_name)
+        sessions += moved_sessions
+        turns += moved_turns
+        if moved_sessions < ARCHIVE_BATCH:
+            break
+    with _lock:
+        _stats["runs"] += 1
+        _stats["archived_sessions"] += sessions
+        _stats["archived_turns"] += turns
+        _stats["last_run_ms"] = (time.perf_counter() - started) * 1000
+    return sessions, turns
+
+
+def _page_counts(conn):
+    return conn.execute("PRAGMA page_count").fetchone()[0], conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def compact(db_name=None, full=False):
+    """Hand free pages back to the filesystem. Returns the number of pages released."""
+    conn = get_connection(db_name)
+    pages, free = _page_counts(conn)
+    incremental = conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL
+    if full or (not incremental and free and free >= pages * FULL_VACUUM_FREE_RATIO):
+        # Rewrites the whole file and blocks writers while it runs; afterwards the file vacuums incrementally.
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+    elif incremental:
+        for _ in range(free // VACUUM_STEP_PAGES + 1):  # Short steps, so turn writes are not held up
+            run_write(lambda c: c.execute(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})").fetchall(), db_name)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")  # The file only shrinks once the WAL is checkpointed
+    released = pages - _page_counts(conn)[0]
+    with _lock:
+        _stats["freed_pages"] += released
+    return released
+
+
+def _run_scheduled():
+    while True:
+        try:
+            archive_sessions()
+            compact()
+        except (sqlite3.Error, OSError) as e:
+            print(f"Archive Error (scheduled run): {e}")
+        time.sleep(ARCHIVE_INTERVAL)
+
+
+def start_archiver():
+    """Archive and compact every TRIAGE_ARCHIVE_INTERVAL seconds in a background thread, once per process."""
+    global _scheduler
+    with _lock:
+        if _scheduler is not None or not ARCHIVE_AFTER_DAYS:
+            return
+        _scheduler = threading.Thread(target=_run_scheduled, name="archiver", daemon=True)
+        _scheduler.start()
+
+
+def storage_report(db_name=None):
+    """Sizes of the hot database and of cold storage."""
+    db_name = db_name or triage_db.DB_NAME
+    conn = get_connection(db_name)
+    pages, free = _page_counts(conn)
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    directory = archive_directory(db_name)
+    archive_bytes = sum(os.path.getsize(os.path.join(root, name))
+                        for root, _, names in os.walk(directory) for name in names)
+    return {
+        "db_bytes": pages * page_size,
+        "free_bytes": free * page_size,
+        "wal_bytes": os.path.getsize(f"{db_name}-wal") if os.path.exists(f"{db_name}-wal") else 0,
+        "auto_vacuum": ("none", "full", "incremental")[conn.execute("PRAGMA auto_vacuum").fetchone()[0]],
+        "hot_turns": conn.execute("SELECT COUNT(*) FROM chat_memory").fetchone()[0],
+        "archived_sessions": conn.execute("SELECT COUNT(*) FROM archived_sessions").fetchone()[0],
+        "archive_bytes": archive_bytes,
+    }
+
+
+def archive_stats():
+    with _lock:
+        stats = dict(_stats)
+    stats["after_days"] = ARCHIVE_AFTER_DAYS
+    return stats
+
+
+def _print_report(label, report):
+    print(f"{label}: database {report['db_bytes'] / 1e6:.1f} MB ({report['free_bytes'] / 1e6:.1f} MB free, "
+          f"WAL {report['wal_bytes'] / 1e6:.1f} MB, auto_vacuum {report['auto_vacuum']}), {report['hot_turns']} hot turns; "
+          f"{report['archived_sessions']} sessions in cold storage, {report['archive_bytes'] / 1e6:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive idle sessions to cold storage and compact the database.")
+    parser.add_argument("--db", default=triage_db.DB_NAME)
+    commands = parser.add_subparsers(dest="command", required=True)
+    archive_parser = commands.add_parser("archive", help="move idle sessions to cold storage, then compact")
+    archive_parser.add_argument("--days", type=float, default=ARCHIVE_AFTER_DAYS or 30, help="idle days before a session moves")
+    compact_parser = commands.add_parser("compact", help="release free pages")
+    compact_parser.add_argument("--full", action="store_true", help="rewrite the file with VACUUM")
+    commands.add_parser("report", help="print database and cold storage sizes")
+    args = parser.parse_args()
+
+    triage_db.init_db(args.db)
+    if args.command == "report":
+        _print_report("now", storage_report(args.db))
+        return
+    _print_report("before", storage_report(args.db))
+    if args.command == "archive":
+        started = time.perf_counter()
+        sessions, turns = archive_sessions(args.days, args.db)
+        print(f"archived {sessions} sessions ({turns} turns) in {time.perf_counter() - started:.2f} s")
+    started = time.perf_counter()
+    released = compact(args.db, full=getattr(args, "full", False))
+    print(f"compacted in {time.perf_counter() - started:.2f} s, {released} pages released")
+    _print_report("after", storage_report(args.db))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+from collections import namedtuple
+from typing import Optional
+
+from fastapi import Depends, HTTPException, Request
+from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from fastapi.security.utils import get_authorization_scheme_param
+
+from triage_cache import LRUTTLCache
+
+# Request authentication for the triage API servers.
+#
+# Clients come from two places:
+#   - TRIAGE_CHATBOT_USERNAME / TRIAGE_CHATBOT_PASSWORD, the single client the
+#     servers always had. Their SHA-256 digests are computed once at startup, so
+#     a request hashes only what it presents, and digests are compared in
+#     constant time (hmac.compare_digest) instead of with ==.
+#   - TRIAGE_CREDENTIALS_FILE, a JSON file with any number of API clients:
+#         {"clients": [{"name": "telegram-bot", "password": "pbkdf2_sha256$..."},
+#                      {"name": "clinic-portal", "token": "pbkdf2_sha256$..."}]}
+#     Secrets are stored as salted PBKDF2 hashes. Add a client with
+#         python triage_auth.py add-client NAME [--token]
+#     which prints the new secret once.
+#
+# PBKDF2 is deliberately slow (tens of ms), so credentials that verified are kept
+# in an LRU keyed by a SHA-256 of what was presented; repeat requests from a
+# client cost one hash and a lookup. Failed attempts are never cached.
+#
+# With TRIAGE_AUTH_BEARER=1, "Authorization: Bearer <token>" is accepted as well,
+# and so is the bare token the Telegram bots send ("Authorization: <token>").
+# Tokens have the form <client name>.<secret>.
+
+CREDENTIALS_FILE = os.getenv("TRIAGE_CREDENTIALS_FILE")
+BEARER_AUTH = os.getenv("TRIAGE_AUTH_BEARER", "0") == "1"
+AUTH_CACHE_SIZE = int(os.getenv("TRIAGE_AUTH_CACHE_SIZE", "1024"))
+AUTH_CACHE_TTL = float(os.getenv("TRIAGE_AUTH_CACHE_TTL", "600"))  # Seconds before a cached credential is checked again
+PBKDF2_ITERATIONS = 100000
+HASH_SCHEME = "pbkdf2_sha256"
+
+Client = namedtuple("Client", ["name", "password", "token"])
+
+
+def sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+def hash_secret(secret, iterations=PBKDF2_ITERATIONS):
+    """Encode a secret for the credentials file as pbkdf2_sha256$<iterations>$<salt>$<hash>."""
+    salt = secrets.token_hex(16)
+    digest = hashlib.pbkdf2_hmac("sha256", secret.encode("utf-8"), bytes.fromhex(salt), iterations)
+    return f"{HASH_SCHEME}${iterations}${salt}${digest.hex()}"
+
+
+def check_secret(secret, encoded):
+    try:
+        scheme, iterations, salt, expected = encoded.split("$")
+        if scheme != HASH_SCHEME:
+            return False
+        digest = hashlib.pbkdf2_hmac("sha256", secret.encode("utf-8"), bytes.fromhex(salt), int(iterations))
+        return hmac.compare_digest(digest, bytes.fromhex(expected))
+    except ValueError:
+        return False
+
+
+def load_credentials(path):
+    """Clients from a credentials file, keyed by name."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {entry["name"]: Client(entry["name"], entry.get("password"), entry.get("token")) for entry in data["clients"]}
+
+
+class Authenticator:
+    def __init__(self, username=None, password=None, clients=None, cache_size=AUTH_CACHE_SIZE, cache_ttl=AUTH_CACHE_TTL):
+        # The environment client, as digests computed once
+        self.username = username
+        self._username_digest = sha256(username) if username and password else None
+        self._password_digest = sha256(password) if username and password else None
+        self.clients = clients or {}
+        self._verified = LRUTTLCache(max_entries=cache_size, ttl=cache_ttl)
+        self._lock = threading.Lock()
+        self.failures = 0
+
+    def _failed(self):
+        with self._lock:
+            self.failures += 1
+
+    def _check_cached(self, kind, name, secret, encoded):
+        key = sha256(f"{kind}\0{name}\0{secret}")
+        if self._verified.get(key) == name:
+            return name
+        if encoded and check_secret(secret, encoded):
+            self._verified.set(key, name)
+            return name
+        return None
+
+    def verify_basic(self, username, password):
+        """Name of the client these Basic credentials belong to, or None."""
+        if self._username_digest is not None:
+            # Both digests are always compared so a wrong username takes as long as a wrong password
+            username_ok = hmac.compare_digest(sha256(username), self._username_digest)
+            password_ok = hmac.compare_digest(sha256(password), self._password_digest)
+            if username_ok and password_ok:
+                return self.username
+        client = self.clients.get(username)
+        name = self._check_cached("password", username, password, client.password if client else None)
+        if name is None:
+            self._failed()
+        return name
+
+    def verify_token(self, token):
+        """Name of the client a bearer token belongs to, or None."""
+        name, _, secret = token.rpartition(".")
+        client = self.clients.get(name)
+        name = self._check_cached("token", name, secret, client.token if client else None) if secret else None
+        if name is None:
+            self._failed()
+        return name
+
+    def stats(self):
+        return {
+            "clients": len(self.clients) + (1 if self._username_digest is not None else 0),
+            "bearer": BEARER_AUTH,
+            "failures": self.failures,
+            "verified_cache": self._verified.stats(),
+        }
+
+
+_authenticator = None
+_authenticator_lock = threading.Lock()
+
+
+def get_authenticator():
+    """The process-wide Authenticator, built from the environment and TRIAGE_CREDENTIALS_FILE on first use."""
+    global _authenticator
+    if _authenticator is None:
+        with _authenticator_lock:
+            if _authenticator is None:
+                clients = load_credentials(CREDENTIALS_FILE) if CREDENTIALS_FILE else {}
+                _authenticator = Authenticator(os.getenv("TRIAGE_CHATBOT_USERNAME"), os.getenv("TRIAGE_CHATBOT_PASSWORD"), clients)
+    return _authenticator
+
+
+_basic = HTTPBasic(auto_error=False)
+
+
+def presented_token(authorization):
+    """The token from "Bearer <token>" or a bare "<token>" header value, or None."""
+    scheme, param = get_authorization_scheme_param(authorization)
+    if scheme.lower() == "bearer":
+        return param or None
+    return scheme if scheme and not param else None
+
+
+def verify_credentials(request: Request, credentials: Optional[HTTPBasicCredentials] = Depends(_basic)):
+    """FastAPI dependency: the authenticated client's name. Raises 401 otherwise."""
+    authenticator = get_authenticator()
+    name = None
+    if credentials is not None:
+        name = authenticator.verify_basic(credentials.username, credentials.password)
+    elif BEARER_AUTH:
+        token = presented_token(request.headers.get("Authorization"))
+        name = authenticator.verify_token(token) if token else None
+    if name is None:
+        raise HTTPException(status_code=401, detail="Invalid credentials", headers={"WWW-Authenticate": "Basic"})
+    return name
+
+
+def auth_stats():
+    return get_authenticator().stats()
+
+
+def add_client(path, name, token=False):
+    """Add (or replace) a client in the credentials file and return its new secret."""
+    if "." in name or not name:
+        raise ValueError("Client names must be non-empty and must not contain '.'")
+    data = {"clients": []}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    secret = secrets.token_urlsafe(32)
+    entry = {"name": name, "token": hash_secret(secret)} if token else {"name": name, "password": hash_secret(secret)}
+    data["clients"] = [client for client in data["clients"] if client["name"] != name] + [entry]
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(temporary, path)
+    return f"{name}.{secret}" if token else secret
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage API clients in the credentials file.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add-client", help="add a client, or issue a new secret for an existing one")
+    add.add_argument("name")
+    add.add_argument("--token", action="store_true", help="issue a bearer token instead of a Basic auth password")
+    add.add_argument("--file", default=CREDENTIALS_FILE or "triage_credentials.json")
+    args = parser.parse_args()
+
+    if args.command == "add-client":
+        secret = add_client(args.file, args.name, args.token)
+        kind = "token" if args.token else f"password for user '{args.name}'"
+        print(f"Added {args.name} to {args.file}. Its {kind} (shown once):\n{secret}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,418 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# LLM backends behind one interface. Every backend keeps a pooled requests.Session
+# (and an httpx.AsyncClient for the async variants), applies timeouts and retries
+# connection errors, timeouts, 429 and 5xx responses with exponential backoff.
+#
+#   backend = get_backend("ollama")          # or TRIAGE_LLM_BACKEND / per request
+#   result = backend.generate(prompt, max_tokens=150)
+#   result = await backend.agenerate(prompt)
+#   for token, done, chunk in backend.stream(prompt): ...
+
+DEFAULT_BACKEND = os.getenv("TRIAGE_LLM_BACKEND", "ollama")
+REQUEST_TIMEOUT = float(os.getenv("TRIAGE_LLM_TIMEOUT", "120"))  # Seconds to wait for a generation
+CONNECT_TIMEOUT = 5.0
+MAX_RETRIES = int(os.getenv("TRIAGE_LLM_RETRIES", "2"))  # Extra attempts after the first one
+RETRY_BACKOFF = 0.5  # Seconds, doubled on every retry
+POOL_SIZE = int(os.getenv("TRIAGE_LLM_POOL_SIZE", "100"))  # Keep-alive connections per backend
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+THINK_BLOCK = re.compile(r"<think>.*?</think>", re.DOTALL)  # Reasoning models (deepseek-r1) think out loud first
+
+
+class LLMBackendError(Exception):
+    """Raised when a backend call fails after all retries."""
+
+    def __init__(self, backend, message):
+        super().__init__(f"{backend}: {message}")
+        self.backend = backend
+
+
+class _RetryableStatus(Exception):
+    pass
+
+
+def clean_ai_response(text):
+    """Model output without its <think>...</think> sections. triage_streaming.ThinkStripper does this per token."""
+    return THINK_BLOCK.sub("", text).strip()
+
+
+class LLMResult:
+    def __init__(self, text, backend, raw=None, context=None):
+        self.text = text
+        self.backend = backend
+        self.raw = raw or {}
+        self.context = context  # Ollama only: token array to send back with the next turn
+
+
+class LLMBackend:
+    """Base class. Subclasses describe their wire format; transport, pooling and retries live here."""
+
+    name = None
+    default_url = None
+    default_model = None
+    api_key_env = None
+    supports_context = False
+    supports_batching = False  # True if generate_batch sends one request for many prompts
+    reply_max_tokens = 150  # Tokens the triage asks for per reply
+    markdown_prompts = True  # False: the triage prompts are sent without **bold** markup
+
+    def __init__(self, url=None, model=None, api_key=None, timeout=REQUEST_TIMEOUT, retries=MAX_RETRIES,
+                 backoff=RETRY_BACKOFF, pool_size=POOL_SIZE):
+        self.url = url or self.default_url
+        self.model = model or self.default_model
+        self.api_key = api_key or (os.getenv(self.api_key_env) if self.api_key_env else None)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self._session = None
+        self._async_client = None
+        self._lock = threading.Lock()
+
+    # Wire format, implemented by subclasses
+    def build_payload(self, prompt, system, max_tokens, temperature, context, stream):
+        raise NotImplementedError
+
+    def parse_response(self, data):
+        raise NotImplementedError
+
+    def parse_stream_line(self, line):
+        """Return (token, done, chunk) for one line of a streamed response, or None to skip it."""
+        raise NotImplementedError
+
+    def headers(self):
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    # Transport
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+
+    def get_async_client(self):
+        if self._async_client is None:
+            import httpx
+
+            self._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+        return self._async_client
+
+    def retry_delay(self, attempt):
+        return self.backoff * (2 ** attempt) * random.uniform(0.8, 1.2)
+
+    def generate(self, prompt, system=None, max_tokens=150, temperature=0.7, context=None):
+        payload = self.build_payload(prompt, system, max_tokens, temperature, context, stream=False)
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.post(self.url, json=payload, headers=self.headers(),
+                                             timeout=(CONNECT_TIMEOUT, self.timeout))
+                if response.status_code in RETRY_STATUS_CODES:
+                    raise _RetryableStatus(f"HTTP {response.status_code}")
+                response.raise_for_status()
+                return self.parse_response(response.json())
+            except (requests.ConnectionError, requests.Timeout, _RetryableStatus) as e:
+                if attempt == self.retries:
+                    raise LLMBackendError(self.name, e)
+                time.sleep(self.retry_delay(attempt))
+            except (requests.RequestException, ValueError, KeyError, IndexError) as e:
+                raise LLMBackendError(self.name, e)
+
+    async def agenerate(self, prompt, system=None, max_tokens=150, temperature=0.7, context=None):
+        import asyncio
+
+        import httpx
+
+        payload = self.build_payload(prompt, system, max_tokens, temperature, context, stream=False)
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self.get_async_client().post(self.url, json=payload, headers=self.headers())
+                if response.status_code in RETRY_STATUS_CODES:
+                    raise _RetryableStatus(f"HTTP {response.status_code}")
+                response.raise_for_status()
+                return self.parse_response(response.json())
+            except (httpx.TransportError, _RetryableStatus) as e:
+                if attempt == self.retries:
+                    raise LLMBackendError(self.name, e)
+                await asyncio.sleep(self.retry_delay(attempt))
+            except (httpx.HTTPError, ValueError, KeyError, IndexError) as e:
+                raise LLMBackendError(self.name, e)
+
+    def generate_batch(self, prompts, system=None, max_tokens=150, temperature=0.7):
+        """One result per prompt, in order. Backends without a batch API make one call per prompt."""
+        return [self.generate(prompt, system=system, max_tokens=max_tokens, temperature=temperature) for prompt in prompts]
+
+    # Streams are not retried: once tokens have reached the patient a retry would repeat them.
+    def stream(self, prompt, system=None, max_tokens=150, temperature=0.7, context=None):
+        payload = self.build_payload(prompt, system, max_tokens, temperature, context, stream=True)
+        try:
+            with self.session.post(self.url, json=payload, headers=self.headers(),
+                                   timeout=(CONNECT_TIMEOUT, self.timeout), stream=True) as response:
+                response.raise_for_status()
+                for line in response.iter_lines(decode_unicode=True):
+                    parsed = self.parse_stream_line(line)
+                    if parsed is None:
+                        continue
+                    yield parsed
+                    if parsed[1]:
+                        break
+        except (requests.RequestException, ValueError) as e:
+            raise LLMBackendError(self.name, e)
+
+    async def astream(self, prompt, system=None, max_tokens=150, temperature=0.7, context=None):
+        import httpx
+
+        payload = self.build_payload(prompt, system, max_tokens, temperature, context, stream=True)
+        try:
+            async with self.get_async_client().stream("POST", self.url, json=payload, headers=self.headers()) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    parsed = self.parse_stream_line(line)
+                    if parsed is None:
+                        continue
+                    yield parsed
+                    if parsed[1]:
+                        break
+        except (httpx.HTTPError, ValueError) as e:
+            raise LLMBackendError(self.name, e)
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    async def aclose(self):
+        self.close()
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+
+class OllamaBackend(LLMBackend):
+    name = "ollama"
+    default_url = os.getenv("TRIAGE_OLLAMA_URL", "http://127.0.0.1:11434/api/generate")
+    default_model = os.getenv("TRIAGE_OLLAMA_MODEL", "llama3.1:8b")
+    supports_context = True
+
+    def headers(self):
+        return {"Content-Type": "application/json"}
+
+    def build_payload(self, prompt, system, max_tokens, temperature, context, stream):
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "num_predict": max_tokens,
+            "temperature": temperature,
+            "stream": stream,
+        }
+        if system:
+            payload["system"] = system
+        if context:
+            payload["context"] = context
+        return payload
+
+    def parse_response(self, data):
+        return LLMResult(data.get("response", "").strip(), self.name, raw=data, context=data.get("context"))
+
+    def parse_stream_line(self, line):
+        if not line:
+            return None
+        chunk = json.loads(line)
+        return chunk.get("response", ""), bool(chunk.get("done")), chunk
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """Chat-completions style APIs: OpenAI, Grok (xAI) and DeepSeek all speak this format."""
+
+    system_prompt = "You are a medical AI chatbot conducting a triage."
+
+    def build_payload(self, prompt, system, max_tokens, temperature, context, stream):
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system or self.system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": stream,
+        }
+
+    def parse_response(self, data):
+        return LLMResult(data["choices"][0]["message"]["content"].strip(), self.name, raw=data)
+
+    def parse_stream_line(self, line):
+        if not line or not line.startswith("data: "):
+            return None
+        data = line[len("data: "):]
+        if data == "[DONE]":
+            return "", True, {}
+        chunk = json.loads(data)
+        choices = chunk.get("choices") or [{}]
+        return choices[0].get("delta", {}).get("content") or "", False, chunk
+
+
+class OpenAIBackend(OpenAICompatibleBackend):
+    name = "openai"
+    default_url = os.getenv("TRIAGE_OPENAI_URL", "https://api.openai.com/v1/chat/completions")
+    default_model = os.getenv("TRIAGE_OPENAI_MODEL", "gpt-4o-mini")
+    api_key_env = "OPENAI_API_KEY"
+    reply_max_tokens = 200  # As the OpenAI app always asked for
+    markdown_prompts = False
+
+
+class GrokBackend(OpenAICompatibleBackend):
+    name = "grok"
+    default_url = os.getenv("TRIAGE_GROK_URL", "https://api.x.ai/v1/chat/completions")
+    default_model = os.getenv("TRIAGE_GROK_MODEL", "grok")
+    api_key_env = "GROK_API_KEY"
+    reply_max_tokens = 200  # As the Grok app always asked for
+    markdown_prompts = False
+
+
+class DeepSeekBackend(OpenAICompatibleBackend):
+    name = "deepseek"
+    default_url = os.getenv("TRIAGE_DEEPSEEK_URL", "https://api.deepseek.com/chat/completions")
+    default_model = os.getenv("TRIAGE_DEEPSEEK_MODEL", "deepseek-chat")
+    api_key_env = "DEEPSEEK_API_KEY"
+    system_prompt = "You are a helpful medical AI assistant."
+
+
+class VLLMBackend(LLMBackend):
+    """Local OpenAI-compatible completions server (vLLM, llama.cpp server) that accepts a list of prompts per request."""
+
+    name = "vllm"
+    default_url = os.getenv("TRIAGE_VLLM_URL", "http://127.0.0.1:8001/v1/completions")
+    default_model = os.getenv("TRIAGE_VLLM_MODEL", "meta-llama/Llama-3.1-8B-Instruct")
+    api_key_env = "VLLM_API_KEY"
+    supports_batching = True
+
+    def build_payload(self, prompt, system, max_tokens, temperature, context, stream):
+        if system:
+            prompt = [f"{system}\n\n{p}" for p in prompt] if isinstance(prompt, list) else f"{system}\n\n{prompt}"
+        return {
+            "model": self.model,
+            "prompt": prompt,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": stream,
+        }
+
+    def parse_response(self, data):
+        return LLMResult(data["choices"][0]["text"].strip(), self.name, raw=data)
+
+    def parse_stream_line(self, line):
+        if not line or not line.startswith("data: "):
+            return None
+        data = line[len("data: "):]
+        if data == "[DONE]":
+            return "", True, {}
+        chunk = json.loads(data)
+        choices = chunk.get("choices") or [{}]
+        return choices[0].get("text") or "", False, chunk
+
+    def generate_batch(self, prompts, system=None, max_tokens=150, temperature=0.7):
+        payload = self.build_payload(list(prompts), system, max_tokens, temperature, None, stream=False)
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.post(self.url, json=payload, headers=self.headers(),
+                                             timeout=(CONNECT_TIMEOUT, self.timeout))
+                if response.status_code in RETRY_STATUS_CODES:
+                    raise _RetryableStatus(f"HTTP {response.status_code}")
+                response.raise_for_status()
+                data = response.json()
+                choices = sorted(data["choices"], key=lambda choice: choice["index"])
+                if len(choices) != len(prompts):
+                    raise ValueError(f"expected {len(prompts)} choices, got {len(choices)}")
+                return [LLMResult(choice["text"].strip(), self.name, raw=choice) for choice in choices]
+            except (requests.ConnectionError, requests.Timeout, _RetryableStatus) as e:
+                if attempt == self.retries:
+                    raise LLMBackendError(self.name, e)
+                time.sleep(self.retry_delay(attempt))
+            except (requests.RequestException, ValueError, KeyError) as e:
+                raise LLMBackendError(self.name, e)
+
+
+BACKEND_CLASSES = {
+    "ollama": OllamaBackend,
+    "openai": OpenAIBackend,
+    "grok": GrokBackend,
+    "deepseek": DeepSeekBackend,
+    "vllm": VLLMBackend,
+}
+
+ROUTER_BACKEND = "router"  # Latency-aware router over several backends, see triage_router.py
+BATCHED_BACKEND = "batched"  # Micro-batching scheduler in front of a batch-capable backend, see triage_batching.py
+
+_backends = {}
+_backends_lock = threading.RLock()
+
+
+def _create_backend(name):
+    if name == ROUTER_BACKEND:
+        from triage_router import LatencyRouter
+
+        return LatencyRouter.from_env()
+    if name == BATCHED_BACKEND:
+        from triage_batching import BatchingBackend
+
+        return BatchingBackend.from_env()
+    return BACKEND_CLASSES[name]()
+
+
+def get_backend(name=None):
+    """Return the shared instance of a backend, by name or the deployment default (TRIAGE_LLM_BACKEND)."""
+    name = (name or DEFAULT_BACKEND).lower()
+    backend = _backends.get(name)
+    if backend is None:
+        if name not in BACKEND_CLASSES and name not in (ROUTER_BACKEND, BATCHED_BACKEND):
+            choices = sorted([*BACKEND_CLASSES, ROUTER_BACKEND, BATCHED_BACKEND])
+            raise ValueError(f"Unknown LLM backend '{name}'. Choose one of: {', '.join(choices)}")
+        with _backends_lock:
+            backend = _backends.get(name)
+            if backend is None:
+                backend = _backends[name] = _create_backend(name)
+    return backend
+
+
+def set_backend(name, backend):
+    """Replace the shared instance for name, e.g. to point a backend at a different URL or a stub server."""
+    with _backends_lock:
+        old = _backends.get(name)
+        _backends[name] = backend
+    if old is not None and old is not backend:
+        old.close()
+
+
+def backend_stats():
+    """Stats of the loaded backends that keep any (the router and the batching scheduler)."""
+    return {name: backend.stats() for name, backend in list(_backends.items()) if hasattr(backend, "stats")}
+
+
+def close_backends():
+    for backend in list(_backends.values()):
+        backend.close()
+
+
+async def aclose_backends():
+    for backend in list(_backends.values()):
+        await backend.aclose()
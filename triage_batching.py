@@ -0,0 +1,186 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from triage_backends import LLMBackendError, get_backend
+
+# Micro-batching in front of a batch-capable backend (vLLM / llama.cpp server).
+# Concurrent triage turns are collected for up to BATCH_WINDOW_MS, or until
+# MAX_BATCH_SIZE prompts are waiting, then sent as one batched request; each
+# caller gets its own result back. Prompts are only batched with others that use
+# the same system prompt, max_tokens and temperature.
+#
+# Select it with TRIAGE_LLM_BACKEND=batched and TRIAGE_BATCH_BACKEND=vllm.
+
+BATCH_BACKEND = os.getenv("TRIAGE_BATCH_BACKEND", "vllm")
+MAX_BATCH_SIZE = int(os.getenv("TRIAGE_MAX_BATCH_SIZE", "16"))
+BATCH_WINDOW_MS = float(os.getenv("TRIAGE_BATCH_WINDOW_MS", "20"))
+MAX_INFLIGHT_BATCHES = int(os.getenv("TRIAGE_MAX_INFLIGHT_BATCHES", "2"))  # Batches sent to the model at once
+
+
+class BatchingBackend:
+    """Wraps a backend so generate/agenerate calls are grouped into batches.
+
+    The scheduler runs on its own event loop thread, so sync handlers (threadpool)
+    and async handlers (uvicorn's loop) can share the same batches. Streams are not batched.
+    """
+
+    name = "batched"
+    supports_context = False
+    supports_batching = False
+
+    def __init__(self, backend, max_batch_size=MAX_BATCH_SIZE, window_ms=BATCH_WINDOW_MS,
+                 max_inflight_batches=MAX_INFLIGHT_BATCHES):
+        self.backend = backend
+        self.model = backend.model
+        self.reply_max_tokens = backend.reply_max_tokens
+        self.markdown_prompts = backend.markdown_prompts
+        self.max_batch_size = max_batch_size
+        self.window = window_ms / 1000
+        self.max_inflight_batches = max_inflight_batches
+        self._executor = ThreadPoolExecutor(max_workers=max_inflight_batches, thread_name_prefix="llm-batch")
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._queues = {}  # (system, max_tokens, temperature) -> asyncio.Queue of (prompt, future)
+        self._collectors = []
+        self._dispatches = set()
+        self._pending = set()  # Futures of prompts not answered yet: queued, being collected or in flight
+        self._inflight = None
+        self.batches = 0
+        self.batched_prompts = 0
+        self.largest_batch = 0
+        self.failed_batches = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(get_backend(BATCH_BACKEND))
+
+    def _ensure_loop(self):
+        if self._loop is None:
+            with self._loop_lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=self._run_loop, args=(loop,), name="llm-batch-scheduler", daemon=True).start()
+                    self._inflight = asyncio.Semaphore(self.max_inflight_batches)
+                    self._loop = loop
+        return self._loop
+
+    @staticmethod
+    def _run_loop(loop):
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    async def _submit(self, prompt, key):
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = asyncio.Queue()
+            self._collectors.append(self._loop.create_task(self._collect(key, queue)))
+        future = self._loop.create_future()
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+        await queue.put((prompt, future))
+        return await future
+
+    async def _collect(self, key, queue):
+        """Forms batches for one parameter set: first prompt opens a window, full batch or window end closes it."""
+        while True:
+            batch = [await queue.get()]
+            deadline = self._loop.time() + self.window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - self._loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            await self._inflight.acquire()
+            dispatch = self._loop.create_task(self._dispatch(key, batch))
+            self._dispatches.add(dispatch)
+            dispatch.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, key, batch):
+        system, max_tokens, temperature = key
+        prompts = [prompt for prompt, _ in batch]
+        try:
+            call = partial(self.backend.generate_batch, prompts, system=system, max_tokens=max_tokens, temperature=temperature)
+            results = await self._loop.run_in_executor(self._executor, call)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+            self.batches += 1
+            self.batched_prompts += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+        except Exception as e:
+            self.failed_batches += 1
+            error = e if isinstance(e, LLMBackendError) else LLMBackendError(self.name, e)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+        finally:
+            self._inflight.release()
+
+    def generate(self, prompt, system=None, max_tokens=150, temperature=0.7, context=None):
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(self._submit(prompt, (system, max_tokens, temperature)), loop).result()
+
+    async def agenerate(self, prompt, system=None, max_tokens=150, temperature=0.7, context=None):
+        loop = self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(self._submit(prompt, (system, max_tokens, temperature)), loop)
+        return await asyncio.wrap_future(future)
+
+    def generate_batch(self, prompts, **kwargs):
+        return self.backend.generate_batch(prompts, **kwargs)
+
+    def stream(self, prompt, **kwargs):
+        kwargs.pop("context", None)
+        return self.backend.stream(prompt, **kwargs)
+
+    def astream(self, prompt, **kwargs):
+        kwargs.pop("context", None)
+        return self.backend.astream(prompt, **kwargs)
+
+    def stats(self):
+        return {
+            "backend": self.backend.name,
+            "max_batch_size": self.max_batch_size,
+            "window_ms": self.window * 1000,
+            "batches": self.batches,
+            "batched_prompts": self.batched_prompts,
+            "mean_batch_size": self.batched_prompts / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "failed_batches": self.failed_batches,
+            "queued": sum(queue.qsize() for queue in list(self._queues.values())),
+        }
+
+    async def _shutdown(self):
+        """Fails every prompt not answered yet, whether queued, being collected or in flight, then stops the loop."""
+        tasks = self._collectors + list(self._dispatches)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        error = LLMBackendError(self.name, "scheduler closed")
+        for future in list(self._pending):
+            if not future.done():
+                future.set_exception(error)
+        # Let each caller's _submit see its error and hand it to the caller's thread before the loop stops
+        waiting = asyncio.all_tasks() - {asyncio.current_task()}
+        await asyncio.gather(*waiting, return_exceptions=True)
+        asyncio.get_running_loop().stop()
+
+    def close(self):
+        with self._loop_lock:
+            loop, self._loop = self._loop, None
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), loop)
+        self._executor.shutdown(wait=False)
+        self.backend.close()
+
+    async def aclose(self):
+        self.close()
+        await self.backend.aclose()
@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import OrderedDict
+
+# In-process LRU cache with per-entry TTL, shared by the triage caches.
+
+_MISSING = object()
+
+
+class LRUTTLCache:
+    """Thread-safe LRU cache whose entries also expire ttl seconds after they were last written.
+
+    sizeof(value) estimates the memory an entry uses; the running total is reported in stats().
+    """
+
+    def __init__(self, max_entries=10000, ttl=1800, sizeof=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.sizeof = sizeof or (lambda value: 0)
+        self._entries = OrderedDict()  # key -> (value, expires_at, size)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.size_bytes = 0
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self.size_bytes -= size
+
+    def _store(self, key, value):
+        if key in self._entries:
+            self._remove(key)
+        size = self.sizeof(value)
+        self._entries[key] = (value, time.monotonic() + self.ttl, size)
+        self.size_bytes += size
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        if entry[1] <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            return _MISSING
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._lookup(key)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._store(key, value)
+
+    def update(self, key, fn):
+        """Replace a cached value with fn(value). Does nothing if key is not cached."""
+        with self._lock:
+            value = self._lookup(key)
+            if value is not _MISSING:
+                self._store(key, fn(value))
+                return True
+            return False
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                value = self._entries[key][0]
+                self._remove(key)
+                return value
+            return default
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "size_bytes": self.size_bytes,
+            }
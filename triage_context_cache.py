@@ -0,0 +1,112 @@
+import os
+
+from triage_cache import LRUTTLCache
+from triage_journal import get_memory, get_turn_count, on_dead_letter, record_turn
+
+# Per-session conversation cache. determine_next_question used to re-read the
+# whole session from SQLite and re-join it on every turn; the session's turns,
+# their joined text and a running token estimate are now kept in memory and
+# extended by one turn after each save (get_session_conversation), so the
+# context window and the semantic cache work from them too.
+#
+# The session's turn count decides the prompt phase on the server
+# (get_question_count), so clients no longer send question_count. It is read on
+# every turn (one primary-key lookup in session_turns, plus the turns the
+# journal has not committed yet) and not cached, because another API replica
+# may have saved turns of the same session since. A cached conversation
+# records how many turns it holds and is only used while that is still the
+# session's count.
+#
+# Turns are stored through the write-behind journal (triage_journal): save_turn
+# returns once the turn is logged, and cache misses read SQLite plus the turns
+# the journal has not committed yet. A turn the journal gives up on and moves
+# to its dead-letter file is taken out again by dropping the session's entry.
+
+CONTEXT_CACHE_SIZE = int(os.getenv("TRIAGE_CONTEXT_CACHE_SIZE", "10000"))  # Sessions kept in memory
+CONTEXT_CACHE_TTL = float(os.getenv("TRIAGE_CONTEXT_CACHE_TTL", "1800"))  # Seconds since the last turn
+
+
+def estimate_tokens(text):
+    """Rough token count: about four bytes of UTF-8 per token for common BPE vocabularies."""
+    return (len(text.encode("utf-8")) + 3) // 4
+
+
+def format_turn(user_input, ai_response):
+    return f"Patient: {user_input}\nAI: {ai_response}"
+
+
+def format_conversation(history):
+    return "\n".join([format_turn(u, a) for u, a in history])
+
+
+class SessionConversation:
+    """A session's turns as (user_input, ai_response), their joined text and the estimated tokens of each
+    turn in it (its line break included). Extended into a new instance, never changed in place."""
+
+    def __init__(self, turns, text, tokens):
+        self.turns = turns
+        self.text = text
+        self.tokens = tokens
+        self.total_tokens = sum(tokens)
+
+    @classmethod
+    def from_history(cls, history):
+        history = list(history)
+        return cls(history, format_conversation(history), [estimate_tokens(format_turn(*turn)) + 1 for turn in history])
+
+    def extended(self, user_input, ai_response):
+        turn = format_turn(user_input, ai_response)
+        return SessionConversation(self.turns + [(user_input, ai_response)], f"{self.text}\n{turn}" if self.text else turn,
+                                   self.tokens + [estimate_tokens(turn) + 1])
+
+
+_context_cache = LRUTTLCache(
+    max_entries=CONTEXT_CACHE_SIZE,
+    ttl=CONTEXT_CACHE_TTL,
+    sizeof=lambda entry: 2 * len(entry.text.encode("utf-8")),  # The text and the turns it was joined from
+)
+
+
+def get_session_conversation(patient_id, session_id):
+    """The session's SessionConversation, loaded on a cache miss or when the session has turns the cached
+    copy does not (saved by another replica)."""
+    key = (patient_id, session_id)
+    entry = _context_cache.get(key)
+    if entry is not None and len(entry.turns) == get_turn_count(patient_id, session_id):
+        return entry
+    entry = SessionConversation.from_history(get_memory(patient_id, session_id))
+    _context_cache.set(key, entry)
+    return entry
+
+
+def get_conversation(patient_id, session_id):
+    """Return the session's conversation text."""
+    return get_session_conversation(patient_id, session_id).text
+
+
+def append_turn(patient_id, session_id, user_input, ai_response):
+    """Extend a cached conversation by one turn. Uncached sessions are left to the next SQLite read."""
+    _context_cache.update((patient_id, session_id), lambda entry: entry.extended(user_input, ai_response))
+
+
+def get_question_count(patient_id, session_id):
+    """1-based number of the turn being answered: the turns saved so far plus one."""
+    return get_turn_count(patient_id, session_id) + 1
+
+
+def save_turn(patient_id, session_id, user_input, ai_response):
+    """record_turn plus a cache append. A failed write drops the cached copy so it is re-read."""
+    if record_turn(patient_id, session_id, user_input, ai_response):
+        append_turn(patient_id, session_id, user_input, ai_response)
+    else:
+        forget_session(patient_id, session_id)
+
+
+@on_dead_letter
+def forget_session(patient_id, session_id):
+    """Drop the session's cached conversation, so the next turn reads it again."""
+    _context_cache.pop((patient_id, session_id))
+
+
+def cache_stats():
+    return _context_cache.stats()
@@ -0,0 +1,395 @@
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+# Shared SQLite access for the triage servers.
+# Each thread keeps one long-lived connection per database file instead of
+# opening a new one for every get_memory / save_memory call.
+DB_NAME = os.getenv("TRIAGE_DB_NAME", "patient_memory.db")
+
+BUSY_TIMEOUT_MS = int(os.getenv("TRIAGE_DB_BUSY_TIMEOUT_MS", "5000"))  # How long SQLite waits on a lock
+LOCK_RETRIES = 3  # Extra attempts when a write still hits "database is locked"
+LOCK_RETRY_BACKOFF = 0.05  # Seconds, doubled on every retry
+CACHED_STATEMENTS = 64  # Prepared statements kept per connection
+
+INSERT_MEMORY_SQL = "INSERT INTO chat_memory (patient_id, session_id, user_input, ai_response) VALUES (?, ?, ?, ?)"
+INSERT_TURN_SQL = """
+    INSERT OR IGNORE INTO chat_memory (patient_id, session_id, user_input, ai_response, turn_uid, created_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+SELECT_MEMORY_SQL = "SELECT user_input, ai_response FROM chat_memory WHERE patient_id=? AND session_id=? ORDER BY id ASC"
+COUNT_TURN_SQL = """
+    INSERT INTO session_turns (patient_id, session_id, turns, updated_at) VALUES (?, ?, 1, ?)
+    ON CONFLICT (patient_id, session_id) DO UPDATE SET turns=turns + 1, updated_at=excluded.updated_at
+    RETURNING turns
+"""
+# Dashboard counters (triage_analytics), kept up to date by insert_turn in the turn's own transaction
+COUNT_DAY_SQL = """
+    INSERT INTO daily_stats (day, sessions, turns, emergencies) VALUES (?, ?, 1, 0)
+    ON CONFLICT (day) DO UPDATE SET sessions=sessions + excluded.sessions, turns=turns + 1
+"""
+COUNT_LENGTH_SQL = """
+    INSERT INTO session_lengths (turns, sessions) VALUES (?, 1)
+    ON CONFLICT (turns) DO UPDATE SET sessions=sessions + 1
+"""
+UNCOUNT_LENGTH_SQL = "UPDATE session_lengths SET sessions=sessions - 1 WHERE turns=?"
+SELECT_TURNS_SQL = "SELECT turns FROM session_turns WHERE patient_id=? AND session_id=?"
+
+_local = threading.local()
+_all_connections = []
+_all_connections_lock = threading.Lock()
+
+
+def _open_connection(db_name):
+    """Open a connection tuned for many short concurrent transactions."""
+    conn = sqlite3.connect(
+        db_name,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=CACHED_STATEMENTS,
+        check_same_thread=False,
+    )
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")  # Takes effect on new files; triage_archive converts old ones
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def get_connection(db_name=None):
+    """Return this thread's connection to db_name, opening it on first use."""
+    db_name = db_name or DB_NAME
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(db_name)
+    if conn is None:
+        conn = _open_connection(db_name)
+        connections[db_name] = conn
+        with _all_connections_lock:
+            _all_connections.append(conn)
+    return conn
+
+
+def close_connections():
+    """Close every pooled connection (call on shutdown or in benchmarks)."""
+    with _all_connections_lock:
+        connections = list(_all_connections)
+        _all_connections.clear()
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+    _local.__dict__.pop("connections", None)
+
+
+def is_locked_error(error):
+    return isinstance(error, sqlite3.OperationalError) and "locked" in str(error).lower()
+
+
+def run_write(fn, db_name=None):
+    """Run fn(conn) inside a transaction, retrying with backoff if the database stays locked."""
+    conn = get_connection(db_name)
+    delay = LOCK_RETRY_BACKOFF
+    for attempt in range(LOCK_RETRIES + 1):
+        try:
+            with conn:
+                return fn(conn)
+        except sqlite3.OperationalError as e:
+            if not is_locked_error(e) or attempt == LOCK_RETRIES:
+                raise
+            time.sleep(delay)
+            delay *= 2
+
+
+# Schema migrations. PRAGMA user_version records how many have been applied,
+# so init_db only runs the steps a database is missing.
+LEGACY_SESSION_ID = "legacy"  # Session assigned to rows written before session_id existed
+
+
+def _table_columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _migrate_create_chat_memory(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS chat_memory (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id TEXT,
+            session_id TEXT,
+            user_input TEXT,
+            ai_response TEXT
+        )
+    """)
+    # Databases created by triageAI-memory.py / triageAI-deepseek.py are keyed on patient_id only.
+    if "session_id" not in _table_columns(conn, "chat_memory"):
+        conn.execute("ALTER TABLE chat_memory ADD COLUMN session_id TEXT")
+        conn.execute("UPDATE chat_memory SET session_id=? WHERE session_id IS NULL", (LEGACY_SESSION_ID,))
+
+
+def _migrate_add_lookup_index(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_memory_lookup ON chat_memory (patient_id, session_id, id)")
+
+
+def _migrate_create_ollama_context(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ollama_context (
+            patient_id TEXT,
+            session_id TEXT,
+            model TEXT,
+            context BLOB,
+            updated_at REAL,
+            PRIMARY KEY (patient_id, session_id)
+        )
+    """)
+
+
+def _migrate_create_conversation_summary(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_summary (
+            patient_id TEXT,
+            session_id TEXT,
+            turns_covered INTEGER,
+            summary TEXT,
+            updated_at REAL,
+            PRIMARY KEY (patient_id, session_id)
+        )
+    """)
+
+
+def _migrate_create_bot_sessions(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS bot_sessions (
+            store_key TEXT PRIMARY KEY,
+            session_id TEXT,
+            state TEXT,
+            updated_at REAL
+        )
+    """)
+    conn.execute("CREATE TABLE IF NOT EXISTS bot_updates (update_key TEXT PRIMARY KEY, claimed_at REAL)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_bot_updates_claimed_at ON bot_updates (claimed_at)")
+
+
+def _migrate_create_session_turns(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS session_turns (
+            patient_id TEXT,
+            session_id TEXT,
+            turns INTEGER,
+            updated_at REAL,
+            PRIMARY KEY (patient_id, session_id)
+        )
+    """)
+    conn.execute("""
+        INSERT OR IGNORE INTO session_turns (patient_id, session_id, turns, updated_at)
+        SELECT patient_id, session_id, COUNT(*), ? FROM chat_memory GROUP BY patient_id, session_id
+    """, (time.time(),))
+
+
+def _migrate_create_summary_jobs(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS summary_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id TEXT,
+            session_id TEXT,
+            backend TEXT,
+            conversation TEXT,
+            priority INTEGER,
+            status TEXT,
+            attempts INTEGER DEFAULT 0,
+            not_before REAL,
+            lease_until REAL,
+            error TEXT,
+            created_at REAL,
+            finished_at REAL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_summary_jobs_claim ON summary_jobs (status, priority DESC, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_summary_jobs_session ON summary_jobs (patient_id, session_id, id)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS summary_reports (
+            patient_id TEXT,
+            session_id TEXT,
+            job_id INTEGER,
+            report TEXT,
+            created_at REAL,
+            PRIMARY KEY (patient_id, session_id)
+        )
+    """)
+
+
+def _migrate_add_turn_uid(conn):
+    # Turns replayed from the write-behind journal carry a unique id, so a replay never inserts one twice.
+    if "turn_uid" not in _table_columns(conn, "chat_memory"):
+        conn.execute("ALTER TABLE chat_memory ADD COLUMN turn_uid TEXT")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_chat_memory_turn_uid ON chat_memory (turn_uid)")
+
+
+def _migrate_create_archive(conn):
+    # Retention (triage_archive): turns get a timestamp, session_turns records how many of a session's
+    # turns are in cold storage, and archived_sessions says where.
+    if "created_at" not in _table_columns(conn, "chat_memory"):
+        conn.execute("ALTER TABLE chat_memory ADD COLUMN created_at REAL")  # NULL for turns stored before this
+    if "archived_turns" not in _table_columns(conn, "session_turns"):
+        conn.execute("ALTER TABLE session_turns ADD COLUMN archived_turns INTEGER DEFAULT 0")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_session_turns_unarchived ON session_turns (updated_at) WHERE turns > archived_turns")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS archived_sessions (
+            patient_id TEXT,
+            session_id TEXT,
+            path TEXT,
+            offset INTEGER,
+            length INTEGER,
+            turns INTEGER,
+            last_turn_at REAL,
+            archived_at REAL,
+            PRIMARY KEY (patient_id, session_id)
+        )
+    """)
+
+
+def _migrate_create_analytics(conn):
+    # Export pages through chat_memory by time. daily_stats is backfilled from chat_memory.created_at as
+    # insert_turn would have counted it: each turn on its own day, each session on the day of its first turn.
+    # Turns stored before created_at existed have no day and stay out of it, as do sessions that have such
+    # turns or turns in cold storage (their first turn is not dated); session_lengths counts every session.
+    # Emergencies start at 0.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_memory_created_at ON chat_memory (created_at, id)")
+    conn.execute("CREATE TABLE IF NOT EXISTS daily_stats (day TEXT PRIMARY KEY, sessions INTEGER, turns INTEGER, emergencies INTEGER)")
+    conn.execute("CREATE TABLE IF NOT EXISTS session_lengths (turns INTEGER PRIMARY KEY, sessions INTEGER)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS flagged_sessions (
+            patient_id TEXT,
+            session_id TEXT,
+            flagged_at REAL,
+            PRIMARY KEY (patient_id, session_id)
+        )
+    """)
+    conn.execute("""
+        INSERT OR IGNORE INTO daily_stats (day, sessions, turns, emergencies)
+        SELECT day, SUM(sessions), SUM(turns), 0 FROM (
+            SELECT date(MIN(m.created_at), 'unixepoch') AS day, 1 AS sessions, 0 AS turns
+            FROM chat_memory m JOIN session_turns t ON t.patient_id=m.patient_id AND t.session_id=m.session_id
+            WHERE t.archived_turns=0
+            GROUP BY m.patient_id, m.session_id HAVING COUNT(*)=COUNT(m.created_at)
+            UNION ALL
+            SELECT date(created_at, 'unixepoch'), 0, 1 FROM chat_memory WHERE created_at IS NOT NULL
+        ) GROUP BY day
+    """)
+    conn.execute("INSERT OR IGNORE INTO session_lengths (turns, sessions) SELECT turns, COUNT(*) FROM session_turns GROUP BY turns")
+
+
+def _migrate_drop_bot_session_counter(conn):
+    # The triage API counts session turns itself, so the bots' question_count went unused.
+    if "question_count" in _table_columns(conn, "bot_sessions"):
+        conn.execute("ALTER TABLE bot_sessions DROP COLUMN question_count")
+
+
+def _migrate_add_summary_job_digest(conn):
+    # A final turn that does not change the conversation must not queue its report again (triage_summary_report).
+    if "conversation_digest" not in _table_columns(conn, "summary_jobs"):
+        conn.execute("ALTER TABLE summary_jobs ADD COLUMN conversation_digest TEXT")
+
+
+MIGRATIONS = [
+    _migrate_create_chat_memory,
+    _migrate_add_lookup_index,
+    _migrate_create_ollama_context,
+    _migrate_create_conversation_summary,
+    _migrate_create_bot_sessions,
+    _migrate_create_session_turns,
+    _migrate_create_summary_jobs,
+    _migrate_add_turn_uid,
+    _migrate_create_archive,
+    _migrate_create_analytics,
+    _migrate_drop_bot_session_counter,
+    _migrate_add_summary_job_digest,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+SESSION_MIGRATIONS = [_migrate_create_bot_sessions, _migrate_drop_bot_session_counter]  # All the bots' session store needs
+
+
+def get_schema_version(db_name=None):
+    return get_connection(db_name).execute("PRAGMA user_version").fetchone()[0]
+
+
+def init_db(db_name=None):
+    """Create or upgrade the database schema to SCHEMA_VERSION."""
+    conn = get_connection(db_name)
+    while True:
+        # BEGIN IMMEDIATE serializes servers that start against the same file at once.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= SCHEMA_VERSION:
+                conn.rollback()
+                return version
+            MIGRATIONS[version](conn)
+            conn.execute(f"PRAGMA user_version={version + 1}")
+            conn.commit()
+            print(f"Database migrated to schema version {version + 1}", file=sys.stderr)  # Not into a CLI's output
+        except BaseException:
+            conn.rollback()
+            raise
+
+
+def init_session_db(db_name=None):
+    """Create or upgrade only the bot session tables (triage_session_store). Every step checks what is
+    there already, so they all run each time, also on files the full init_db upgraded before."""
+    conn = get_connection(db_name)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for migrate in SESSION_MIGRATIONS:
+            migrate(conn)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def insert_turn(conn, patient_id, session_id, user_input, ai_response, turn_uid=None, created_at=None):
+    """Insert one turn and count it, inside the caller's transaction. A turn_uid already stored is skipped."""
+    now = time.time()
+    created_at = created_at or now
+    row = (patient_id, session_id, user_input, ai_response, turn_uid, created_at)
+    if conn.execute(INSERT_TURN_SQL, row).rowcount == 0:
+        return False
+    turns = conn.execute(COUNT_TURN_SQL, (patient_id, session_id, now)).fetchone()[0]
+    conn.execute(COUNT_DAY_SQL, (time.strftime("%Y-%m-%d", time.gmtime(created_at)), int(turns == 1)))
+    if turns > 1:  # The session moves from one bucket of the turns-per-session histogram to the next
+        conn.execute(UNCOUNT_LENGTH_SQL, (turns - 1,))
+    conn.execute(COUNT_LENGTH_SQL, (turns,))
+    return True
+
+
+def save_memory(patient_id, session_id, user_input, ai_response, db_name=None):
+    """Store chat interactions in the database, counting the turn in session_turns in the
+    same transaction. Returns False if the write failed."""
+    try:
+        run_write(lambda conn: insert_turn(conn, patient_id, session_id, user_input, ai_response), db_name)
+        return True
+    except sqlite3.Error as e:
+        print(f"Database Error (save_memory): {e}")
+        return False
+
+
+def get_memory(patient_id, session_id, db_name=None):
+    """Retrieve past conversation history for a given patient and session."""
+    try:
+        return get_connection(db_name).execute(SELECT_MEMORY_SQL, (patient_id, session_id)).fetchall()
+    except sqlite3.Error as e:
+        print(f"Database Error (get_memory): {e}")
+        return []
+
+
+def get_turn_count(patient_id, session_id, db_name=None):
+    """Number of turns saved for a session, from session_turns (one primary-key lookup)."""
+    try:
+        row = get_connection(db_name).execute(SELECT_TURNS_SQL, (patient_id, session_id)).fetchone()
+        return row[0] if row else 0
+    except sqlite3.Error as e:
+        print(f"Database Error (get_turn_count): {e}")
+        return 0
@@ -0,0 +1,158 @@
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import triage_db
+from triage_db import get_connection
+
+# Bulk export of chat_memory for the clinical team's weekly extracts.
+# The table is read a page at a time with keyset pagination: each page starts
+# after the last (created_at, id) of the previous one, so every page is one
+# index range scan however deep into the table it is (OFFSET would re-read
+# everything before it), and memory holds one page whatever the export size.
+#
+#   python triage_export.py --days 7 --format csv --out week.csv
+#   python triage_export.py --since 2026-10-01 --until 2026-10-08 --format parquet --out week.parquet
+#
+# GET /export streams NDJSON or CSV the same way. Parquet is written by the
+# command only (it needs pyarrow and a seekable file). Without --since/--until
+# the whole table is exported in id order, including turns stored before
+# chat_memory had created_at. Sessions moved to cold storage (triage_archive)
+# are not included; their partitions are JSONL already.
+
+EXPORT_PAGE_SIZE = 1000
+EXPORT_FORMATS = ("ndjson", "csv", "parquet")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+COLUMNS = ("turn_id", "patient_id", "session_id", "user_input", "ai_response", "created_at")
+
+PAGE_BY_TIME_SQL = """
+    SELECT id, patient_id, session_id, user_input, ai_response, created_at FROM chat_memory
+    WHERE (created_at, id) > (?, ?) AND created_at < ? ORDER BY created_at, id LIMIT ?
+"""
+PAGE_BY_ID_SQL = """
+    SELECT id, patient_id, session_id, user_input, ai_response, created_at FROM chat_memory
+    WHERE id > ? ORDER BY id LIMIT ?
+"""
+
+
+def parse_day(value):
+    """Seconds since the epoch for a YYYY-MM-DD (UTC) or ISO 8601 timestamp. Raises ValueError."""
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def iter_pages(since=None, until=None, page_size=EXPORT_PAGE_SIZE, db_name=None):
+    """Yield lists of up to page_size chat_memory rows, oldest first, turns with since <= created_at < until.
+    Each page is read on the connection of the thread asking for it, as a streaming response moves between threads."""
+    if since is None and until is None:
+        last_id = 0
+        while True:
+            page = get_connection(db_name).execute(PAGE_BY_ID_SQL, (last_id, page_size)).fetchall()
+            if not page:
+                return
+            yield page
+            last_id = page[-1][0]
+    key = (since if since is not None else float("-inf"), 0)
+    until = until if until is not None else float("inf")
+    while True:
+        page = get_connection(db_name).execute(PAGE_BY_TIME_SQL, (*key, until, page_size)).fetchall()
+        if not page:
+            return
+        yield page
+        key = (page[-1][5], page[-1][0])
+
+
+def _iso(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat() if timestamp is not None else None
+
+
+def ndjson_chunks(pages):
+    for page in pages:
+        yield "".join(json.dumps(dict(zip(COLUMNS, (*row[:5], _iso(row[5]))))) + "\n" for row in page)
+
+
+def csv_chunks(pages):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for page in pages:
+        writer.writerows((*row[:5], _iso(row[5])) for row in page)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():  # Header only: nothing was exported
+        yield buffer.getvalue()
+
+
+def export_chunks(export_format, pages):
+    """Text chunks of an NDJSON or CSV export, one per page of iter_pages, for writing or streaming out."""
+    return (ndjson_chunks if export_format == "ndjson" else csv_chunks)(pages)
+
+
+def write_parquet(path, pages):
+    """Write the export as Parquet, one row group per page."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("pyarrow is required for Parquet exports: pip install pyarrow")
+    schema = pa.schema([("turn_id", pa.int64()), ("patient_id", pa.string()), ("session_id", pa.string()),
+                        ("user_input", pa.string()), ("ai_response", pa.string()),
+                        ("created_at", pa.timestamp("us", tz="UTC"))])
+    with pq.ParquetWriter(path, schema) as writer:
+        for page in pages:
+            columns = list(zip(*page))
+            columns[5] = [datetime.fromtimestamp(t, timezone.utc) if t is not None else None for t in columns[5]]
+            writer.write_table(pa.Table.from_arrays([pa.array(c, type=f.type) for c, f in zip(columns, schema)], schema=schema))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export chat_memory as NDJSON, CSV or Parquet.")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+    parser.add_argument("--since", help="first day or timestamp to include (UTC, YYYY-MM-DD or ISO 8601)")
+    parser.add_argument("--until", help="first day or timestamp to leave out")
+    parser.add_argument("--days", type=int, help="the last N days up to today, instead of --since/--until")
+    parser.add_argument("--out", default="-", help="output file (default: stdout; required for parquet)")
+    parser.add_argument("--db", default=triage_db.DB_NAME)
+    args = parser.parse_args()
+
+    since = parse_day(args.since) if args.since else None
+    until = parse_day(args.until) if args.until else None
+    if args.days:
+        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        since, until = (today - timedelta(days=args.days - 1)).timestamp(), (today + timedelta(days=1)).timestamp()
+
+    if args.format == "parquet" and args.out == "-":
+        parser.error("--out is required for parquet")
+    triage_db.init_db(args.db)
+
+    started, rows = time.perf_counter(), 0
+
+    def pages():
+        nonlocal rows
+        for page in iter_pages(since, until, db_name=args.db):
+            rows += len(page)
+            yield page
+
+    if args.format == "parquet":
+        write_parquet(args.out, pages())
+    else:
+        out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8", newline="")
+        try:
+            for chunk in export_chunks(args.format, pages()):
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+    if args.out != "-":
+        print(f"Exported {rows} turns to {args.out} in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import os
+import re
+
+from triage_cache import LRUTTLCache
+
+# Cache of first follow-up questions. On the first turn the prompt depends only on
+# the patient's opening message, and openings such as "back pain" or "I have a
+# headache" come up constantly, so the answer for a normalized opening is reused
+# instead of calling the model again. Entries are keyed on backend, model and the
+# prompt version, so changing any of them never serves an old question.
+#
+# Turn it off for a deployment with TRIAGE_FIRST_TURN_CACHE=0.
+
+FIRST_TURN_CACHE = os.getenv("TRIAGE_FIRST_TURN_CACHE", "1") == "1"
+FIRST_TURN_CACHE_SIZE = int(os.getenv("TRIAGE_FIRST_TURN_CACHE_SIZE", "5000"))
+FIRST_TURN_CACHE_TTL = float(os.getenv("TRIAGE_FIRST_TURN_CACHE_TTL", "86400"))
+MAX_COMPLAINT_WORDS = 8  # Longer openings are too specific to repeat; caching them only churns the LRU
+
+_FILLER_PREFIX = re.compile(
+    r"^(?:(?:hi|hello|hey|doctor|doc)\s+)*"
+    r"(?:(?:i\s+have\s+got|i\s+have|i've\s+got|i\s+got|i'm\s+having|i\s+am\s+having|i\s+think\s+i\s+have)\s+)?"
+    r"(?:(?:a|an|some)\s+)?"
+)
+
+_first_turn_cache = LRUTTLCache(
+    max_entries=FIRST_TURN_CACHE_SIZE,
+    ttl=FIRST_TURN_CACHE_TTL,
+    sizeof=lambda question: len(question.encode("utf-8")),
+)
+
+
+def normalize_complaint(user_input):
+    """Lower-cased opening with punctuation, greetings and filler such as "I have a" removed.
+
+    Returns None for openings longer than MAX_COMPLAINT_WORDS, which are not cached.
+    """
+    text = re.sub(r"[^\w\s']", " ", user_input.lower())
+    text = re.sub(r"\s+", " ", text).strip()
+    text = _FILLER_PREFIX.sub("", text).strip()
+    if not text or len(text.split()) > MAX_COMPLAINT_WORDS:
+        return None
+    return text
+
+
+def _key(backend, user_input, prompt_version):
+    complaint = normalize_complaint(user_input)
+    if complaint is None:
+        return None
+    return (backend.name, backend.model, prompt_version, complaint)
+
+
+def get_first_question(backend, user_input, prompt_version):
+    """Cached first follow-up question for this opening, or None."""
+    if not FIRST_TURN_CACHE:
+        return None
+    key = _key(backend, user_input, prompt_version)
+    return _first_turn_cache.get(key) if key else None
+
+
+def store_first_question(backend, user_input, prompt_version, question):
+    if not FIRST_TURN_CACHE or not question:
+        return
+    key = _key(backend, user_input, prompt_version)
+    if key:
+        _first_turn_cache.set(key, question)
+
+
+def first_turn_cache_stats():
+    return {"enabled": FIRST_TURN_CACHE, **_first_turn_cache.stats()}
@@ -0,0 +1,320 @@
+import argparse
+import glob
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import time
+import unicodedata
+from collections import Counter, namedtuple
+
+from triage_lazy import numpy as np
+
+# Retrieval over the clinical guideline documents shipped with the repo (the CDC
+# 2022 opioid prescribing guideline), so the final recommendation can quote them
+# instead of relying on model recall.
+#
+# Ingestion runs offline:   python triage_guidelines.py ingest [files...]
+# It parses each document once (PDF via pypdf, or plain text), cuts it into
+# overlapping passages and writes one index segment per document:
+#     <index>/manifest.json             sources, content hashes, segment stats
+#     <index>/segments/<id>/passages.json
+#     <index>/segments/<id>/vocab.json  term -> postings row
+#     <index>/segments/<id>/*.npy       BM25 postings in CSR form, memory-mapped at query time
+# Re-running ingest only rebuilds segments whose source changed, so adding a
+# document does not re-index the others. BM25 statistics (document frequency,
+# average length) are combined across segments at query time. Documents are
+# keyed on their path relative to TRIAGE_GUIDELINE_ROOT (the repo by default),
+# so an index stays valid when the checkout is moved or built elsewhere.
+
+GUIDELINE_INDEX = os.getenv("TRIAGE_GUIDELINE_INDEX", os.path.join(os.path.dirname(os.path.abspath(__file__)), "guideline_index"))
+GUIDELINE_ROOT = os.getenv("TRIAGE_GUIDELINE_ROOT", os.path.dirname(os.path.abspath(__file__)))
+GUIDELINE_TOP_K = int(os.getenv("TRIAGE_GUIDELINE_TOP_K", "3"))
+USE_GUIDELINES = os.getenv("TRIAGE_USE_GUIDELINES", "1") == "1"
+PASSAGE_WORDS = 150
+PASSAGE_OVERLAP = 30
+BM25_K1 = 1.2
+BM25_B = 0.75
+INDEX_FORMAT = 1
+
+STOPWORDS = frozenset(
+    "a an and are as at be been but by for from has have had he her his i if in into is it its me my no not of on "
+    "or our she so than that the their them then there these they this to was we were what when which who will with "
+    "you your do does did can could would should may might also such other more most any all some".split()
+)
+
+Passage = namedtuple("Passage", ["text", "source", "page", "score"])
+
+
+def tokenize(text):
+    return [word for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in STOPWORDS and len(word) > 1]
+
+
+def read_pages(path):
+    """[(page_number, text)] for a PDF (needs pypdf) or a plain-text file (one page)."""
+    if path.lower().endswith(".pdf"):
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise SystemExit("pypdf is required to ingest PDF files: pip install pypdf")
+        return [(n, page.extract_text() or "") for n, page in enumerate(PdfReader(path).pages, start=1)]
+    with open(path, encoding="utf-8") as f:
+        return [(1, f.read())]
+
+
+def split_passages(pages, words=PASSAGE_WORDS, overlap=PASSAGE_OVERLAP):
+    """Overlapping passages of about `words` words, each tagged with the page it starts on."""
+    tagged = []
+    for page, text in pages:
+        text = unicodedata.normalize("NFKC", text)  # PDF ligatures such as "ﬁ" become plain letters
+        text = re.sub(r"(\w)-\n(\w)", r"\1\2", text)  # Re-join words hyphenated across lines
+        tagged += [(word, page) for word in text.split()]
+    passages = []
+    step = words - overlap
+    for start in range(0, max(len(tagged) - overlap, 1), step):
+        chunk = tagged[start:start + words]
+        text = " ".join(word for word, _ in chunk)
+        if chunk and text.count("doi.org") < 3:  # Reference lists match many queries but advise nothing
+            passages.append({"text": text, "page": chunk[0][1]})
+    return passages
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_key(path, root=GUIDELINE_ROOT):
+    """A document's key in the manifest: its path relative to the guidelines root, with / separators."""
+    return os.path.relpath(os.path.abspath(path), root).replace(os.sep, "/")
+
+
+def build_segment(directory, source, passages):
+    """Write BM25 postings for one document: row t of the CSR arrays lists (passage, term frequency) for term t."""
+    postings = {}
+    lengths = np.zeros(len(passages), dtype=np.int32)
+    for n, passage in enumerate(passages):
+        terms = Counter(tokenize(passage["text"]))
+        lengths[n] = sum(terms.values())
+        for term, count in terms.items():
+            postings.setdefault(term, []).append((n, count))
+    vocab = sorted(postings)
+    indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+    for row, term in enumerate(vocab):
+        indptr[row + 1] = indptr[row] + len(postings[term])
+    docs = np.empty(indptr[-1], dtype=np.int32)
+    tfs = np.empty(indptr[-1], dtype=np.float32)
+    for row, term in enumerate(vocab):
+        entries = postings[term]
+        docs[indptr[row]:indptr[row + 1]] = [doc for doc, _ in entries]
+        tfs[indptr[row]:indptr[row + 1]] = [count for _, count in entries]
+
+    os.makedirs(directory)
+    np.save(os.path.join(directory, "indptr.npy"), indptr)
+    np.save(os.path.join(directory, "docs.npy"), docs)
+    np.save(os.path.join(directory, "tfs.npy"), tfs)
+    np.save(os.path.join(directory, "lengths.npy"), lengths)
+    with open(os.path.join(directory, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump({term: row for row, term in enumerate(vocab)}, f)
+    with open(os.path.join(directory, "passages.json"), "w", encoding="utf-8") as f:
+        json.dump({"source": os.path.basename(source), "passages": passages}, f)
+    return int(lengths.sum())
+
+
+def load_manifest(index_dir):
+    path = os.path.join(index_dir, "manifest.json")
+    if not os.path.exists(path):
+        return {"format": INDEX_FORMAT, "segments": []}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(index_dir, manifest):
+    path = os.path.join(index_dir, "manifest.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)  # Readers never see a half-written manifest
+
+
+def ingest(paths, index_dir=GUIDELINE_INDEX, prune=False, root=GUIDELINE_ROOT):
+    """Index new or changed documents; unchanged ones are skipped by content hash. Returns (added, skipped, removed)."""
+    os.makedirs(os.path.join(index_dir, "segments"), exist_ok=True)
+    manifest = load_manifest(index_dir)
+    segments = {}
+    for segment in manifest["segments"]:
+        if os.path.isabs(segment["source"]):  # Manifests written before sources were relative to the root
+            segment["source"] = source_key(segment["source"], root)
+        segments[segment["source"]] = segment
+    added, skipped, removed = [], [], []
+    stale = []  # Segment directories deleted once the new manifest no longer points at them
+
+    for path in paths:
+        source = source_key(path, root)
+        digest = file_digest(path)
+        current = segments.get(source)
+        if current and current["sha256"] == digest:
+            skipped.append(path)
+            continue
+        started = time.perf_counter()
+        passages = split_passages(read_pages(path))
+        segment_id = hashlib.sha256(f"{source}\0{digest}".encode("utf-8")).hexdigest()[:16]
+        directory = os.path.join(index_dir, "segments", segment_id)
+        shutil.rmtree(directory, ignore_errors=True)
+        total_length = build_segment(directory, source, passages)
+        if current and current["id"] != segment_id:
+            stale.append(current["id"])
+        segments[source] = {"id": segment_id, "source": source, "sha256": digest, "passages": len(passages),
+                            "total_length": total_length, "indexed_at": time.time()}
+        added.append(path)
+        print(f"Indexed {os.path.basename(path)}: {len(passages)} passages in {time.perf_counter() - started:.1f} s")
+
+    if prune:
+        wanted = {source_key(path, root) for path in paths}
+        for source in [source for source in segments if source not in wanted]:
+            stale.append(segments.pop(source)["id"])
+            removed.append(source)
+
+    manifest["segments"] = sorted(segments.values(), key=lambda segment: segment["source"])
+    write_manifest(index_dir, manifest)
+    for segment_id in stale:
+        shutil.rmtree(os.path.join(index_dir, "segments", segment_id), ignore_errors=True)
+    return added, skipped, removed
+
+
+class Segment:
+    def __init__(self, directory):
+        self.indptr = np.load(os.path.join(directory, "indptr.npy"), mmap_mode="r")
+        self.docs = np.load(os.path.join(directory, "docs.npy"), mmap_mode="r")
+        self.tfs = np.load(os.path.join(directory, "tfs.npy"), mmap_mode="r")
+        self.lengths = np.load(os.path.join(directory, "lengths.npy"), mmap_mode="r")
+        with open(os.path.join(directory, "vocab.json"), encoding="utf-8") as f:
+            self.vocab = json.load(f)
+        with open(os.path.join(directory, "passages.json"), encoding="utf-8") as f:
+            data = json.load(f)
+        self.source = data["source"]
+        self.passages = data["passages"]
+
+    def postings(self, term):
+        row = self.vocab.get(term)
+        if row is None:
+            return None
+        start, end = self.indptr[row], self.indptr[row + 1]
+        return self.docs[start:end], self.tfs[start:end]
+
+
+class GuidelineIndex:
+    """BM25 search over all ingested segments."""
+
+    def __init__(self, index_dir=GUIDELINE_INDEX):
+        manifest = load_manifest(index_dir)
+        self.segments = [Segment(os.path.join(index_dir, "segments", s["id"])) for s in manifest["segments"]]
+        self.total_passages = sum(len(segment.passages) for segment in self.segments)
+        total_length = sum(s["total_length"] for s in manifest["segments"])
+        self.average_length = total_length / self.total_passages if self.total_passages else 0.0
+
+    def search(self, query, k=GUIDELINE_TOP_K):
+        terms = set(tokenize(query))
+        if not terms or not self.total_passages:
+            return []
+        found = {term: [segment.postings(term) for segment in self.segments] for term in terms}
+        scores = [np.zeros(len(segment.passages), dtype=np.float32) for segment in self.segments]
+        for term, per_segment in found.items():
+            df = sum(len(p[0]) for p in per_segment if p is not None)
+            if not df:
+                continue
+            idf = math.log(1 + (self.total_passages - df + 0.5) / (df + 0.5))
+            for n, postings in enumerate(per_segment):
+                if postings is None:
+                    continue
+                docs, tfs = postings
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.segments[n].lengths[docs] / self.average_length)
+                scores[n][docs] += idf * tfs * (BM25_K1 + 1) / (tfs + norm)
+
+        candidates = []
+        for n, segment_scores in enumerate(scores):
+            top = np.argpartition(-segment_scores, min(k, len(segment_scores)) - 1)[:k]
+            candidates += [(float(segment_scores[i]), n, int(i)) for i in top if segment_scores[i] > 0]
+        candidates.sort(reverse=True)
+        return [
+            Passage(self.segments[n].passages[i]["text"], self.segments[n].source, self.segments[n].passages[i]["page"], score)
+            for score, n, i in candidates[:k]
+        ]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """The process-wide index, opened on first use. None if nothing has been ingested."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                if not os.path.exists(os.path.join(GUIDELINE_INDEX, "manifest.json")):
+                    print(f"No guideline index at {GUIDELINE_INDEX}; run `python triage_guidelines.py ingest` to build it")
+                    _index = False
+                else:
+                    try:
+                        _index = GuidelineIndex()
+                    except ImportError:  # Retrieval is optional; without NumPy the final advice prompt goes without passages
+                        print("NumPy is not installed, guideline retrieval is disabled")
+                        _index = False
+    return _index or None
+
+
+def guideline_passages(query, k=GUIDELINE_TOP_K):
+    """Top-k guideline passages for the query, or [] when retrieval is off or no index exists."""
+    if not USE_GUIDELINES:
+        return []
+    index = get_index()
+    return index.search(query, k) if index else []
+
+
+def passages_for_conversation(conversation, user_input, k=GUIDELINE_TOP_K):
+    """Passages matching what the patient said; the model's own questions are left out of the query."""
+    said = [line[len("Patient: "):] for line in conversation.split("\n") if line.startswith("Patient: ")]
+    return guideline_passages(" ".join([*said, user_input]), k)
+
+
+def format_passages(passages):
+    return "\n".join(f"[{n}] ({p.source}, p. {p.page}) {p.text}" for n, p in enumerate(passages, start=1))
+
+
+def default_documents(root=GUIDELINE_ROOT):
+    return sorted(glob.glob(os.path.join(root, "*.pdf")))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the guideline retrieval index.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = commands.add_parser("ingest", help="index new or changed documents")
+    ingest_parser.add_argument("paths", nargs="*", help="PDF or text files (default: the PDFs in the root)")
+    ingest_parser.add_argument("--index", default=GUIDELINE_INDEX)
+    ingest_parser.add_argument("--root", default=GUIDELINE_ROOT, help="directory documents are keyed relative to")
+    ingest_parser.add_argument("--prune", action="store_true", help="drop segments for documents not listed")
+    search_parser = commands.add_parser("search", help="print the top passages for a query")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--index", default=GUIDELINE_INDEX)
+    search_parser.add_argument("-k", type=int, default=GUIDELINE_TOP_K)
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        added, skipped, removed = ingest(args.paths or default_documents(args.root), args.index, args.prune, args.root)
+        print(f"{len(added)} indexed, {len(skipped)} unchanged, {len(removed)} removed")
+    else:
+        started = time.perf_counter()
+        passages = GuidelineIndex(args.index).search(args.query, args.k)
+        print(f"{len(passages)} passages in {(time.perf_counter() - started) * 1000:.1f} ms")
+        for passage in passages:
+            print(f"\n[{passage.score:.2f}] {passage.source}, p. {passage.page}\n{passage.text}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,444 @@
+import argparse
+import atexit
+import fcntl
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+
+import triage_db
+from triage_archive import archived_turns
+from triage_db import init_db, insert_turn, run_write, save_memory
+
+# Write-behind journal for chat turns. save_memory committed one SQLite
+# transaction per turn before /chat could answer. With the journal, a turn is
+# appended to a local append-only log (one write() of a JSON line) and the
+# request returns; a flusher thread inserts everything appended in the last
+# TRIAGE_JOURNAL_FLUSH_MS into chat_memory in one transaction, for all sessions.
+#
+#   - Read-your-writes: get_memory and get_turn_count here include turns that
+#     are still in the journal, so the next turn sees the previous one at once.
+#   - At-least-once: a turn is only removed from the log after its transaction
+#     commits. A process that dies leaves its log behind; the next process to
+#     start the journal replays it. Every turn carries a unique turn_uid, so a
+#     turn replayed after it had already been committed is skipped.
+#   - The log is written to the OS on every append, so it survives the process
+#     crashing. TRIAGE_JOURNAL_FSYNC=1 also fsyncs it before each commit,
+#     which bounds what a power loss can take to one flush interval.
+#   - close_journal() (on shutdown and at exit) commits what is left.
+#   - A flush that fails because of the database (locked, full, read-only, an
+#     I/O error), or in which every turn fails, is retried whole, with the wait
+#     between flushes doubled up to MAX_BACKOFF until one commits. Any other
+#     error splits the batch in halves until the turns that fail are found; the
+#     rest commit. A failing turn is retried with the next flushes and after
+#     DEAD_LETTER_ATTEMPTS failures it is moved to dead-letter.jsonl in
+#     TRIAGE_JOURNAL_DIR, so one bad turn cannot hold up the others forever.
+#     `python triage_journal.py replay-dead-letters` inserts them again once
+#     the cause is fixed. Turns a replayed log cannot commit are taken over by
+#     the replaying process's own log and retried like its own turns.
+#
+# Each process logs into its own directory under TRIAGE_JOURNAL_DIR, holding
+# an flock on it for its lifetime. Directories whose lock is free belong to
+# dead processes and are the ones replayed. The log is split into segments: each
+# flush starts a new one, and a segment is deleted once its turns are committed.
+#
+# TRIAGE_JOURNAL=0 writes every turn synchronously with save_memory instead.
+
+JOURNAL = os.getenv("TRIAGE_JOURNAL", "1") == "1"
+JOURNAL_DIR = os.getenv("TRIAGE_JOURNAL_DIR")  # Default: <database>-turnlog next to the database
+FLUSH_INTERVAL_MS = float(os.getenv("TRIAGE_JOURNAL_FLUSH_MS", "5"))
+JOURNAL_FSYNC = os.getenv("TRIAGE_JOURNAL_FSYNC", "0") == "1"
+CLOSE_ATTEMPTS = 3  # Flushes tried on shutdown before the rest is left for the next start to replay
+DEAD_LETTER_ATTEMPTS = 3  # Failed flushes of one turn (other than the database failing) before it is set aside
+MAX_BACKOFF = 5.0  # Longest wait in seconds between flushes while the database cannot take the batch
+
+_dead_letter_listeners = []  # Called with (patient_id, session_id) when a turn of the session is dead-lettered
+
+SELECT_MEMORY_UIDS_SQL = "SELECT user_input, ai_response, turn_uid FROM chat_memory WHERE patient_id=? AND session_id=? ORDER BY id ASC"
+
+
+class WriteBehindJournal:
+    def __init__(self, db_name=None, directory=None, flush_interval_ms=FLUSH_INTERVAL_MS, fsync=JOURNAL_FSYNC):
+        self.db_name = db_name or triage_db.DB_NAME
+        self.directory = directory or journal_directory(self.db_name)
+        self.flush_interval = flush_interval_ms / 1000
+        self._delay = self.flush_interval  # Wait before the next flush, longer while the database is failing
+        self.fsync = fsync
+        os.makedirs(self.directory, exist_ok=True)
+        self.owner_dir = os.path.join(self.directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}")
+        os.makedirs(self.owner_dir)
+        self._lock_fd = os.open(os.path.join(self.owner_dir, "lock"), os.O_CREAT | os.O_RDWR)
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # One flush at a time keeps each session's turns in order
+        self._pending = []  # Appended, not yet taken by a flush
+        self._by_session = {}  # (patient_id, session_id) -> deque of turns not yet committed
+        self._unflushed_segments = []  # Segments whose turns are not committed yet (flush side only)
+        self._segment_seq = 0
+        self._segment_fd = None
+        self._segment_path = None
+        self.dead_letter_path = os.path.join(self.directory, DEAD_LETTER_FILE)
+        self._failures = {}  # uid -> failed flushes of a turn that failed on its own
+        self._stats = {"appended": 0, "flushes": 0, "flushed_turns": 0, "failed_flushes": 0, "max_batch": 0,
+                       "flush_ms": 0.0, "recovered_turns": 0, "adopted_turns": 0, "dead_lettered": 0}
+        self._closed = False
+
+        init_db(self.db_name)  # Journal inserts need turn_uid
+        self._open_segment()  # Turns a replayed log cannot commit are logged again here
+        self._stats["recovered_turns"] = self.recover()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="journal-flusher", daemon=True)
+        self._thread.start()
+
+    def _open_segment(self):
+        self._segment_seq += 1
+        self._segment_path = os.path.join(self.owner_dir, f"{self._segment_seq:08d}.log")
+        self._segment_fd = os.open(self._segment_path, os.O_CREAT | os.O_WRONLY | os.O_APPEND, 0o600)
+
+    def append(self, patient_id, session_id, user_input, ai_response):
+        """Log one turn. It is visible to get_memory at once and committed within a flush interval."""
+        record = {"uid": uuid.uuid4().hex, "patient_id": patient_id, "session_id": session_id,
+                  "user_input": user_input, "ai_response": ai_response, "ts": time.time()}
+        line = (json.dumps(record) + "\n").encode("utf-8")
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("journal is closed")
+            os.write(self._segment_fd, line)
+            self._pending.append(record)
+            self._by_session.setdefault((patient_id, session_id), deque()).append(record)
+            self._stats["appended"] += 1
+        return record["uid"]
+
+    def pending_turns(self, patient_id, session_id):
+        """Turns of the session that may not be in chat_memory yet, oldest first."""
+        with self._lock:
+            return list(self._by_session.get((patient_id, session_id), ()))
+
+    def _commit(self, records):
+        """Insert records, in halves around the ones that fail. Returns (inserted, [(record, error)] that failed).
+        An OperationalError (locked, full, read-only, I/O) is raised instead: it is the database, not the records."""
+        try:
+            return _insert_turns(records, self.db_name), []
+        except sqlite3.Error as e:
+            if isinstance(e, sqlite3.OperationalError):
+                raise
+            if len(records) == 1:
+                return 0, [(records[0], e)]
+        middle = len(records) // 2
+        inserted, failed = self._commit(records[:middle])
+        more, failed_after = self._commit(records[middle:])
+        return inserted + more, failed + failed_after
+
+    def _dead_letter(self, record, error):
+        line = json.dumps({**record, "error": str(error), "dead_lettered_at": time.time()}) + "\n"
+        fd = os.open(self.dead_letter_path, os.O_CREAT | os.O_WRONLY | os.O_APPEND, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)  # replay_dead_letters rewrites the file under the same lock
+            os.write(fd, line.encode("utf-8"))
+            if self.fsync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+        print(f"Journal: turn {record['uid']} of session {record['session_id']} moved to {self.dead_letter_path}: {error}")
+
+    def flush(self):
+        """Commit everything appended so far. Returns the number of turns committed, or None if the commit failed.
+        Turns that fail on their own are retried by later flushes, then moved to the dead-letter file."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, []
+                fd, path = self._segment_fd, self._segment_path
+                self._open_segment()
+            if self.fsync:
+                os.fsync(fd)
+            os.close(fd)
+            self._unflushed_segments.append(path)
+
+            started = time.perf_counter()
+            try:
+                _, failed = self._commit(batch)
+            except sqlite3.Error as e:
+                return self._retry_batch(batch, e)
+            if len(batch) > 1 and len(failed) == len(batch):  # Not one turn went in: the database, not the turns
+                return self._retry_batch(batch, failed[0][1])
+            self._delay = self.flush_interval
+
+            retry, dead = [], []
+            for record, error in failed:
+                attempts = self._failures.get(record["uid"], 0) + 1
+                if attempts < DEAD_LETTER_ATTEMPTS:
+                    self._failures[record["uid"]] = attempts
+                    retry.append(record)
+                    print(f"Database Error (journal turn {record['uid']}, attempt {attempts}, will retry): {error}")
+                    continue
+                try:
+                    self._dead_letter(record, error)
+                except OSError as e:  # Kept, and tried again with the next flush
+                    print(f"Journal Error (dead letter): {e}")
+                    retry.append(record)
+                    continue
+                self._failures.pop(record["uid"], None)
+                dead.append(record)
+            if not retry:  # Every turn in the old segments is committed or set aside
+                for segment in self._unflushed_segments:
+                    os.remove(segment)
+                self._unflushed_segments = []
+            unresolved = {record["uid"] for record in retry}
+            with self._lock:
+                self._pending[:0] = retry
+                for record in batch:
+                    if record["uid"] in unresolved:
+                        continue
+                    self._failures.pop(record["uid"], None)
+                    key = (record["patient_id"], record["session_id"])
+                    self._by_session[key].remove(record)
+                    if not self._by_session[key]:
+                        del self._by_session[key]
+                committed = len(batch) - len(failed)
+                self._stats["flushes"] += 1
+                self._stats["flushed_turns"] += committed
+                self._stats["failed_flushes"] += 1 if failed else 0
+                self._stats["dead_lettered"] += len(dead)
+                self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+                self._stats["flush_ms"] += (time.perf_counter() - started) * 1000
+            for record in dead:
+                for listener in _dead_letter_listeners:
+                    listener(record["patient_id"], record["session_id"])
+            return committed
+
+    def _retry_batch(self, batch, error):
+        """Put back a batch that failed as a whole, and wait longer before the next flush."""
+        self._delay = min(max(self._delay, 0.005) * 2, MAX_BACKOFF)
+        print(f"Database Error (journal flush of {len(batch)} turns, retrying in {self._delay:.2f}s): {error}")
+        with self._lock:
+            self._pending[:0] = batch
+            self._stats["failed_flushes"] += 1
+        return None
+
+    def _adopt(self, records):
+        """Log turns of a replayed log again in this process's own log, to be retried by its flushes."""
+        lines = "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+        with self._lock:
+            os.write(self._segment_fd, lines)
+            os.fsync(self._segment_fd)  # The replayed log is deleted next
+            self._pending.extend(records)
+            for record in records:
+                self._by_session.setdefault((record["patient_id"], record["session_id"]), deque()).append(record)
+            self._stats["adopted_turns"] += len(records)
+
+    def _run(self):
+        while not self._stop.wait(self._delay):
+            self.flush()
+
+    def recover(self):
+        """Replay the logs of processes that died before committing them. Returns the turns inserted.
+        Turns that fail are taken over by this journal rather than dead-lettered straight away."""
+        recovered = 0
+        for name in sorted(os.listdir(self.directory)):
+            owner_dir = os.path.join(self.directory, name)
+            if owner_dir == self.owner_dir or not os.path.isdir(owner_dir):
+                continue
+            try:
+                lock_fd = os.open(os.path.join(owner_dir, "lock"), os.O_CREAT | os.O_RDWR)
+            except OSError:
+                continue
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:  # Its process is alive and flushing it
+                os.close(lock_fd)
+                continue
+            try:
+                records = []
+                for segment in sorted(f for f in os.listdir(owner_dir) if f.endswith(".log")):
+                    with open(os.path.join(owner_dir, segment), encoding="utf-8") as f:
+                        for line in f:
+                            try:
+                                records.append(json.loads(line))
+                            except ValueError:  # A line torn by the crash; it was never acknowledged
+                                pass
+                inserted, failed = self._commit(records)
+                if failed:
+                    self._adopt([record for record, _ in failed])
+                shutil.rmtree(owner_dir)
+                recovered += inserted
+                if records:
+                    print(f"Journal: replayed {len(records)} turns from {name}, {inserted} were not yet committed")
+            except (sqlite3.Error, OSError) as e:
+                print(f"Error (journal recovery of {name}, left for the next start): {e}")
+            finally:
+                os.close(lock_fd)
+        return recovered
+
+    def close(self):
+        """Stop the flusher and commit what is left. Turns that still cannot be committed stay in the log."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._stop.set()
+        self._thread.join()
+        for _ in range(CLOSE_ATTEMPTS):
+            self.flush()
+            with self._lock:
+                if not self._pending:
+                    break
+        with self._lock:
+            os.close(self._segment_fd)
+            committed = not self._pending
+        if committed:
+            shutil.rmtree(self.owner_dir, ignore_errors=True)
+        os.close(self._lock_fd)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = sum(len(turns) for turns in self._by_session.values())
+        flushes = stats["flushes"]
+        stats["avg_flush_ms"] = stats.pop("flush_ms") / flushes if flushes else 0.0
+        stats["avg_batch"] = stats["flushed_turns"] / flushes if flushes else 0.0
+        return stats
+
+
+DEAD_LETTER_FILE = "dead-letter.jsonl"
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def journal_directory(db_name):
+    return JOURNAL_DIR or f"{db_name}-turnlog"
+
+
+def _insert_turns(records, db_name):
+    return run_write(lambda conn: sum(insert_turn(conn, r["patient_id"], r["session_id"], r["user_input"],
+                                                  r["ai_response"], r["uid"], r.get("ts")) for r in records), db_name)
+
+
+def on_dead_letter(listener):
+    """Call listener(patient_id, session_id) whenever a turn of a session is dead-lettered."""
+    _dead_letter_listeners.append(listener)
+    return listener
+
+
+def replay_dead_letters(db_name=None, directory=None):
+    """Insert the turns in the dead-letter file again, once what made them fail is fixed. Turns that still
+    fail stay in the file. Returns (inserted, still failing). A database error stops it with the file unchanged."""
+    db_name = db_name or triage_db.DB_NAME
+    path = os.path.join(directory or journal_directory(db_name), DEAD_LETTER_FILE)
+    if not os.path.exists(path):
+        return 0, 0
+    init_db(db_name)
+    with open(path, "r+", encoding="utf-8") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)  # Journals append under the same lock
+        inserted, kept = 0, []
+        for line in f:
+            try:
+                inserted += _insert_turns([json.loads(line)], db_name)
+            except ValueError:  # Not a whole record; kept for a person to look at
+                kept.append(line if line.endswith("\n") else line + "\n")
+            except sqlite3.Error as e:
+                if isinstance(e, sqlite3.OperationalError):
+                    raise
+                kept.append(json.dumps({**json.loads(line), "error": str(e), "replayed_at": time.time()}) + "\n")
+        f.seek(0)
+        f.truncate()
+        f.writelines(kept)
+        f.flush()
+        os.fsync(f.fileno())
+    return inserted, len(kept)
+
+
+def get_journal():
+    """The process's journal for the default database, started (and replaying old logs) on first use.
+    None when TRIAGE_JOURNAL=0."""
+    global _journal
+    if not JOURNAL:
+        return None
+    if _journal is None:
+        with _journal_lock:
+            if _journal is None:
+                _journal = WriteBehindJournal()
+                atexit.register(_journal.close)
+    return _journal
+
+
+def start_journal():
+    """Start the journal now (on server startup), so logs left by a crashed process are replayed right away."""
+    get_journal()
+
+
+def close_journal():
+    if _journal is not None:
+        _journal.close()
+
+
+def record_turn(patient_id, session_id, user_input, ai_response):
+    """Store a turn: through the journal, or with save_memory when it is off. Returns False if that failed."""
+    journal = get_journal()
+    if journal is None:
+        return save_memory(patient_id, session_id, user_input, ai_response)
+    try:
+        journal.append(patient_id, session_id, user_input, ai_response)
+        return True
+    except (OSError, RuntimeError) as e:
+        print(f"Journal Error (record_turn): {e}")
+        return save_memory(patient_id, session_id, user_input, ai_response)
+
+
+def get_memory(patient_id, session_id):
+    """The session's whole history: turns in cold storage (triage_archive), in chat_memory and still in the journal."""
+    history = archived_turns(patient_id, session_id)
+    pending = _journal.pending_turns(patient_id, session_id) if _journal is not None else []
+    if not pending:  # Read after the snapshot: anything flushed before it is already committed
+        return history + triage_db.get_memory(patient_id, session_id)
+    try:
+        rows = triage_db.get_connection().execute(SELECT_MEMORY_UIDS_SQL, (patient_id, session_id)).fetchall()
+    except sqlite3.Error as e:
+        print(f"Database Error (get_memory): {e}")
+        rows = []
+    committed = {uid for _, _, uid in rows if uid}
+    return (history + [(u, a) for u, a, _ in rows]
+            + [(r["user_input"], r["ai_response"]) for r in pending if r["uid"] not in committed])
+
+
+def get_turn_count(patient_id, session_id):
+    """triage_db.get_turn_count plus the session's turns still in the journal."""
+    pending = _journal.pending_turns(patient_id, session_id) if _journal is not None else []
+    if not pending:
+        return triage_db.get_turn_count(patient_id, session_id)
+    uids = [r["uid"] for r in pending]
+    sql = (f"SELECT (SELECT turns FROM session_turns WHERE patient_id=? AND session_id=?), "
+           f"(SELECT COUNT(*) FROM chat_memory WHERE turn_uid IN ({','.join('?' * len(uids))}))")
+    try:  # One statement, so both counts come from the same snapshot
+        turns, committed = triage_db.get_connection().execute(sql, (patient_id, session_id, *uids)).fetchone()
+    except sqlite3.Error as e:
+        print(f"Database Error (get_turn_count): {e}")
+        return len(pending)
+    return (turns or 0) + len(pending) - committed
+
+
+def journal_stats():
+    return _journal.stats() if _journal is not None else {"enabled": JOURNAL, "started": False}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the turn journal.")
+    parser.add_argument("--db", default=triage_db.DB_NAME)
+    parser.add_argument("--dir", help="journal directory (default: TRIAGE_JOURNAL_DIR or <db>-turnlog)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("replay-dead-letters", help="insert the dead-lettered turns again")
+    args = parser.parse_args()
+
+    inserted, kept = replay_dead_letters(args.db, args.dir)
+    print(f"replayed dead letters: {inserted} turns inserted, {kept} still failing")
+
+
+if __name__ == "__main__":
+    main()
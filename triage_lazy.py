@@ -0,0 +1,26 @@
+import importlib
+
+# Optional heavy packages imported on first use, so a server that never builds a
+# semantic cache or searches the guideline index starts without them
+# (bench_startup.py checks which packages were imported at startup).
+#
+#   from triage_lazy import numpy as np
+#   np.zeros(3)                       # NumPy is imported here, on first attribute access
+#
+# A missing package raises ImportError at that first access.
+
+
+class LazyModule:
+    """Stands in for a module until an attribute is used, then imports it. Looked-up attributes are kept
+    on the instance, so later uses cost a plain attribute read."""
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        value = getattr(importlib.import_module(self._name), attr)
+        setattr(self, attr, value)
+        return value
+
+
+numpy = LazyModule("numpy")
@@ -0,0 +1,95 @@
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+from triage_cache import LRUTTLCache
+from triage_db import get_connection, run_write
+
+# Ollama's /api/generate returns a "context" array (the tokenized prompt and reply).
+# Sending it back with the next request lets Ollama reuse its KV cache, so only the
+# new patient message has to be prefilled instead of the whole conversation.
+# Contexts live in memory; set TRIAGE_PERSIST_OLLAMA_CONTEXT=1 to also keep them in
+# SQLite so they survive a restart.
+
+OLLAMA_CONTEXT_CACHE_SIZE = int(os.getenv("TRIAGE_OLLAMA_CONTEXT_CACHE_SIZE", "2000"))
+OLLAMA_CONTEXT_TTL = float(os.getenv("TRIAGE_OLLAMA_CONTEXT_TTL", "1800"))
+PERSIST_OLLAMA_CONTEXT = os.getenv("TRIAGE_PERSIST_OLLAMA_CONTEXT", "0") == "1"
+
+UPSERT_CONTEXT_SQL = """
+    INSERT INTO ollama_context (patient_id, session_id, model, context, updated_at) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (patient_id, session_id) DO UPDATE SET model=excluded.model, context=excluded.context, updated_at=excluded.updated_at
+"""
+SELECT_CONTEXT_SQL = "SELECT model, context FROM ollama_context WHERE patient_id=? AND session_id=?"
+DELETE_CONTEXT_SQL = "DELETE FROM ollama_context WHERE patient_id=? AND session_id=?"
+
+# Values are (model, token array); packed int32 arrays are ~7x smaller than lists of ints.
+_contexts = LRUTTLCache(
+    max_entries=OLLAMA_CONTEXT_CACHE_SIZE,
+    ttl=OLLAMA_CONTEXT_TTL,
+    sizeof=lambda value: value[1].itemsize * len(value[1]),
+)
+
+_prefill_lock = threading.Lock()
+_prefill = {"turns": 0, "reused_context_turns": 0, "prompt_tokens": 0, "prompt_eval_ms": 0.0, "last_prompt_tokens": 0, "last_prompt_eval_ms": 0.0}
+
+
+def get_context(patient_id, session_id, model):
+    """Return the stored context for a session as a list of token ids, or None."""
+    value = _contexts.get((patient_id, session_id))
+    if value is None and PERSIST_OLLAMA_CONTEXT:
+        try:
+            row = get_connection().execute(SELECT_CONTEXT_SQL, (patient_id, session_id)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Database Error (get_context): {e}")
+            row = None
+        if row:
+            value = (row[0], array("i", row[1]))
+            _contexts.set((patient_id, session_id), value)
+    if value is None or value[0] != model:  # A context is only meaningful to the model that produced it
+        return None
+    return value[1].tolist()
+
+
+def save_context(patient_id, session_id, model, context):
+    if not context:
+        return
+    tokens = array("i", context)
+    _contexts.set((patient_id, session_id), (model, tokens))
+    if PERSIST_OLLAMA_CONTEXT:
+        try:
+            run_write(lambda conn: conn.execute(UPSERT_CONTEXT_SQL, (patient_id, session_id, model, tokens.tobytes(), time.time())))
+        except sqlite3.Error as e:
+            print(f"Database Error (save_context): {e}")
+
+
+def drop_context(patient_id, session_id):
+    """Forget a session's context. Call it when a turn is answered without the model (a cache hit or a
+    red flag): the context no longer covers the conversation, so the next prompt is rebuilt from history."""
+    _contexts.pop((patient_id, session_id))
+    if PERSIST_OLLAMA_CONTEXT:
+        try:
+            run_write(lambda conn: conn.execute(DELETE_CONTEXT_SQL, (patient_id, session_id)))
+        except sqlite3.Error as e:
+            print(f"Database Error (drop_context): {e}")
+
+
+def record_prefill(result, reused_context):
+    """Track Ollama's prompt_eval_count / prompt_eval_duration (nanoseconds) for /metrics and benchmarks."""
+    tokens = result.get("prompt_eval_count", 0)
+    eval_ms = result.get("prompt_eval_duration", 0) / 1e6
+    with _prefill_lock:
+        _prefill["turns"] += 1
+        _prefill["reused_context_turns"] += 1 if reused_context else 0
+        _prefill["prompt_tokens"] += tokens
+        _prefill["prompt_eval_ms"] += eval_ms
+        _prefill["last_prompt_tokens"] = tokens
+        _prefill["last_prompt_eval_ms"] = eval_ms
+
+
+def context_stats():
+    with _prefill_lock:
+        stats = dict(_prefill)
+    stats["cache"] = _contexts.stats()
+    return stats
@@ -0,0 +1,142 @@
+import json
+import os
+import re
+from collections import namedtuple
+
+# Rule-based emergency pre-screen. Every patient message is checked against the
+# red-flag rules in triage_red_flags.json before any model call; on a match the
+# emergency message is returned straight away instead of waiting for the model.
+#
+# All rules are compiled into one regex alternation with a named group per rule,
+# so a message is scanned once whatever the number of phrases. A match preceded
+# (within the same clause) by a negation such as "no" or "don't have" is ignored,
+# so "no chest pain" does not trigger. So is a match that is history: a time
+# phrase before it or after it ("two years ago", "as a child", but not "since
+# last month"), "history of" before it, "it is gone now" after it, or a relative
+# who is its subject ("my father had a stroke"; "my friend drove me here because
+# I can't breathe" is not about the friend). Nothing is treated as history when
+# the message says it is happening now ("now", "today", "worse", "getting").
+# Rule files are versioned; the version is logged with every match.
+
+RED_FLAG_RULES = os.getenv("TRIAGE_RED_FLAG_RULES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "triage_red_flags.json"))
+NEGATION_WINDOW = 3  # Words before a match that are checked for a negation
+HISTORY_WINDOW = 6  # Words before a match that are checked for a time phrase or a relative ("my father has had a")
+
+RedFlagMatch = namedtuple("RedFlagMatch", ["rule_id", "category", "phrase", "version"])
+
+_CLAUSE_BREAK = re.compile(r"[.,;:!?\n]| but | and then | and now ")
+
+
+def normalize_text(text):
+    return re.sub(r"\s+", " ", text.lower().replace("’", "'").replace("‌", " ")).strip()
+
+
+def _phrase_pattern(phrases):
+    """One regex for a list of whole-word phrases, longest first, or None for an empty list."""
+    escaped = sorted((re.escape(normalize_text(p)) for p in phrases), key=len, reverse=True)
+    return re.compile(rf"(?<!\w)(?:{'|'.join(escaped)})(?!\w)") if escaped else None
+
+
+class RedFlagMatcher:
+    """Compiled red-flag rules. match() returns the first RedFlagMatch that is not negated or history, or None."""
+
+    def __init__(self, rules):
+        self.version = rules["version"]
+        self.message = rules["message"]
+        self.rules = {}
+        alternatives = []
+        for n, rule in enumerate(rules["rules"]):
+            group = f"r{n}"
+            self.rules[group] = rule
+            parts = [re.escape(normalize_text(phrase)) for phrase in rule.get("phrases", [])]
+            parts += rule.get("patterns", [])
+            if parts:
+                # Longest first, so "chest pains" wins over "chest pain"
+                alternatives.append(f"(?P<{group}>{'|'.join(sorted(parts, key=len, reverse=True))})")
+        self.pattern = re.compile(rf"(?<!\w)(?:{'|'.join(alternatives)})(?!\w)")
+        self.negation = _phrase_pattern(rules.get("negations", []))
+        self.history = _phrase_pattern(rules.get("history", []))
+        self.history_before = _phrase_pattern(rules.get("history_before", []))
+        self.resolved = _phrase_pattern(rules.get("resolved", []))
+        self.third_party = _phrase_pattern(rules.get("third_parties", []))
+        self.third_party_words = {normalize_text(w) for w in rules.get("third_party_words", [])}
+        self.ongoing_since = {normalize_text(w) for w in rules.get("ongoing_since", [])}
+        self.present = _phrase_pattern(rules.get("present", []))
+
+    @classmethod
+    def from_file(cls, path=RED_FLAG_RULES):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def negated(self, text, start):
+        if self.negation is None:
+            return False
+        clause = _CLAUSE_BREAK.split(text[:start])[-1]
+        window = " ".join(clause.split()[-NEGATION_WINDOW:])
+        return bool(self.negation.search(window))
+
+    def _time_phrase(self, text):
+        """True if text has a time phrase that is not the start of an ongoing period ("since last month")."""
+        for found in self.history.finditer(text) if self.history is not None else ():
+            words = text[:found.start()].split()
+            if not words or words[-1] not in self.ongoing_since:
+                return True
+        return False
+
+    def _about_relative(self, before):
+        """True if a relative is the subject of the match: only words like "had a" come between them."""
+        found = None
+        for found in self.third_party.finditer(before) if self.third_party is not None else ():
+            pass
+        return found is not None and all(w in self.third_party_words for w in before[found.end():].split())
+
+    def _happening_now(self, text):
+        if self.present is None:
+            return False
+        if self.resolved is not None:
+            text = self.resolved.sub(" ", text)  # "it is gone now" is not a present marker
+        return bool(self.present.search(text))
+
+    def past_or_other(self, text, start, end):
+        """True if the match is about the past or about a relative, and the message does not say it is
+        happening now."""
+        before = " ".join(_CLAUSE_BREAK.split(text[:start])[-1].split()[-HISTORY_WINDOW:])
+        after = " ".join(_CLAUSE_BREAK.split(text[end:], maxsplit=2)[:2])
+        history = (self._about_relative(before) or self._time_phrase(before) or self._time_phrase(after)
+                   or (self.history_before is not None and bool(self.history_before.search(before)))
+                   or (self.resolved is not None and bool(self.resolved.search(after))))
+        return history and not self._happening_now(text)
+
+    def match(self, text):
+        text = normalize_text(text)
+        for found in self.pattern.finditer(text):
+            if not self.negated(text, found.start()) and not self.past_or_other(text, found.start(), found.end()):
+                rule = self.rules[found.lastgroup]
+                return RedFlagMatch(rule["id"], rule.get("category"), found.group(), self.version)
+        return None
+
+
+_matcher = None
+
+
+def get_matcher():
+    global _matcher
+    if _matcher is None:
+        _matcher = RedFlagMatcher.from_file()
+        print(f"Loaded red-flag rules version {_matcher.version} ({len(_matcher.rules)} rules)")
+    return _matcher
+
+
+def screen_red_flags(user_input, session_id=None):
+    """The emergency message if user_input hits a red-flag rule, else None. Matches are logged."""
+    matcher = get_matcher()
+    found = matcher.match(user_input)
+    if found is None:
+        return None
+    print(f"Red flag '{found.rule_id}' ({found.category}) matched '{found.phrase}' "
+          f"in session {session_id} (rules version {found.version})")
+    return matcher.message
+
+
+def is_red_flag(text):
+    return get_matcher().match(text) is not None
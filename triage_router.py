@@ -0,0 +1,267 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from triage_backends import LLMBackendError, get_backend
+
+# Latency-aware router over several LLM backends. Each triage turn goes to the
+# healthy backend with the lowest median latency. A backend that keeps failing is
+# taken out of rotation for a cooldown period, and a failed call fails over to the
+# next backend. With hedging enabled, a duplicate request is sent to the runner-up
+# once the primary has been slower than its own hedge percentile; the first answer wins.
+#
+# Select it with TRIAGE_LLM_BACKEND=router and TRIAGE_ROUTER_BACKENDS=ollama,openai,...
+
+ROUTER_BACKENDS = os.getenv("TRIAGE_ROUTER_BACKENDS", "ollama,openai")
+ROUTER_HEDGE = os.getenv("TRIAGE_ROUTER_HEDGE", "1") == "1"
+HEDGE_PERCENTILE = float(os.getenv("TRIAGE_ROUTER_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = 20  # Don't hedge until the primary's latency distribution is known
+LATENCY_WINDOW = 200  # Recent calls kept per backend
+FAILURE_THRESHOLD = 3  # Consecutive failures before a backend is taken out of rotation
+COOLDOWN_SECONDS = 30.0
+MAX_ERROR_RATE = 0.5  # Over the window; a backend above this is treated as unhealthy
+MIN_ERROR_SAMPLES = 10
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _discard_outcome(task):
+    """Consume the outcome of an abandoned hedge so asyncio does not log it as unretrieved."""
+    if not task.cancelled():
+        task.exception()
+
+
+class BackendHealth:
+    """Rolling latency and error statistics for one backend."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.latencies = deque(maxlen=window)  # Seconds, successful calls only
+        self.outcomes = deque(maxlen=window)  # True for success
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.hedges = 0
+        self.lock = threading.Lock()
+
+    def record_success(self, elapsed):
+        with self.lock:
+            self.calls += 1
+            self.latencies.append(elapsed)
+            self.outcomes.append(True)
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.calls += 1
+            self.errors += 1
+            self.outcomes.append(False)
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= FAILURE_THRESHOLD:
+                self.open_until = time.monotonic() + COOLDOWN_SECONDS
+
+    def record_hedge(self):
+        with self.lock:
+            self.hedges += 1
+
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def healthy(self):
+        if time.monotonic() < self.open_until:
+            return False
+        return len(self.outcomes) < MIN_ERROR_SAMPLES or self.error_rate() <= MAX_ERROR_RATE
+
+    def latency(self, pct):
+        with self.lock:
+            return percentile(list(self.latencies), pct)
+
+    def stats(self):
+        p50 = self.latency(50)
+        p99 = self.latency(99)
+        return {
+            "healthy": self.healthy(),
+            "calls": self.calls,
+            "errors": self.errors,
+            "error_rate": self.error_rate(),
+            "hedges": self.hedges,
+            "p50_ms": p50 * 1000 if p50 is not None else None,
+            "p99_ms": p99 * 1000 if p99 is not None else None,
+        }
+
+
+class LatencyRouter:
+    """Routes generate/agenerate/stream calls across backends. Used wherever a backend is expected."""
+
+    name = "router"
+    model = "router"
+    supports_context = False  # Hedges and failover may answer from a backend without the session's context
+    reply_max_tokens = 150  # The prompt is built before a backend is picked, so every backend gets the defaults
+    markdown_prompts = True
+
+    def __init__(self, backends, hedge=ROUTER_HEDGE, hedge_percentile=HEDGE_PERCENTILE, max_workers=64):
+        self.backends = list(backends)
+        self.health = {backend.name: BackendHealth() for backend in self.backends}
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-router")
+
+    @classmethod
+    def from_env(cls):
+        names = [name.strip() for name in ROUTER_BACKENDS.split(",") if name.strip()]
+        return cls([get_backend(name) for name in names])
+
+    def ranked(self):
+        """Healthy backends fastest first (unmeasured ones first, so they get probed), then unhealthy ones as a last resort."""
+        def median(backend):
+            return self.health[backend.name].latency(50) or 0.0
+
+        healthy = [b for b in self.backends if self.health[b.name].healthy()]
+        unhealthy = [b for b in self.backends if not self.health[b.name].healthy()]
+        return sorted(healthy, key=median) + sorted(unhealthy, key=lambda b: self.health[b.name].open_until)
+
+    def hedge_delay(self, backend):
+        if not self.hedge:
+            return None
+        health = self.health[backend.name]
+        if len(health.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return health.latency(self.hedge_percentile)
+
+    def _call(self, backend, prompt, kwargs):
+        started = time.perf_counter()
+        try:
+            result = backend.generate(prompt, **kwargs)
+        except LLMBackendError:
+            self.health[backend.name].record_failure()
+            raise
+        self.health[backend.name].record_success(time.perf_counter() - started)
+        return result
+
+    async def _acall(self, backend, prompt, kwargs):
+        started = time.perf_counter()
+        try:
+            result = await backend.agenerate(prompt, **kwargs)
+        except LLMBackendError:
+            self.health[backend.name].record_failure()
+            raise
+        self.health[backend.name].record_success(time.perf_counter() - started)
+        return result
+
+    def generate(self, prompt, **kwargs):
+        kwargs.pop("context", None)
+        candidates = self.ranked()
+        errors = []
+        while candidates:
+            primary = candidates.pop(0)
+            pending = {self._executor.submit(self._call, primary, prompt, kwargs)}
+            delay = self.hedge_delay(primary)
+            while pending:
+                timeout = delay if delay is not None and candidates else None
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    # The primary is slower than usual: race it against the next backend.
+                    hedge = candidates.pop(0)
+                    self.health[primary.name].record_hedge()
+                    pending.add(self._executor.submit(self._call, hedge, prompt, kwargs))
+                    delay = None
+                    continue
+                for future in done:
+                    try:
+                        return future.result()
+                    except LLMBackendError as e:
+                        errors.append(str(e))
+        raise LLMBackendError(self.name, f"all backends failed: {'; '.join(errors)}")
+
+    async def agenerate(self, prompt, **kwargs):
+        kwargs.pop("context", None)
+        candidates = self.ranked()
+        errors = []
+        while candidates:
+            primary = candidates.pop(0)
+            pending = {asyncio.ensure_future(self._acall(primary, prompt, kwargs))}
+            delay = self.hedge_delay(primary)
+            while pending:
+                timeout = delay if delay is not None and candidates else None
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedge = candidates.pop(0)
+                    self.health[primary.name].record_hedge()
+                    pending.add(asyncio.ensure_future(self._acall(hedge, prompt, kwargs)))
+                    delay = None
+                    continue
+                results = []
+                for task in done:  # Retrieve every finished task so no exception goes unobserved
+                    try:
+                        results.append(task.result())
+                    except LLMBackendError as e:
+                        errors.append(str(e))
+                if results:
+                    for loser in pending:
+                        loser.cancel()
+                        loser.add_done_callback(_discard_outcome)
+                    return results[0]
+        raise LLMBackendError(self.name, f"all backends failed: {'; '.join(errors)}")
+
+    # Streams fail over only until the first token has been sent, and are never hedged.
+    def stream(self, prompt, **kwargs):
+        kwargs.pop("context", None)
+        errors = []
+        for backend in self.ranked():
+            started = time.perf_counter()
+            sent = False
+            try:
+                for item in backend.stream(prompt, **kwargs):
+                    sent = True
+                    yield item
+            except LLMBackendError as e:
+                self.health[backend.name].record_failure()
+                if sent:
+                    raise
+                errors.append(str(e))
+                continue
+            self.health[backend.name].record_success(time.perf_counter() - started)
+            return
+        raise LLMBackendError(self.name, f"all backends failed: {'; '.join(errors)}")
+
+    async def astream(self, prompt, **kwargs):
+        kwargs.pop("context", None)
+        errors = []
+        for backend in self.ranked():
+            started = time.perf_counter()
+            sent = False
+            try:
+                async for item in backend.astream(prompt, **kwargs):
+                    sent = True
+                    yield item
+            except LLMBackendError as e:
+                self.health[backend.name].record_failure()
+                if sent:
+                    raise
+                errors.append(str(e))
+                continue
+            self.health[backend.name].record_success(time.perf_counter() - started)
+            return
+        raise LLMBackendError(self.name, f"all backends failed: {'; '.join(errors)}")
+
+    def stats(self):
+        return {backend.name: self.health[backend.name].stats() for backend in self.backends}
+
+    def close(self):
+        for backend in self.backends:
+            backend.close()
+
+    async def aclose(self):
+        for backend in self.backends:
+            await backend.aclose()
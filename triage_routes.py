@@ -0,0 +1,71 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from triage_analytics import analytics_summary
+from triage_archive import start_archiver
+from triage_auth import verify_credentials
+from triage_export import MEDIA_TYPES, export_chunks, iter_pages, parse_day
+from triage_journal import close_journal, start_journal
+from triage_summary_report import get_report, start_report_workers
+
+# Routes and lifecycle hooks that do not depend on how a server talks to its
+# model: summary reports, the export and dashboard counters, and starting and
+# stopping the background work (report workers, the turn journal, the
+# archiver). The app includes them with app.include_router(router).
+
+router = APIRouter()
+
+
+@router.get("/sessions/{session_id}/summary")
+def session_summary(session_id: str, patient_id: str, username: str = Depends(verify_credentials)):
+    """The summary report started by the session's final turn: 202 while it is being written."""
+    status, report = get_report(patient_id, session_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="No summary report for this session.")
+    if status == "failed":
+        raise HTTPException(status_code=502, detail="Generating the summary report failed.")
+    if status == "pending":
+        return JSONResponse(status_code=202, content={"status": "pending"})
+    return {"status": "ready", "summary": report}
+
+
+@router.get("/export")
+def export(export_format: str = Query("ndjson", alias="format"), since: Optional[str] = None, until: Optional[str] = None,
+           username: str = Depends(verify_credentials)):
+    """Streams chat_memory as NDJSON or CSV a page at a time; since/until are UTC days or ISO 8601 timestamps."""
+    if export_format not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Export format must be ndjson or csv.")
+    try:
+        pages = iter_pages(parse_day(since) if since else None, parse_day(until) if until else None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(export_chunks(export_format, pages), media_type=MEDIA_TYPES[export_format],
+                             headers={"Content-Disposition": f"attachment; filename=chat_memory.{export_format}"})
+
+
+@router.get("/analytics")
+def analytics(days: int = Query(30, ge=1, le=366), username: str = Depends(verify_credentials)):
+    """Dashboard counters kept up to date as turns are stored: sessions, turns and emergencies per day."""
+    return analytics_summary(days)
+
+
+@router.on_event("startup")
+def resume_journal():
+    start_journal()  # Replays turns a crashed process logged but never committed
+
+
+@router.on_event("startup")
+def resume_reports():
+    start_report_workers()  # Picks up summary reports queued before a restart
+
+
+@router.on_event("startup")
+def schedule_archiving():
+    start_archiver()  # Moves idle sessions to cold storage and compacts the database
+
+
+@router.on_event("shutdown")
+def flush_journal():
+    close_journal()
@@ -0,0 +1,217 @@
+import os
+import re
+import threading
+import time
+import zlib
+
+from triage_context_cache import format_conversation
+from triage_lazy import numpy as np
+from triage_red_flags import is_red_flag
+
+# Semantic answer cache. Sessions often open with close variants of the same
+# conversation ("I have back pain" / "my back hurts since yesterday"), so the
+# recent window of the conversation is embedded locally and, when a stored window
+# is similar enough, its follow-up question is reused instead of calling the model.
+#
+# Embeddings are hashed word and character n-grams: no model download, works for
+# any script (the chat history has English and Persian), ~0.1 ms per window.
+# The index is a flat NumPy matrix (exact cosine search), or hnswlib's HNSW graph
+# when TRIAGE_SEMANTIC_INDEX=hnsw and hnswlib is installed.
+#
+# Off by default; enable with TRIAGE_SEMANTIC_CACHE=1. Turns that hit a red-flag
+# rule (triage_red_flags.py) never read from or write to the cache, and final
+# advice is never cached.
+
+SEMANTIC_CACHE = os.getenv("TRIAGE_SEMANTIC_CACHE", "0") == "1"
+SEMANTIC_THRESHOLD = float(os.getenv("TRIAGE_SEMANTIC_THRESHOLD", "0.95"))  # Cosine similarity needed for a hit
+SEMANTIC_CACHE_SIZE = int(os.getenv("TRIAGE_SEMANTIC_CACHE_SIZE", "20000"))  # Entries per partition, oldest replaced first
+SEMANTIC_WINDOW_TURNS = int(os.getenv("TRIAGE_SEMANTIC_WINDOW_TURNS", "2"))  # Earlier turns embedded with the new message
+SEMANTIC_INDEX = os.getenv("TRIAGE_SEMANTIC_INDEX", "flat")  # flat or hnsw
+EMBEDDING_DIM = 512
+
+EMERGENCY_ADVICE = re.compile(r"emergency|911", re.IGNORECASE)  # Model answers that escalate are never reused
+
+
+def is_emergency(text):
+    return is_red_flag(text) or bool(EMERGENCY_ADVICE.search(text))
+
+
+def _features(text):
+    words = re.findall(r"\w+", text.lower())
+    yield from words
+    yield from (f"{a} {b}" for a, b in zip(words, words[1:]))
+    for word in words:  # Character trigrams absorb typos such as "backpani"
+        padded = f"#{word}#"
+        yield from (padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def embed(text, dim=EMBEDDING_DIM):
+    """L2-normalized hashed n-gram vector (float32). Stable across processes, unlike hash()."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature in _features(text):
+        h = zlib.crc32(feature.encode("utf-8"))
+        vector[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def conversation_window(history, user_input, turns=SEMANTIC_WINDOW_TURNS):
+    """The last `turns` of the session's (user_input, ai_response) turns plus the new patient message."""
+    recent = format_conversation(history[-turns:]) if turns and history else ""
+    return "\n".join(part for part in (recent, f"Patient: {user_input}") if part)
+
+
+class FlatIndex:
+    """Exact cosine search over a matrix that doubles as it fills. Once at capacity the oldest entry is overwritten."""
+
+    def __init__(self, capacity, dim=EMBEDDING_DIM):
+        self.vectors = np.zeros((min(capacity, 1024), dim), dtype=np.float32)
+        self.capacity = capacity
+        self.count = 0
+        self.next = 0
+
+    def add(self, vector):
+        slot = self.next
+        if slot == len(self.vectors):
+            grown = np.zeros((min(self.capacity, 2 * len(self.vectors)), self.vectors.shape[1]), dtype=np.float32)
+            grown[:slot] = self.vectors
+            self.vectors = grown
+        self.vectors[slot] = vector
+        self.next = (slot + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        return slot
+
+    def search(self, vector):
+        """(slot, similarity) of the nearest entry, or (None, 0.0) when empty."""
+        if not self.count:
+            return None, 0.0
+        scores = self.vectors[:self.count] @ vector
+        slot = int(np.argmax(scores))
+        return slot, float(scores[slot])
+
+
+class HNSWIndex:
+    """Approximate search with hnswlib. Same interface and replacement policy as FlatIndex."""
+
+    def __init__(self, capacity, dim=EMBEDDING_DIM):
+        import hnswlib
+
+        self.index = hnswlib.Index(space="ip", dim=dim)  # Inner product on normalized vectors is cosine
+        self.index.init_index(max_elements=capacity, ef_construction=100, M=16)
+        self.index.set_ef(32)
+        self.capacity = capacity
+        self.count = 0
+        self.next = 0
+
+    def add(self, vector):
+        slot = self.next
+        self.index.add_items(vector[np.newaxis], [slot])  # Re-adding a label replaces its vector
+        self.next = (slot + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        return slot
+
+    def search(self, vector):
+        if not self.count:
+            return None, 0.0
+        labels, distances = self.index.knn_query(vector[np.newaxis], k=1)
+        return int(labels[0][0]), 1.0 - float(distances[0][0])
+
+
+def make_index(capacity, kind=SEMANTIC_INDEX):
+    if kind == "hnsw":
+        try:
+            return HNSWIndex(capacity)
+        except ImportError:
+            print("hnswlib is not installed, the semantic cache uses the flat index")
+    return FlatIndex(capacity)
+
+
+class SemanticCache:
+    """Follow-up questions indexed by the embedded conversation window.
+
+    Entries are partitioned (by backend, model and turn number), so a question is only
+    reused for the same phase of the triage and the same model.
+    """
+
+    def __init__(self, threshold=SEMANTIC_THRESHOLD, capacity=SEMANTIC_CACHE_SIZE, index=SEMANTIC_INDEX):
+        self.threshold = threshold
+        self.capacity = capacity
+        self.index_kind = index
+        self._partitions = {}  # partition -> (index, questions by slot)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.lookup_seconds = 0.0
+
+    def lookup(self, partition, window):
+        if is_emergency(window):
+            self.bypassed += 1
+            return None
+        started = time.perf_counter()
+        vector = embed(window)
+        with self._lock:
+            entry = self._partitions.get(partition)
+            slot, similarity = entry[0].search(vector) if entry else (None, 0.0)
+            question = entry[1][slot] if slot is not None and similarity >= self.threshold else None
+            self.lookup_seconds += time.perf_counter() - started
+            if question is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return question
+
+    def store(self, partition, window, question):
+        if not question or is_emergency(window) or is_emergency(question):
+            return
+        vector = embed(window)
+        with self._lock:
+            entry = self._partitions.get(partition)
+            if entry is None:
+                entry = self._partitions[partition] = (make_index(self.capacity, self.index_kind), [])
+            slot = entry[0].add(vector)
+            if slot == len(entry[1]):
+                entry[1].append(question)
+            else:
+                entry[1][slot] = question
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "index": self.index_kind,
+            "threshold": self.threshold,
+            "entries": sum(index.count for index, _ in list(self._partitions.values())),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "bypassed": self.bypassed,
+            "mean_lookup_ms": self.lookup_seconds / lookups * 1000 if lookups else 0.0,
+        }
+
+
+_semantic_cache = None
+if SEMANTIC_CACHE:
+    try:
+        _semantic_cache = SemanticCache()
+    except ImportError:  # The semantic cache is optional; without NumPy it stays off
+        print("NumPy is not installed, the semantic cache is disabled")
+
+
+def get_similar_question(backend, history, user_input, question_count):
+    """A stored follow-up question for a similar conversation window, or None. history is the session's turns."""
+    if _semantic_cache is None:
+        return None
+    window = conversation_window(history, user_input)
+    return _semantic_cache.lookup((backend.name, backend.model, question_count), window)
+
+
+def store_similar_question(backend, history, user_input, question_count, question):
+    if _semantic_cache is not None:
+        window = conversation_window(history, user_input)
+        _semantic_cache.store((backend.name, backend.model, question_count), window, question)
+
+
+def semantic_cache_stats():
+    if _semantic_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **_semantic_cache.stats()}
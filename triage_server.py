@@ -0,0 +1,66 @@
+import argparse
+import importlib
+import os
+import sys
+
+# Single entry point for the triage API servers:
+#
+#     python -m triage_server serve --backend ollama [--host 0.0.0.0] [--port 8000]
+#
+# The app (triageAI.py) is imported only once the command line has been parsed,
+# with TRIAGE_LLM_BACKEND set to the selected backend, which is the only one it
+# loads. Heavy optional pieces (NumPy for guideline retrieval and the semantic
+# cache, the HTTP clients, hnswlib, pypdf) are imported on first use rather than
+# at startup, and API keys are checked here before the server binds its port.
+#
+# bench_startup.py measures the import cost of each app.
+
+APP_MODULE = "triageAI"  # Every backend in triage_backends.py
+BACKENDS = ["ollama", "openai", "grok", "deepseek", "vllm", "router", "batched"]
+REQUIRED_KEYS = {  # Hosted backends refuse requests without a key, so fail at startup instead
+    "openai": "OPENAI_API_KEY",
+    "grok": "GROK_API_KEY",
+    "deepseek": "DEEPSEEK_API_KEY",
+}
+
+DEFAULT_HOST = os.getenv("TRIAGE_HOST", "127.0.0.1")
+DEFAULT_PORT = int(os.getenv("TRIAGE_PORT", "8000"))
+
+
+def load_app(backend):
+    """Import and return the app module serving this backend."""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    os.environ["TRIAGE_LLM_BACKEND"] = backend  # Read by triage_backends at import
+    return importlib.import_module(APP_MODULE)
+
+
+def serve(backend, host=DEFAULT_HOST, port=DEFAULT_PORT, log_level="info"):
+    key = REQUIRED_KEYS.get(backend)
+    if key and not os.getenv(key):
+        sys.exit(f"{key} is not set; the {backend} backend needs it.")
+    app_module = load_app(backend)
+
+    import uvicorn
+
+    app_module.init_db()
+    uvicorn.run(app_module.app, host=host, port=port, log_level=log_level)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m triage_server", description="Run a triage API server.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="serve the triage API for one LLM backend")
+    serve_parser.add_argument("--backend", choices=BACKENDS, default=os.getenv("TRIAGE_LLM_BACKEND", "ollama"))
+    serve_parser.add_argument("--host", default=DEFAULT_HOST)
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.backend, args.host, args.port, args.log_level)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from triage_cache import LRUTTLCache
+from triage_db import get_connection, init_session_db, run_write
+
+# Conversation state for the Telegram bots (session_id and the user's name per
+# chat), kept outside the bot process so a restart or another bot process on the
+# same host picks up every triage in progress. The SQLite backend is a file on
+# the host, so bot processes on other hosts do not share it.
+#
+#   store = get_session_store()                   # TRIAGE_SESSION_STORE=sqlite (default) or memory
+#   store.start(chat_id, user_info)               # /start: new session
+#   store.get(chat_id)                            # dict, or None before /start
+#   store.claim(update_id)                        # False if another process already took this update
+#
+# Reads go through an in-memory LRU. Writes are write-through: a caller returns
+# only once its write has committed, but all writes queued while a transaction
+# commits go into the next one together (group commit), so many bot processes
+# writing at once do not pay one fsync-bound transaction each.
+#
+# The triage API counts each session's turns itself (session_turns), so the
+# store keeps no turn counter. claim() lets the bot processes agree on who
+# handles a redelivered Telegram update.
+#
+# Each process's LRU sees its own writes immediately. A cache hit is checked
+# against the stored session_id (one primary-key lookup), so a /start handled
+# by another process is seen on the next message instead of once the cached
+# entry expires; a changed session is reloaded. TRIAGE_SESSION_CACHE_TTL=0
+# always reads the whole state through.
+
+SESSION_STORE = os.getenv("TRIAGE_SESSION_STORE", "sqlite")
+SESSION_DB = os.getenv("TRIAGE_SESSION_DB", "bot_sessions.db")
+SESSION_CACHE_SIZE = int(os.getenv("TRIAGE_SESSION_CACHE_SIZE", "10000"))
+SESSION_CACHE_TTL = float(os.getenv("TRIAGE_SESSION_CACHE_TTL", "30"))
+WRITE_BATCH_SIZE = int(os.getenv("TRIAGE_SESSION_WRITE_BATCH", "256"))  # Writes per transaction at most
+UPDATE_CLAIM_TTL = 24 * 3600  # Telegram stops redelivering long before this
+
+UPSERT_SESSION_SQL = """
+    INSERT INTO bot_sessions (store_key, session_id, state, updated_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT (store_key) DO UPDATE SET session_id=excluded.session_id, state=excluded.state, updated_at=excluded.updated_at
+"""
+SELECT_SESSION_SQL = "SELECT state FROM bot_sessions WHERE store_key=?"
+SELECT_SESSION_ID_SQL = "SELECT session_id FROM bot_sessions WHERE store_key=?"
+CLAIM_UPDATE_SQL = "INSERT OR IGNORE INTO bot_updates (update_key, claimed_at) VALUES (?, ?)"
+PRUNE_UPDATES_SQL = "DELETE FROM bot_updates WHERE claimed_at < ?"
+
+
+class MemorySessionBackend:
+    """Process-local backend, for a single bot process and for tests."""
+
+    def __init__(self):
+        self._sessions = {}
+        self._claimed = OrderedDict()  # update key -> claimed at, oldest first; kept for UPDATE_CLAIM_TTL like bot_updates
+        self._lock = threading.Lock()
+
+    def load(self, key):
+        with self._lock:
+            state = self._sessions.get(key)
+            return dict(state) if state else None
+
+    def session_id(self, key):
+        with self._lock:
+            state = self._sessions.get(key)
+            return state["session_id"] if state else None
+
+    def apply(self, ops):
+        with self._lock:
+            return [self._apply(op, *args) for op, *args in ops]
+
+    def _apply(self, op, *args):
+        if op == "start":
+            key, state = args
+            self._sessions[key] = dict(state)
+            return dict(state)
+        now = time.time()
+        while self._claimed and next(iter(self._claimed.values())) < now - UPDATE_CLAIM_TTL:
+            self._claimed.popitem(last=False)
+        claimed = args[0] not in self._claimed
+        self._claimed.setdefault(args[0], now)
+        return claimed
+
+
+class SQLiteSessionBackend:
+    """bot_sessions / bot_updates tables in TRIAGE_SESSION_DB, shared by every bot process on the host."""
+
+    def __init__(self, db_name=SESSION_DB):
+        self.db_name = db_name
+        init_session_db(db_name)  # Only the session tables: the file holds nothing else
+
+    def load(self, key):
+        row = get_connection(self.db_name).execute(SELECT_SESSION_SQL, (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def session_id(self, key):
+        row = get_connection(self.db_name).execute(SELECT_SESSION_ID_SQL, (key,)).fetchone()
+        return row[0] if row else None
+
+    def apply(self, ops):
+        return run_write(lambda conn: [self._apply(conn, op, *args) for op, *args in ops], self.db_name)
+
+    def _apply(self, conn, op, *args):
+        now = time.time()
+        if op == "start":
+            key, state = args
+            conn.execute(UPSERT_SESSION_SQL, (key, state["session_id"], json.dumps(state), now))
+            return dict(state)
+        claimed = conn.execute(CLAIM_UPDATE_SQL, (args[0], now)).rowcount == 1
+        conn.execute(PRUNE_UPDATES_SQL, (now - UPDATE_CLAIM_TTL,))
+        return claimed
+
+
+class WriteBatcher:
+    """Applies writes on one thread, everything queued at the time in one backend call.
+
+    submit() returns a Future that resolves once the write has committed.
+    """
+
+    def __init__(self, backend, max_batch=WRITE_BATCH_SIZE):
+        self.backend = backend
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.writes = 0
+        self.batches = 0
+        threading.Thread(target=self._run, name="session-writer", daemon=True).start()
+
+    def submit(self, op):
+        future = Future()
+        self._queue.put((op, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                results = self.backend.apply([op for op, _ in batch])
+            except Exception as e:  # Failed transaction: every write in it failed
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            with self._lock:
+                self.writes += len(batch)
+                self.batches += 1
+
+    def stats(self):
+        with self._lock:
+            return {"writes": self.writes, "batches": self.batches,
+                    "writes_per_batch": self.writes / self.batches if self.batches else 0.0}
+
+
+class SessionStore:
+    def __init__(self, backend, namespace="telegram", cache_size=SESSION_CACHE_SIZE, cache_ttl=SESSION_CACHE_TTL,
+                 max_batch=WRITE_BATCH_SIZE):
+        self.backend = backend
+        self.namespace = namespace
+        self.cache = LRUTTLCache(max_entries=cache_size, ttl=cache_ttl) if cache_ttl > 0 else None
+        self.writer = WriteBatcher(backend, max_batch)
+
+    def key(self, chat_id):
+        return f"{self.namespace}:{chat_id}"
+
+    def _cached(self, key):
+        return self.cache.get(key) if self.cache is not None else None
+
+    def _remember(self, key, state):
+        if self.cache is not None:
+            self.cache.set(key, state)
+
+    def get(self, chat_id):
+        """The chat's state, or None if it has not sent /start."""
+        key = self.key(chat_id)
+        state = self._cached(key)
+        if state is not None and state["session_id"] != self.backend.session_id(key):
+            self.cache.pop(key)  # /start in another process replaced the session
+            state = None
+        if state is None:
+            state = self.backend.load(key)
+            if state is not None:
+                self._remember(key, state)
+        return dict(state) if state else None
+
+    def start(self, chat_id, state):
+        key = self.key(chat_id)
+        state = self.writer.submit(("start", key, state)).result()
+        self._remember(key, state)
+        return dict(state)
+
+    def claim(self, update_id):
+        """True for the first process to claim this update id, False for everyone after."""
+        return self.writer.submit(("claim", f"{self.namespace}:update:{update_id}")).result()
+
+    # asyncio variants: reads run in a thread (a cache hit still checks the session id), writes wait on the batcher
+    async def aget(self, chat_id):
+        return await asyncio.to_thread(self.get, chat_id)
+
+    async def astart(self, chat_id, state):
+        key = self.key(chat_id)
+        state = await asyncio.wrap_future(self.writer.submit(("start", key, state)))
+        self._remember(key, state)
+        return dict(state)
+
+    async def aclaim(self, update_id):
+        return await asyncio.wrap_future(self.writer.submit(("claim", f"{self.namespace}:update:{update_id}")))
+
+    def stats(self):
+        return {"backend": type(self.backend).__name__, "cache": self.cache.stats() if self.cache else None,
+                "writer": self.writer.stats()}
+
+
+SESSION_BACKENDS = {
+    "memory": MemorySessionBackend,
+    "sqlite": SQLiteSessionBackend,
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """The process-wide store for TRIAGE_SESSION_STORE, created on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if SESSION_STORE not in SESSION_BACKENDS:
+                    raise ValueError(f"Unknown session store '{SESSION_STORE}'. Choose one of: {', '.join(SESSION_BACKENDS)}")
+                _store = SessionStore(SESSION_BACKENDS[SESSION_STORE]())
+    return _store
@@ -0,0 +1,108 @@
+import json
+import threading
+
+# Helpers for streaming model output to the patient as Server-Sent Events.
+# Time to first token and total time of every stream are counted for /metrics.
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+_lock = threading.Lock()
+_stats = {"streams": 0, "answered_without_model": 0, "failed": 0, "ttft_ms": 0.0, "total_ms": 0.0,
+          "last_ttft_ms": 0.0, "last_total_ms": 0.0}
+
+
+def _partial_tag_length(text, tag):
+    """Length of the longest suffix of text that could be the start of tag."""
+    for size in range(min(len(text), len(tag) - 1), 0, -1):
+        if tag.startswith(text[-size:]):
+            return size
+    return 0
+
+
+class ThinkStripper:
+    """Incremental version of clean_ai_response: drops <think>...</think> blocks as tokens arrive.
+
+    Text that might be the beginning of a tag split across chunks is held back
+    until the next chunk shows whether it is one.
+    """
+
+    def __init__(self):
+        self.inside = False
+        self.pending = ""
+        self.started = False  # Leading whitespace is trimmed, like .strip() in clean_ai_response
+        self.text = ""  # Everything emitted so far
+
+    def _emit(self, text):
+        if not self.started:
+            text = text.lstrip()
+            self.started = bool(text)
+        self.text += text
+        return text
+
+    def feed(self, chunk):
+        """Add a chunk of raw model output and return the part that is safe to show."""
+        buffer = self.pending + chunk
+        visible = ""
+        while buffer:
+            if not self.inside:
+                index = buffer.find(THINK_OPEN)
+                if index >= 0:
+                    visible += buffer[:index]
+                    buffer = buffer[index + len(THINK_OPEN):]
+                    self.inside = True
+                    continue
+                keep = _partial_tag_length(buffer, THINK_OPEN)
+                visible += buffer[:len(buffer) - keep]
+                buffer = buffer[len(buffer) - keep:]
+                break
+            else:
+                index = buffer.find(THINK_CLOSE)
+                if index >= 0:
+                    buffer = buffer[index + len(THINK_CLOSE):]
+                    self.inside = False
+                    continue
+                keep = _partial_tag_length(buffer, THINK_CLOSE)
+                buffer = buffer[len(buffer) - keep:]
+                break
+        self.pending = buffer
+        return self._emit(visible)
+
+    def finish(self):
+        """Flush held-back text at the end of the stream. An unterminated <think> block is dropped."""
+        rest = "" if self.inside else self.pending
+        self.pending = ""
+        emitted = self._emit(rest)
+        self.text = self.text.rstrip()
+        return emitted
+
+
+def sse_event(data, event=None):
+    """Format one Server-Sent Event with a JSON payload."""
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+
+def record_stream(ttft_ms, total_ms, answered_without_model=False):
+    """Count one finished stream. answered_without_model: a cached answer or a red flag."""
+    with _lock:
+        _stats["streams"] += 1
+        _stats["answered_without_model"] += 1 if answered_without_model else 0
+        _stats["ttft_ms"] += ttft_ms
+        _stats["total_ms"] += total_ms
+        _stats["last_ttft_ms"] = ttft_ms
+        _stats["last_total_ms"] = total_ms
+
+
+def record_failed_stream():
+    with _lock:
+        _stats["failed"] += 1
+
+
+def stream_stats():
+    with _lock:
+        stats = dict(_stats)
+    streams = stats["streams"]
+    stats["avg_ttft_ms"] = stats.pop("ttft_ms") / streams if streams else 0.0
+    stats["avg_total_ms"] = stats.pop("total_ms") / streams if streams else 0.0
+    return stats
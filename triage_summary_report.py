@@ -0,0 +1,256 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from triage_backends import clean_ai_response, get_backend
+from triage_db import get_connection, run_write
+from triage_red_flags import is_red_flag
+
+# Clinician summary reports, written in the background once a triage ends: on a
+# final-phase turn (queued as soon as its prompt is ready, so the report is
+# written while the advice is) or on a red flag. Jobs go into the summary_jobs
+# table and a pool of worker threads turns them into rows of summary_reports,
+# which GET /sessions/{session_id}/summary serves with a single SQLite read.
+#
+#   - Priority: sessions that hit a red flag are summarized first.
+#   - Retry: a failed generation is retried after RETRY_BACKOFF seconds, doubled
+#     every time, and marked failed after TRIAGE_REPORT_ATTEMPTS tries.
+#   - Recovery: a running job holds a lease; jobs left running by a crashed
+#     process are picked up again once their lease runs out (a lease that runs
+#     out on the last attempt fails the job), and jobs still queued are picked
+#     up by the next process that starts the workers.
+#   - A final turn for a session whose report is still queued updates that job
+#     instead of adding another one, and one whose report is being written or
+#     done for the same conversation adds nothing.
+#   - When the latest job failed, the last report written for the session is
+#     still served.
+#
+# Several server processes can share the queue; claiming a job is one UPDATE.
+
+REPORT_WORKERS = int(os.getenv("TRIAGE_REPORT_WORKERS", "4"))
+REPORT_MAX_TOKENS = int(os.getenv("TRIAGE_REPORT_MAX_TOKENS", "300"))
+REPORT_ATTEMPTS = int(os.getenv("TRIAGE_REPORT_ATTEMPTS", "3"))  # Tries per job before it is marked failed
+RETRY_BACKOFF = float(os.getenv("TRIAGE_REPORT_RETRY_BACKOFF", "5"))  # Seconds before the first retry, doubled on every retry
+JOB_LEASE = 600.0  # Seconds a running job may take before another worker picks it up again
+POLL_INTERVAL = 1.0  # Seconds idle workers wait before looking for due retries and other processes' jobs
+EMERGENCY_PRIORITY = 10
+ROUTINE_PRIORITY = 0
+
+REFRESH_JOB_SQL = """
+    UPDATE summary_jobs SET backend=?, conversation=?, conversation_digest=?, priority=MAX(priority, ?)
+    WHERE patient_id=? AND session_id=? AND status='queued'
+"""
+SAME_JOB_SQL = """
+    SELECT 1 FROM summary_jobs
+    WHERE patient_id=? AND session_id=? AND status IN ('running', 'done') AND conversation_digest=?
+    AND id=(SELECT MAX(id) FROM summary_jobs WHERE patient_id=? AND session_id=?)
+"""
+INSERT_JOB_SQL = """
+    INSERT INTO summary_jobs (patient_id, session_id, backend, conversation, conversation_digest, priority, status, attempts,
+                              not_before, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, 'queued', 0, ?, ?)
+"""
+DUE_JOB_SQL = """
+    SELECT 1 FROM summary_jobs
+    WHERE (status='queued' AND not_before <= ?) OR (status='running' AND lease_until < ?) LIMIT 1
+"""
+EXPIRE_LEASES_SQL = "UPDATE summary_jobs SET status='queued' WHERE status='running' AND lease_until < ? AND attempts < ?"
+FAIL_EXPIRED_SQL = """
+    UPDATE summary_jobs SET status='failed', error='lease expired on the last attempt', finished_at=?
+    WHERE status='running' AND lease_until < ?
+"""
+CLAIM_JOB_SQL = """
+    UPDATE summary_jobs SET status='running', attempts=attempts + 1, lease_until=?
+    WHERE id=(SELECT id FROM summary_jobs WHERE status='queued' AND not_before <= ? ORDER BY priority DESC, id LIMIT 1)
+    RETURNING id, patient_id, session_id, backend, conversation, attempts
+"""
+UPSERT_REPORT_SQL = """
+    INSERT INTO summary_reports (patient_id, session_id, job_id, report, created_at) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (patient_id, session_id) DO UPDATE SET
+        job_id=excluded.job_id, report=excluded.report, created_at=excluded.created_at
+    WHERE excluded.job_id >= summary_reports.job_id
+"""
+COMPLETE_JOB_SQL = "UPDATE summary_jobs SET status='done', conversation=NULL, error=NULL, finished_at=? WHERE id=?"
+RETRY_JOB_SQL = "UPDATE summary_jobs SET status='queued', not_before=?, error=? WHERE id=?"
+FAIL_JOB_SQL = "UPDATE summary_jobs SET status='failed', error=?, finished_at=? WHERE id=?"
+SELECT_LATEST_JOB_SQL = "SELECT status FROM summary_jobs WHERE patient_id=? AND session_id=? ORDER BY id DESC LIMIT 1"
+SELECT_REPORT_SQL = "SELECT report FROM summary_reports WHERE patient_id=? AND session_id=?"
+QUEUE_DEPTH_SQL = """
+    SELECT status, priority, COUNT(*), MIN(created_at) FROM summary_jobs
+    WHERE status IN ('queued', 'running') GROUP BY status, priority
+"""
+COUNT_FAILED_SQL = "SELECT COUNT(*) FROM summary_jobs WHERE status='failed'"
+
+_backends = {}  # Backend name -> the instance that queued jobs in this process
+_signal = threading.Semaphore(0)  # Released once per queued job to wake an idle worker
+_workers = []
+_workers_lock = threading.Lock()
+_lock = threading.Lock()
+_stats = {"enqueued": 0, "unchanged": 0, "completed": 0, "retried": 0, "failed": 0, "report_ms": 0.0}
+
+
+def build_report_prompt(conversation):
+    return f"Create a detailed summary of the patient's responses and symptoms from the following conversation:\n{conversation}"
+
+
+def generate_report(backend, conversation):
+    return clean_ai_response(backend.generate(build_report_prompt(conversation), max_tokens=REPORT_MAX_TOKENS).text)
+
+
+def enqueue_report(backend, patient_id, session_id, conversation, priority=None):
+    """Queue the session's summary report. Without a priority, conversations with a red flag go first.
+    Nothing is queued if the session's latest report is being written or done for this same conversation."""
+    if priority is None:
+        priority = EMERGENCY_PRIORITY if is_red_flag(conversation) else ROUTINE_PRIORITY
+    _backends[backend.name] = backend
+    digest = hashlib.sha256(conversation.encode("utf-8")).hexdigest()
+    now = time.time()
+
+    def enqueue(conn):
+        if conn.execute(REFRESH_JOB_SQL, (backend.name, conversation, digest, priority, patient_id, session_id)).rowcount:
+            return True
+        if conn.execute(SAME_JOB_SQL, (patient_id, session_id, digest, patient_id, session_id)).fetchone():
+            return False
+        conn.execute(INSERT_JOB_SQL, (patient_id, session_id, backend.name, conversation, digest, priority, now, now))
+        return True
+
+    try:
+        queued = run_write(enqueue)
+    except sqlite3.Error as e:
+        print(f"Database Error (enqueue_report): {e}")
+        return False
+    with _lock:
+        _stats["enqueued" if queued else "unchanged"] += 1
+    if queued:
+        start_report_workers()
+        _signal.release()
+    return True
+
+
+def start_report_workers(workers=REPORT_WORKERS):
+    """Start this process's worker threads, once. They also pick up jobs queued by earlier runs."""
+    with _workers_lock:
+        if _workers:
+            return
+        for n in range(workers):
+            worker = threading.Thread(target=_work, name=f"report-{n}", daemon=True)
+            worker.start()
+            _workers.append(worker)
+
+
+def _claim_job():
+    now = time.time()
+    if get_connection().execute(DUE_JOB_SQL, (now, now)).fetchone() is None:
+        return None  # Nothing to do; checked with a read so idle workers do not take the write lock
+
+    def claim(conn):
+        conn.execute(EXPIRE_LEASES_SQL, (now, REPORT_ATTEMPTS))
+        expired = conn.execute(FAIL_EXPIRED_SQL, (now, now)).rowcount  # Jobs whose last attempt never finished
+        return expired, conn.execute(CLAIM_JOB_SQL, (now + JOB_LEASE, now)).fetchone()
+
+    expired, job = run_write(claim)
+    if expired:
+        print(f"{expired} summary report job(s) failed: the lease ran out on the last attempt")
+        with _lock:
+            _stats["failed"] += expired
+    return job
+
+
+def _work():
+    while True:
+        try:
+            job = _claim_job()
+        except sqlite3.Error as e:
+            print(f"Database Error (claim summary job): {e}")
+            job = None
+        if job is None:
+            _signal.acquire(timeout=POLL_INTERVAL)
+            continue
+        _run_job(*job)
+
+
+def _run_job(job_id, patient_id, session_id, backend_name, conversation, attempts):
+    started = time.perf_counter()
+    try:
+        backend = _backends.get(backend_name) or get_backend(backend_name)
+        report = generate_report(backend, conversation)
+    except Exception as e:
+        _job_failed(job_id, session_id, attempts, e)
+        return
+
+    now = time.time()
+
+    def finish(conn):
+        conn.execute(UPSERT_REPORT_SQL, (patient_id, session_id, job_id, report, now))
+        conn.execute(COMPLETE_JOB_SQL, (now, job_id))
+
+    try:
+        run_write(finish)
+    except sqlite3.Error as e:  # The lease runs out and another worker writes it again
+        print(f"Database Error (save summary report): {e}")
+        return
+    with _lock:
+        _stats["completed"] += 1
+        _stats["report_ms"] += (time.perf_counter() - started) * 1000
+
+
+def _job_failed(job_id, session_id, attempts, error):
+    now = time.time()
+    if attempts < REPORT_ATTEMPTS:
+        retry_in = RETRY_BACKOFF * 2 ** (attempts - 1)
+        print(f"Summary report for session {session_id} failed (attempt {attempts}), retrying in {retry_in:.0f}s: {error}")
+        sql, params, counter = RETRY_JOB_SQL, (now + retry_in, str(error), job_id), "retried"
+    else:
+        print(f"Summary report for session {session_id} failed after {attempts} attempts: {error}")
+        sql, params, counter = FAIL_JOB_SQL, (str(error), now, job_id), "failed"
+    try:
+        run_write(lambda conn: conn.execute(sql, params))
+    except sqlite3.Error as e:
+        print(f"Database Error (summary job {job_id}): {e}")
+    with _lock:
+        _stats[counter] += 1
+
+
+def get_report(patient_id, session_id):
+    """("ready", report), ("pending", None), ("failed", None), or (None, None) if the session has no report.
+
+    Reads SQLite only; the report was written by a worker. If the latest job failed, the report an
+    earlier job wrote is returned as ready.
+    """
+    conn = get_connection()
+    latest = conn.execute(SELECT_LATEST_JOB_SQL, (patient_id, session_id)).fetchone()
+    if latest is None:
+        return None, None
+    if latest[0] in ("queued", "running"):
+        return "pending", None
+    row = conn.execute(SELECT_REPORT_SQL, (patient_id, session_id)).fetchone()
+    if row:
+        return "ready", row[0]
+    return ("failed", None) if latest[0] == "failed" else (None, None)
+
+
+def report_stats():
+    """Worker counters for this process plus the queue depth across all processes."""
+    with _lock:
+        stats = dict(_stats)
+    completed = stats["completed"]
+    stats["avg_report_ms"] = stats.pop("report_ms") / completed if completed else 0.0
+    stats["workers"] = len(_workers)
+    queued, running, by_priority, oldest = 0, 0, {}, None
+    try:
+        conn = get_connection()
+        for status, priority, count, created_at in conn.execute(QUEUE_DEPTH_SQL):
+            if status == "running":
+                running += count
+                continue
+            queued += count
+            by_priority[priority] = count
+            oldest = created_at if oldest is None else min(oldest, created_at)
+        stats["failed_jobs"] = conn.execute(COUNT_FAILED_SQL).fetchone()[0]
+    except sqlite3.Error as e:
+        print(f"Database Error (report_stats): {e}")
+    stats.update(queued=queued, running=running, queued_by_priority=by_priority,
+                 oldest_queued_s=time.time() - oldest if oldest else 0.0)
+    return stats
@@ -1,5 +1,6 @@
 import os
 import requests
+import uuid
 from telegram import Update
 from telegram.ext import Updater, CommandHandler, MessageHandler, Filters, CallbackContext
 from fastapi import HTTPException
@@ -23,6 +24,7 @@ def start(update: Update, context: CallbackContext):
         "username": user.username,
         "first_name": user.first_name,
         "last_name": user.last_name,
+        "session_id": str(uuid.uuid4()),  # New session per /start; the server counts its turns
     }
 
     # Save user info (in memory, or could be stored in a database for persistence)
@@ -43,9 +45,8 @@ def handle_message(update: Update, context: CallbackContext):
     # Prepare the data to send to the /chat API
     request_data = {
         "patient_id": user_info["chat_id"],  # Use chat_id as patient_id
-        "session_id": f"{user_info['chat_id']}_session",  # Simple session id
+        "session_id": user_info["session_id"],
         "user_input": user_input,
-        "question_count": 1,  # We can change this based on the number of questions
     }
 
     # Call the /chat API
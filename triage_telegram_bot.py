@@ -4,6 +4,15 @@ import uuid
 from telegram import Update
 from telegram.ext import Updater, CommandHandler, MessageHandler, Filters, CallbackContext
 
+from triage_session_store import get_session_store
+
+# Deprecated: use triage_telegram_webhook.py, which receives updates through a
+# webhook (python triage_telegram_webhook.py webhook --public-url https://...)
+# or long-polls (python triage_telegram_webhook.py polling), handles chats
+# concurrently and shares this bot's session store. This polling bot is kept for
+# existing deployments and gets no new features.
+DEPRECATION_NOTICE = "triage_telegram_bot.py is deprecated: run python triage_telegram_webhook.py webhook (or polling) instead."
+
 # Constants
 CHAT_API_URL = "https://chat.telepainsolutions.ca/chat"  # Your chat API URL
 API_AUTHORIZATION_TOKEN = os.getenv('CHAT_API_AUTHORIZATION_TOKEN') # Replace with actual API authorization token
@@ -13,6 +22,9 @@ TELEGRAM_TOKEN = os.getenv('TRIAGE_AI_CHATBOT_TOKEN') # @triage_ai_chatbot
 if not TELEGRAM_TOKEN:
     raise ValueError("Telegram Bot Token is required. Set TELEGRAM_TOKEN environment variable.")
 
+# Conversation state per chat, shared with other bot processes (TRIAGE_SESSION_STORE)
+sessions = get_session_store()
+
 # Function to handle the /start command
 def start(update: Update, context: CallbackContext):
     # Storing the user's information
@@ -22,25 +34,23 @@ def start(update: Update, context: CallbackContext):
         "username": user.username,
         "first_name": user.first_name,
         "last_name": user.last_name,
-        "question_count": 1,  # Initialize question count
         "session_id": str(uuid.uuid4())  # Generate unique session ID
     }
 
-    # Save user info (in memory, or could be stored in a database for persistence)
-    context.user_data["user_info"] = user_info
+    # Save user info in the session store, so it survives restarts
+    sessions.start(update.message.chat_id, user_info)
 
     # Send greeting message
     update.message.reply_text("Hello, I am your AI health assistant. What symptoms are you experiencing today?")
 
 # Function to handle user message
 def handle_message(update: Update, context: CallbackContext):
-    user_info = context.user_data.get("user_info")
+    user_info = sessions.get(update.message.chat_id)
     if not user_info:
         update.message.reply_text("Please start the conversation by sending /start.")
         return
 
     user_input = update.message.text.strip()
-    question_count = user_info.get("question_count", 1)
     session_id = user_info.get("session_id")  # Use the unique session_id
 
     # Prepare the data to send to the /chat API
@@ -48,7 +58,6 @@ def handle_message(update: Update, context: CallbackContext):
         "patient_id": str(user_info["chat_id"]),  # Use chat_id as patient_id
         "session_id": session_id,  # Use unique session_id for the user session
         "user_input": user_input,
-        "question_count": question_count,
     }
 
     headers = {
@@ -68,9 +77,6 @@ def handle_message(update: Update, context: CallbackContext):
         if response.status_code == 200:
             api_response = response.json().get("response", "Sorry, I couldn't get a response.")
             update.message.reply_text(api_response)  # Send the response to the user
-
-            # Increase the question count for the next round
-            user_info["question_count"] += 1
         else:
             update.message.reply_text("Sorry, I couldn't process your request at the moment.")
     except requests.exceptions.RequestException as e:
@@ -78,6 +84,8 @@ def handle_message(update: Update, context: CallbackContext):
 
 # Main function to set up the Telegram Bot
 def main():
+    print(DEPRECATION_NOTICE)
+
     # Create Updater and pass it your bot's token
     updater = Updater(TELEGRAM_TOKEN, use_context=True)
 
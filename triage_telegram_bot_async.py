@@ -0,0 +1,219 @@
+import asyncio
+import os
+import uuid
+from collections import deque
+
+import httpx
+
+from triage_session_store import get_session_store
+
+# asyncio variant of triage_telegram_bot.py. The synchronous Updater handles one
+# update at a time and opens a new connection for every /chat call, so one slow
+# LLM turn holds up every other patient. Here updates from different chats are
+# handled concurrently, updates from the same chat strictly in the order they
+# arrived (ChatDispatcher), all /chat calls share one keep-alive connection pool,
+# and a semaphore caps how many are in flight so a burst of patients cannot
+# overload the API.
+#
+# Talks to the Telegram Bot API directly (long-polling getUpdates, sendMessage)
+# with httpx, so it does not depend on a particular python-telegram-bot version.
+# Long polling is the default here; triage_telegram_webhook.py receives the same
+# updates through a webhook instead. Conversation state lives in the shared
+# session store (triage_session_store.py), so restarts and the other bot
+# processes on the host keep it.
+# bench_telegram_bot.py load-tests the bot against the stub /chat server.
+
+# Constants
+CHAT_API_URL = os.getenv("CHAT_API_URL", "https://chat.telepainsolutions.ca/chat")  # Your chat API URL
+API_AUTHORIZATION_TOKEN = os.getenv('CHAT_API_AUTHORIZATION_TOKEN')  # Sent as the Authorization header
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+MAX_INFLIGHT = int(os.getenv("TRIAGE_BOT_MAX_INFLIGHT", "32"))  # /chat requests in flight across all chats
+CHAT_TIMEOUT = float(os.getenv("TRIAGE_BOT_CHAT_TIMEOUT", "120"))  # Seconds; an LLM turn can be slow
+CONNECT_TIMEOUT = 5.0
+POLL_TIMEOUT = 30  # Seconds getUpdates waits for new messages
+POLL_RETRY_DELAY = 3.0
+
+GREETING = "Hello, I am your AI health assistant. What symptoms are you experiencing today?"
+START_FIRST = "Please start the conversation by sending /start."
+NO_RESPONSE = "Sorry, I couldn't get a response."
+API_FAILED = "Sorry, I couldn't process your request at the moment."
+API_UNREACHABLE = "There was an error connecting to the AI service."
+
+
+class ChatDispatcher:
+    """Runs handler(update) concurrently across chats and in arrival order within each chat.
+
+    Each chat with pending updates has one worker task draining its queue; the
+    worker exits when the queue is empty, so idle chats cost nothing.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self._queues = {}  # chat_id -> deque of pending updates
+        self._workers = set()
+        self.pending = 0  # Dispatched and not yet handled
+        self.handled = 0
+        self.failed = 0
+
+    def dispatch(self, chat_id, update):
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = deque()
+            worker = asyncio.create_task(self._drain(chat_id, queue))
+            self._workers.add(worker)
+            worker.add_done_callback(self._workers.discard)
+        queue.append(update)
+        self.pending += 1
+
+    async def _drain(self, chat_id, queue):
+        while queue:
+            update = queue.popleft()
+            try:
+                await self.handler(update)
+                self.handled += 1
+            except Exception as e:  # One bad update must not stop the chat's queue
+                self.failed += 1
+                print(f"Handling an update for chat {chat_id} failed: {e!r}")
+            finally:
+                self.pending -= 1
+        del self._queues[chat_id]
+
+    async def join(self):
+        """Wait until every dispatched update has been handled."""
+        while self._workers:
+            await asyncio.gather(*list(self._workers))
+
+    def stats(self):
+        return {"active_chats": len(self._queues), "pending": self.pending, "handled": self.handled, "failed": self.failed}
+
+
+class TriageBot:
+    def __init__(self, telegram_token, chat_api_url=CHAT_API_URL, authorization=API_AUTHORIZATION_TOKEN,
+                 telegram_api_url=TELEGRAM_API_URL, max_inflight=MAX_INFLIGHT, chat_transport=None, session_store=None):
+        self.chat_api_url = chat_api_url
+        headers = {"Authorization": authorization} if authorization else {}
+        self.chat_client = httpx.AsyncClient(
+            transport=chat_transport,  # e.g. httpx.ASGITransport to call an in-process app
+            headers=headers,
+            timeout=httpx.Timeout(CHAT_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=max_inflight, max_keepalive_connections=max_inflight),
+        )
+        self.telegram = httpx.AsyncClient(base_url=f"{telegram_api_url}/bot{telegram_token}",
+                                          timeout=httpx.Timeout(POLL_TIMEOUT + 10, connect=CONNECT_TIMEOUT))
+        self.inflight = asyncio.Semaphore(max_inflight)
+        self.sessions = session_store or get_session_store()  # chat_id -> user info
+        self.dispatcher = ChatDispatcher(self.handle_update)
+
+    async def reply(self, chat_id, text):
+        await self.call("sendMessage", chat_id=chat_id, text=text)
+
+    def dispatch_update(self, update):
+        """Queue a Telegram update (from getUpdates or a webhook) if it carries a text message."""
+        message = update.get("message")
+        if message and "text" in message:
+            self.dispatcher.dispatch(message["chat"]["id"], message)
+
+    async def handle_update(self, message):
+        chat_id = message["chat"]["id"]
+        text = message["text"].strip()
+        command = text.split(maxsplit=1)[0].split("@")[0] if text else ""  # "/start@bot <payload>" from a deep link
+        if command == "/start":
+            await self.start(chat_id, message.get("from", {}))
+        elif not text.startswith("/"):
+            await self.handle_message(chat_id, text)
+
+    async def start(self, chat_id, user):
+        await self.sessions.astart(chat_id, {
+            "chat_id": chat_id,
+            "username": user.get("username"),
+            "first_name": user.get("first_name"),
+            "last_name": user.get("last_name"),
+            "session_id": str(uuid.uuid4()),  # Generate unique session ID
+        })
+        await self.reply(chat_id, GREETING)
+
+    async def handle_message(self, chat_id, user_input):
+        user_info = await self.sessions.aget(chat_id)
+        if not user_info:
+            await self.reply(chat_id, START_FIRST)
+            return
+
+        payload = {
+            "patient_id": str(chat_id),  # Use chat_id as patient_id
+            "session_id": user_info["session_id"],
+            "user_input": user_input,
+        }
+        try:
+            async with self.inflight:
+                response = await self.chat_client.post(self.chat_api_url, json=payload)
+        except httpx.HTTPError as e:
+            print(f"Chat API request for chat {chat_id} failed: {e!r}")
+            await self.reply(chat_id, API_UNREACHABLE)
+            return
+
+        if response.status_code == 200:
+            await self.reply(chat_id, response.json().get("response", NO_RESPONSE))
+        else:
+            await self.reply(chat_id, API_FAILED)
+
+    async def poll(self):
+        """Long-poll Telegram for updates and hand each text message to the dispatcher."""
+        offset = None
+        while True:
+            params = {"timeout": POLL_TIMEOUT, "allowed_updates": '["message"]'}
+            if offset is not None:
+                params["offset"] = offset
+            try:
+                response = await self.telegram.get("/getUpdates", params=params)
+                response.raise_for_status()
+                updates = response.json()["result"]
+            except (httpx.HTTPError, ValueError, KeyError) as e:
+                print(f"getUpdates failed: {e!r}")
+                await asyncio.sleep(POLL_RETRY_DELAY)
+                continue
+            for update in updates:
+                offset = update["update_id"] + 1
+                self.dispatch_update(update)
+
+    async def call(self, method, **params):
+        response = await self.telegram.post(f"/{method}", json=params)
+        response.raise_for_status()
+        return response.json()["result"]
+
+    async def set_webhook(self, url, secret_token=None, max_connections=40):
+        """Have Telegram push updates to url; getUpdates stops working until delete_webhook()."""
+        params = {"url": url, "max_connections": max_connections, "allowed_updates": ["message"]}
+        if secret_token:
+            params["secret_token"] = secret_token
+        return await self.call("setWebhook", **params)
+
+    async def delete_webhook(self):
+        return await self.call("deleteWebhook")
+
+    async def aclose(self):
+        await self.chat_client.aclose()
+        await self.telegram.aclose()
+
+
+async def run_bot(telegram_token):
+    bot = TriageBot(telegram_token)
+    try:
+        await bot.delete_webhook()  # getUpdates is refused while a webhook is set
+        await bot.poll()
+    finally:
+        await bot.dispatcher.join()
+        await bot.aclose()
+
+
+def main():
+    telegram_token = os.getenv('TRIAGE_AI_CHATBOT_TOKEN')  # @triage_ai_chatbot
+    if not telegram_token:
+        raise ValueError("Telegram Bot Token is required. Set TRIAGE_AI_CHATBOT_TOKEN environment variable.")
+    try:
+        asyncio.run(run_bot(telegram_token))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,15 @@ import requests
 import uuid
 import telebot
 from telebot import types
-from telebot.storage import StateMemoryStorage
+
+from triage_session_store import get_session_store
+
+# Deprecated: use triage_telegram_webhook.py, which receives updates through a
+# webhook (python triage_telegram_webhook.py webhook --public-url https://...)
+# or long-polls (python triage_telegram_webhook.py polling), handles chats
+# concurrently and shares this bot's session store. This polling bot is kept for
+# existing deployments and gets no new features.
+DEPRECATION_NOTICE = "triage_telegram_pybot.py is deprecated: run python triage_telegram_webhook.py webhook (or polling) instead."
 
 # Constants
 CHAT_API_URL = "https://chat.telepainsolutions.ca/chat"  # Your chat API URL
@@ -14,9 +22,9 @@ TELEGRAM_TOKEN = os.getenv('TRIAGE_AI_CHATBOT_TOKEN') # @triage_ai_chatbot
 if not TELEGRAM_TOKEN:
     raise ValueError("Telegram Bot Token is required. Set TELEGRAM_TOKEN environment variable.")
 
-# Initialize the storage and bot
-storage = StateMemoryStorage()
-bot = telebot.TeleBot(TELEGRAM_TOKEN, state_storage=storage)
+# Initialize the bot and the conversation state per chat, shared with other bot processes (TRIAGE_SESSION_STORE)
+bot = telebot.TeleBot(TELEGRAM_TOKEN)
+sessions = get_session_store()
 
 # Function to handle the /start command
 @bot.message_handler(commands=['start'])
@@ -27,12 +35,11 @@ def start(message):
         "username": message.from_user.username,
         "first_name": message.from_user.first_name,
         "last_name": message.from_user.last_name,
-        "question_count": 1,  # Initialize question count
         "session_id": str(uuid.uuid4())  # Generate unique session ID
     }
 
-    # Save user info in storage
-    bot.set_state(message.chat.id, user_info)
+    # Save user info in the session store, so it survives restarts
+    sessions.start(message.chat.id, user_info)
 
     # Send greeting message
     bot.reply_to(message, "Hello, I am your AI health assistant. What symptoms are you experiencing today?")
@@ -41,13 +48,12 @@ def start(message):
 # Function to handle user message
 @bot.message_handler(func=lambda message: True)
 def handle_message(message):
-    user_info = bot.get_state(message.chat.id)
+    user_info = sessions.get(message.chat.id)
     if not user_info:
         bot.reply_to(message, "Please start the conversation by sending /start.")
         return
 
     user_input = message.text.strip()
-    question_count = user_info.get("question_count", 1)
     session_id = user_info.get("session_id")  # Use the unique session_id
 
     # Prepare the data to send to the /chat API
@@ -55,7 +61,6 @@ def handle_message(message):
         "patient_id": str(user_info["chat_id"]),  # Use chat_id as patient_id
         "session_id": session_id,  # Use unique session_id for the user session
         "user_input": user_input,
-        "question_count": question_count,
     }
 
     headers = {
@@ -75,10 +80,6 @@ def handle_message(message):
         if response.status_code == 200:
             api_response = response.json().get("response", "Sorry, I couldn't get a response.")
             bot.reply_to(message, api_response)  # Send the response to the user
-
-            # Increase the question count for the next round
-            user_info["question_count"] += 1
-            bot.set_state(message.chat.id, user_info)
         else:
             bot.reply_to(message, "Sorry, I couldn't process your request at the moment.")
     except requests.exceptions.RequestException as e:
@@ -87,5 +88,6 @@ def handle_message(message):
 
 # Start the bot
 if __name__ == "__main__":
+    print(DEPRECATION_NOTICE)
     bot.polling(none_stop=True)
 
@@ -0,0 +1,146 @@
+import argparse
+import asyncio
+import hmac
+import os
+from functools import partial
+
+import httpx
+from fastapi import APIRouter, FastAPI, HTTPException, Request
+
+from triage_telegram_bot_async import TriageBot, run_bot
+
+# Webhook mode for the Telegram bot. Instead of one process long-polling
+# getUpdates, Telegram POSTs each update to WEBHOOK_PATH. The receiver answers as
+# soon as the update is queued on the bot's ChatDispatcher, which runs updates
+# concurrently across chats and in order within a chat, with /chat calls capped
+# by the bot's semaphore.
+#
+# Deployment: one host. Conversation state and update claims are in the session
+# store (triage_session_store.py), whose SQLite file (bot_sessions.db) is local
+# to the host, so every receiver process must run there. Order within a chat is
+# only kept inside one process's dispatcher: with --workers N, or several
+# receivers behind a proxy, updates must be routed to a process by chat id
+# (sticky routing), or two messages from one chat can be handled at the same
+# time and out of order. The default, one receiver process, needs neither.
+#
+#   - Mounted in the triage API (TRIAGE_TELEGRAM_WEBHOOK=1 in triageAI.py): /chat
+#     is called in-process through an ASGI transport, with no network hop. The
+#     bot still authenticates, with CHAT_API_AUTHORIZATION_TOKEN (a bearer token
+#     or a "Basic ..." header value).
+#   - Standalone: python triage_telegram_webhook.py webhook --public-url https://...
+#     [--workers N], calling CHAT_API_URL like the polling bot.
+#   - Fallback: python triage_telegram_webhook.py polling removes the webhook and
+#     long-polls as before.
+#
+# Telegram redelivers an update it did not get a 2xx for, possibly to another
+# receiver process, so each update id is claimed in the session store and a
+# redelivery is acknowledged without being handled twice. When too many updates are pending,
+# the receiver answers 503 so Telegram backs off and retries.
+#
+# Delivery is at most once. An update is acknowledged once it is queued, before
+# it is handled, so Telegram never resends it: if the /chat call fails the
+# patient gets an error reply, and if the process dies with updates still queued
+# those messages are lost and the patient has to send them again. Acknowledging
+# after handling would hold every delivery open for a model call, which
+# Telegram's WEBHOOK_MAX_CONNECTIONS concurrent deliveries cannot absorb.
+# bench_telegram_webhook.py replays recorded updates through both modes.
+
+TELEGRAM_TOKEN = os.getenv('TRIAGE_AI_CHATBOT_TOKEN')  # @triage_ai_chatbot
+WEBHOOK_PATH = os.getenv("TRIAGE_TELEGRAM_WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_URL = os.getenv("TRIAGE_TELEGRAM_WEBHOOK_URL")  # Public URL to register with setWebhook on startup
+WEBHOOK_SECRET = os.getenv("TRIAGE_TELEGRAM_WEBHOOK_SECRET")  # Echoed by Telegram in X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("TRIAGE_TELEGRAM_WEBHOOK_CONNECTIONS", "40"))  # Concurrent deliveries Telegram may make
+MAX_PENDING = int(os.getenv("TRIAGE_TELEGRAM_MAX_PENDING", "1000"))  # Updates queued per process before answering 503
+
+
+def create_webhook_router(bot, path=WEBHOOK_PATH, secret=WEBHOOK_SECRET, max_pending=MAX_PENDING):
+    router = APIRouter()
+    expected = secret.encode() if secret else None
+
+    @router.post(path, include_in_schema=False)
+    async def telegram_webhook(request: Request):
+        """Queue one Telegram update and acknowledge it straight away (at-most-once: it is not resent if handling fails)."""
+        if expected is not None:
+            presented = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "").encode()
+            if not hmac.compare_digest(presented, expected):
+                raise HTTPException(status_code=401, detail="Invalid secret token")
+        if bot.dispatcher.pending >= max_pending:
+            raise HTTPException(status_code=503, detail="Too many pending updates")
+        update = await request.json()
+        update_id = update.get("update_id")
+        if update_id is not None and not await bot.sessions.aclaim(update_id):
+            return {"ok": True}  # Already taken by this or another receiver process
+        bot.dispatch_update(update)
+        return {"ok": True}
+
+    return router
+
+
+async def register_webhook(bot, url=WEBHOOK_URL, path=WEBHOOK_PATH, secret=WEBHOOK_SECRET):
+    """setWebhook is idempotent, so every receiver process can call it on startup."""
+    await bot.set_webhook(url.rstrip("/") + path, secret, WEBHOOK_MAX_CONNECTIONS)
+    print(f"Telegram webhook set to {url.rstrip('/') + path}")
+
+
+async def shutdown_bot(bot):
+    await bot.dispatcher.join()
+    await bot.aclose()
+
+
+def add_webhook(app, bot, register=True):
+    """Serve bot's webhook from app, registering it with Telegram on startup if WEBHOOK_URL is set."""
+    app.include_router(create_webhook_router(bot))
+    if register and WEBHOOK_URL:
+        app.router.add_event_handler("startup", partial(register_webhook, bot))
+    app.router.add_event_handler("shutdown", partial(shutdown_bot, bot))
+    return bot
+
+
+def mount_webhook(app, telegram_token=None):
+    """Add the webhook to the triage API app; the bot calls that app's /chat in-process."""
+    token = telegram_token or TELEGRAM_TOKEN
+    if not token:
+        raise ValueError("Telegram Bot Token is required. Set TRIAGE_AI_CHATBOT_TOKEN environment variable.")
+    bot = TriageBot(token, chat_api_url="http://triage/chat", chat_transport=httpx.ASGITransport(app=app))
+    return add_webhook(app, bot)
+
+
+def standalone_app():
+    """App factory for the standalone receiver (uvicorn --factory, one bot per worker process)."""
+    if not TELEGRAM_TOKEN:
+        raise ValueError("Telegram Bot Token is required. Set TRIAGE_AI_CHATBOT_TOKEN environment variable.")
+    app = FastAPI()
+    add_webhook(app, TriageBot(TELEGRAM_TOKEN))
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Telegram bot with a webhook, or fall back to polling.")
+    commands = parser.add_subparsers(dest="mode", required=True)
+    webhook = commands.add_parser("webhook", help="receive updates over HTTPS")
+    webhook.add_argument("--public-url", default=WEBHOOK_URL, help="public base URL Telegram should call")
+    webhook.add_argument("--host", default="0.0.0.0")
+    webhook.add_argument("--port", type=int, default=8081)
+    webhook.add_argument("--workers", type=int, default=1,
+                         help="receiver processes on this host; more than one needs a proxy routing by chat id")
+    commands.add_parser("polling", help="remove the webhook and long-poll getUpdates")
+    args = parser.parse_args()
+
+    if not TELEGRAM_TOKEN:
+        raise ValueError("Telegram Bot Token is required. Set TRIAGE_AI_CHATBOT_TOKEN environment variable.")
+    if args.mode == "polling":
+        try:
+            asyncio.run(run_bot(TELEGRAM_TOKEN))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    import uvicorn
+
+    if args.public_url:
+        os.environ["TRIAGE_TELEGRAM_WEBHOOK_URL"] = args.public_url  # Read by each worker process
+    uvicorn.run("triage_telegram_webhook:standalone_app", factory=True, host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from triage_backends import LLMBackendError, clean_ai_response
+from triage_cache import LRUTTLCache
+from triage_context_cache import estimate_tokens, format_conversation, get_session_conversation
+from triage_db import get_connection, run_write
+
+# Token-budgeted conversation window. Prompts used to carry the whole session, so
+# prompt length and prefill time grew with every turn. Once a session passes
+# CONTEXT_TOKEN_BUDGET, the prompt carries a rolling summary of the older turns
+# plus the most recent turns verbatim. The summary is written by the model in a
+# background thread, stored in the conversation_summary table and only extended
+# (never recomputed) as the session grows, so no turn waits on it. Until a fresh
+# summary is ready, the oldest verbatim turns that no longer fit are left out,
+# except the first turn (the chief complaint), which stays until a summary
+# covers it.
+#
+# The window is cut from the session's cached turns (triage_context_cache),
+# which carry a running token estimate, so a long session costs no database
+# read per turn.
+#
+# TRIAGE_CONTEXT_TOKEN_BUDGET=0 turns windowing off.
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("TRIAGE_CONTEXT_TOKEN_BUDGET", "1500"))
+RECENT_TURNS = int(os.getenv("TRIAGE_RECENT_TURNS", "4"))  # Always kept verbatim
+SUMMARY_TRIGGER = 0.75  # Start summarizing once the window is this full, so the summary is ready before turns are dropped
+SUMMARY_MAX_TOKENS = int(os.getenv("TRIAGE_SUMMARY_MAX_TOKENS", "200"))
+SUMMARY_WORKERS = int(os.getenv("TRIAGE_SUMMARY_WORKERS", "2"))
+
+UPSERT_SUMMARY_SQL = """
+    INSERT INTO conversation_summary (patient_id, session_id, turns_covered, summary, updated_at) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (patient_id, session_id) DO UPDATE SET
+        turns_covered=excluded.turns_covered, summary=excluded.summary, updated_at=excluded.updated_at
+    WHERE excluded.turns_covered > conversation_summary.turns_covered
+"""
+SELECT_SUMMARY_SQL = "SELECT turns_covered, summary FROM conversation_summary WHERE patient_id=? AND session_id=?"
+
+_summaries = LRUTTLCache(max_entries=10000, ttl=1800, sizeof=lambda value: len(value[1].encode("utf-8")))
+_executor = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="summary")
+_pending = set()  # Sessions with a summary being written
+_lock = threading.Lock()
+_stats = {"windowed_turns": 0, "dropped_turns": 0, "summaries": 0, "summary_failures": 0, "summary_ms": 0.0, "last_prompt_tokens": 0}
+
+
+def get_summary(patient_id, session_id):
+    """(turns_covered, summary) for a session, or (0, "") if it has none yet."""
+    key = (patient_id, session_id)
+    value = _summaries.get(key)
+    if value is None:
+        try:
+            row = get_connection().execute(SELECT_SUMMARY_SQL, key).fetchone()
+        except sqlite3.Error as e:
+            print(f"Database Error (get_summary): {e}")
+            return 0, ""
+        value = tuple(row) if row else (0, "")
+        _summaries.set(key, value)
+    return value
+
+
+def save_summary(patient_id, session_id, turns_covered, summary):
+    try:
+        run_write(lambda conn: conn.execute(UPSERT_SUMMARY_SQL, (patient_id, session_id, turns_covered, summary, time.time())))
+    except sqlite3.Error as e:
+        print(f"Database Error (save_summary): {e}")
+    _summaries.update((patient_id, session_id), lambda value: (turns_covered, summary) if turns_covered > value[0] else value)
+
+
+def summarize(backend, previous_summary, turns):
+    """Extend previous_summary with the given (user_input, ai_response) turns."""
+    prompt = (
+        "Summarize this triage conversation for the clinician who continues it. "
+        "Keep every symptom with its location, onset, duration and severity, what makes it better or worse, "
+        "medications, relevant history and any answers the patient already gave. At most 120 words, no preamble.\n"
+        + (f"Summary so far: {previous_summary}\n" if previous_summary else "")
+        + format_conversation(turns)
+    )
+    return clean_ai_response(backend.generate(prompt, max_tokens=SUMMARY_MAX_TOKENS).text)
+
+
+def _write_summary(backend, patient_id, session_id, turns, covered, previous_summary, upto):
+    started = time.perf_counter()
+    try:
+        summary = summarize(backend, previous_summary, turns[covered:upto])
+        save_summary(patient_id, session_id, upto, summary)
+        with _lock:
+            _stats["summaries"] += 1
+            _stats["summary_ms"] += (time.perf_counter() - started) * 1000
+    except LLMBackendError as e:
+        print(f"Summarizing session {session_id} failed: {e}")
+        with _lock:
+            _stats["summary_failures"] += 1
+    finally:
+        with _lock:
+            _pending.discard((patient_id, session_id))
+
+
+def schedule_summary(backend, patient_id, session_id, turns, covered, previous_summary, upto):
+    """Summarize turns[covered:upto] in the background, unless this session already has a summary in progress."""
+    with _lock:
+        if (patient_id, session_id) in _pending:
+            return
+        _pending.add((patient_id, session_id))
+    _executor.submit(_write_summary, backend, patient_id, session_id, turns, covered, previous_summary, upto)
+
+
+def windowed_conversation(backend, patient_id, session_id):
+    """The session's conversation for the next prompt, kept within CONTEXT_TOKEN_BUDGET."""
+    session = get_session_conversation(patient_id, session_id)
+    if not CONTEXT_TOKEN_BUDGET or session.total_tokens <= CONTEXT_TOKEN_BUDGET * SUMMARY_TRIGGER:
+        return session.text
+
+    turns = session.turns
+    covered, summary = get_summary(patient_id, session_id)
+    covered = min(covered, len(turns))
+    header = f"Summary of the earlier conversation: {summary}" if summary else ""
+    budget = CONTEXT_TOKEN_BUDGET - estimate_tokens(header)
+
+    # Until a summary covers it, the first turn (the chief complaint) is always kept
+    tail = list(zip(turns[covered:], session.tokens[covered:]))
+    pinned = tail[:1] if not covered else []
+    rest = tail[len(pinned):]
+    used = sum(cost for _, cost in pinned)
+
+    # Newest turns first until the budget is used; the last RECENT_TURNS are kept regardless
+    kept = []
+    for n, (turn, cost) in enumerate(reversed(rest)):
+        if n >= RECENT_TURNS and used + cost > budget:
+            break
+        kept.append(turn)
+        used += cost
+    kept.reverse()
+    dropped = len(rest) - len(kept)
+
+    upto = len(turns) - RECENT_TURNS
+    if upto > covered and (dropped or used > budget * SUMMARY_TRIGGER):
+        schedule_summary(backend, patient_id, session_id, turns, covered, summary, upto)
+
+    window = "\n".join(part for part in (header, format_conversation([turn for turn, _ in pinned] + kept)) if part)
+    with _lock:
+        _stats["windowed_turns"] += 1
+        _stats["dropped_turns"] += dropped
+        _stats["last_prompt_tokens"] = estimate_tokens(window)
+    return window
+
+
+def window_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats["pending_summaries"] = len(_pending)
+    stats["token_budget"] = CONTEXT_TOKEN_BUDGET
+    stats["recent_turns"] = RECENT_TURNS
+    return stats